@@ -1,66 +1,205 @@
 import os
-import re
 import csv
-import json
 import base64
+import time
 from datetime import datetime
-import matplotlib.pyplot as plt
-from openai import OpenAI
+from pathlib import Path
 from dotenv import load_dotenv
 
+from cost_ledger import BudgetExceeded, CostLedger
+from hedging import HedgePolicy
+from ki67_core import (
+    MODEL, ResponseParseError, calculate_true_index, extract_predicted_index, find_counts_index, get_client,
+)
+from self_consistency import SAMPLE_FIELDS, Samples, SelfConsistency
+from streaming_metrics import RunningMetrics
+from telemetry import Telemetry, metrics_port
+from token_budget import TokenBudget, prompt_key
+from transport import STATS as TRANSPORT
+from work_queue import BUDGET, PARSE, PERMANENT, ContentFiltered, DeadLetters, RetryPolicy, WorkQueue, classify
+
 load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
-if api_key is None:
-    raise ValueError("OPENAI_API_KEY not found in environment.")
 
-client = OpenAI(api_key=api_key)
+STATUS_INTERVAL = float(os.getenv("KI67_STATUS_INTERVAL", "10"))
+HEDGE = HedgePolicy.from_env()
+SAMPLING = SelfConsistency.from_env()
+RETRY = RetryPolicy.from_env()
+# Text-only follow-up for an answer without a Ki-67 value; the image is not sent again
+REASK_PROMPT = 'Your answer has no final Ki-67 index. Reply with only that line: "Ki-67 Index: <value>%".'
+REASK_MAX_TOKENS = 32
+CASCADE = os.getenv("KI67_CASCADE", "0") not in ("", "0")
+if CASCADE:
+    # Classical-CV pre-count; only images it is not confident about go to the VLM
+    from cv_precount import as_response, precount
+# Near-duplicate detection against the image hash index: "flag" or "reuse" (off if unset)
+DEDUP = os.getenv("KI67_DEDUP", "").lower()
+if DEDUP in ("flag", "reuse"):
+    from image_hash import DEFAULT_RADIUS, HashIndex
+
+    DEDUP_RADIUS = int(os.getenv("KI67_DEDUP_RADIUS", DEFAULT_RADIUS))
 
 this_dir = os.path.dirname(__file__)
 with open(os.path.join(this_dir, "system_prompt.txt"), encoding="utf-8") as f:
     SYSTEM_PROMPT = f.read()
 with open(os.path.join(this_dir, "user_prompt.txt"), encoding="utf-8") as f:
     USER_PROMPT = f.read()
+TOKENS = TokenBudget.from_env(MODEL, SYSTEM_PROMPT, USER_PROMPT)
+# Cached predictions are only reused by runs with the same prompts and sampling settings
+PROMPT_KEY = prompt_key(SYSTEM_PROMPT, USER_PROMPT)
+SAMPLING_MODE = SAMPLING.mode if SAMPLING else "greedy"
+_client = None
 
-def extract_predicted_index(text: str) -> float:
-    m = re.search(r"Ki[\s-]?67[^%]*?([0-9]+(?:\.[0-9]+)?)\s*%", text, re.I | re.S)
-    if m:
-        return float(m.group(1))
-    perc = re.findall(r"([0-9]+(?:\.[0-9]+)?)\s*%", text)
-    if perc:
-        return float(perc[-1])
-    raise ValueError("Ki-67 value not found.")
-
-def calculate_true_index(json_path: str) -> float:
-    with open(json_path) as f:
-        data = json.load(f)
-    pos = sum(1 for c in data if c.get("label_id") == 1)
-    neg = sum(1 for c in data if c.get("label_id") == 2)
-    return round((pos / (pos + neg)) * 100, 2) if pos + neg else 0.0
-
-def predict_with_gpt(img_path: str) -> tuple[float, str]:
+def client():
+    """The shared client with the SDK's own retries set by RETRY, so the work queue owns retry policy."""
+    global _client
+    if _client is None:
+        _client = get_client().with_options(max_retries=RETRY.sdk_retries)
+    return _client
+
+def predict_with_gpt(
+    img_path: str, ledger: CostLedger | None = None, telemetry: Telemetry | None = None, answer: str | None = None,
+) -> tuple[float, str, Samples | None]:
+    """Predict one image; with ``answer`` (an earlier answer without a Ki-67 value), only re-ask it."""
     with open(img_path, "rb") as f:
         img_b64 = base64.b64encode(f.read()).decode()
     mime = "jpeg" if img_path.lower().endswith((".jpg", ".jpeg")) else "png"
-    r = client.chat.completions.create(
-        model="gpt-4.1-mini-2025-04-14",
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": USER_PROMPT},
-                    {"type": "image_url", "image_url": {"url": f"data:image/{mime};base64,{img_b64}"}},
+    image = os.path.basename(img_path)
+    telemetry = telemetry or Telemetry()
+
+    def request(n: int = 1, seed_offset: int = 0):
+        attempts = 0
+
+        def send(max_tokens: int):
+            nonlocal attempts
+            attempts += 1
+            if attempts > 1:
+                telemetry.retried(image, MODEL, "truncated", max_tokens=max_tokens)
+            if ledger:
+                ledger.before_request(MODEL)
+            telemetry.request_started(image, MODEL, max_tokens=max_tokens, n=n)
+            start = time.monotonic()
+            try:
+                r = client().chat.completions.create(
+                    model=MODEL,
+                    messages=[
+                        {"role": "system", "content": SYSTEM_PROMPT},
+                        {
+                            "role": "user",
+                            "content": [
+                                {"type": "text", "text": USER_PROMPT},
+                                {"type": "image_url", "image_url": {"url": f"data:image/{mime};base64,{img_b64}"}},
+                            ],
+                        },
+                    ],
+                    # Self-consistency samples above temperature 0; single predictions stay deterministic
+                    temperature=SAMPLING.temperature if SAMPLING else 0,
+                    seed=64 + seed_offset,
+                    max_tokens=max_tokens,
+                    **({"n": n} if n > 1 else {}),
+                )
+            except Exception as e:
+                telemetry.request_failed(image, MODEL, e, time.monotonic() - start)
+                if ledger:
+                    ledger.release()
+                raise
+            latency = time.monotonic() - start
+            cost = ledger.record(image, MODEL, r.usage, latency) if ledger else None
+            telemetry.request_finished(image, MODEL, r, latency, cost, TRANSPORT.last())
+            return r
+
+        # max_tokens learned from past completion lengths; truncated answers are retried larger
+        return TOKENS.call(send)
+
+    def hedged(n: int = 1, seed_offset: int = 0):
+        if not HEDGE:
+            return request(n, seed_offset)
+        before = HEDGE.hedged
+        r = HEDGE.call(lambda: request(n, seed_offset))
+        if HEDGE.hedged > before:
+            telemetry.retried(image, MODEL, "hedge")
+        return r
+
+    def reask(answer: str) -> str:
+        if ledger:
+            ledger.before_request(MODEL)
+        telemetry.retried(image, MODEL, "reask")
+        telemetry.request_started(image, MODEL, max_tokens=REASK_MAX_TOKENS)
+        start = time.monotonic()
+        try:
+            r = client().chat.completions.create(
+                model=MODEL,
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": USER_PROMPT},
+                    {"role": "assistant", "content": answer},
+                    {"role": "user", "content": REASK_PROMPT},
                 ],
-            },
-        ],
-        temperature=0,
-        seed=64,
-        max_tokens=1024,
-    )
-    content = r.choices[0].message.content
-    return extract_predicted_index(content), content
+                temperature=0,
+                seed=64,
+                max_tokens=REASK_MAX_TOKENS,
+            )
+        except Exception as e:
+            telemetry.request_failed(image, MODEL, e, time.monotonic() - start)
+            if ledger:
+                ledger.release()
+            raise
+        latency = time.monotonic() - start
+        cost = ledger.record(image, MODEL, r.usage, latency) if ledger else None
+        telemetry.request_finished(image, MODEL, r, latency, cost, TRANSPORT.last())
+        return r.choices[0].message.content or ""
+
+    if answer is None:
+        if SAMPLING:
+            samples = SAMPLING.predict(hedged)
+            RETRY.reparsed += samples.reparsed
+            return samples.index, samples.as_response(SAMPLING.method), samples
+
+        choice = hedged().choices[0]
+        answer = choice.message.content or ""
+        if choice.finish_reason == "content_filter":
+            raise ContentFiltered(answer)
+        try:
+            return extract_predicted_index(answer), answer, None
+        except ResponseParseError:
+            # The cell counts may still give the index; otherwise ask for the missing line
+            ki = find_counts_index(answer)
+            if ki is not None:
+                RETRY.reparsed += 1
+                return ki, f"{answer.strip()}\nKi-67 Index (from cell counts): {ki:.2f}%", None
+            if not RETRY.reask:
+                raise
+    RETRY.reasked += 1
+    try:
+        followup = reask(answer)
+    except Exception as e:
+        e.answer = answer  # a transient retry re-asks this answer instead of re-sending the image
+        raise
+    content = f"{answer.strip()}\n--- re-ask ---\n{followup.strip()}"
+    return extract_predicted_index(content), content, None
+
+def write_duplicate(path: Path, fname: str, match, reused: bool) -> None:
+    new_file = not path.exists()
+    with path.open("a", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(["image", "duplicate_of", "distance", "model", "predicted", "reused"])
+        predicted = "" if match.predicted is None else f"{match.predicted:.2f}"
+        writer.writerow([fname, match.path, match.distance, match.model, predicted, "yes" if reused else "no"])
+
+def write_samples(path: Path, fname: str, samples: Samples) -> None:
+    new_file = not path.exists()
+    with path.open("a", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(SAMPLE_FIELDS)
+        writer.writerow([
+            fname, len(samples.values), f"{samples.index:.2f}", f"{samples.std:.2f}", f"{samples.spread:.2f}",
+            ";".join(f"{v:.2f}" for v in samples.values), samples.requests, "yes" if samples.native_n else "no",
+            samples.dropped,
+        ])
 
 def main(data_folder: str, out_parent: str | None = None) -> None:
+    client()  # fail fast on a missing API key, before creating the output folder
     timestamp = datetime.now().strftime("%d_%m_%Y_%H_%M_%S")
     parent = Path(out_parent).resolve() if out_parent else Path(this_dir)
     output_dir = parent / f"output_{timestamp}"
@@ -70,59 +209,216 @@ def main(data_folder: str, out_parent: str | None = None) -> None:
     csv_path = output_dir / "ki67_results.csv"
     llm_path = output_dir / "llm_responses.txt"
     plot_path = output_dir / "ki67_pred_vs_true.png"
+    status_path = output_dir / "ki67_status.json"
+    dup_path = output_dir / "ki67_duplicates.csv"
+    samples_path = output_dir / "ki67_samples.csv"
+    ledger = CostLedger.from_env(output_dir / "ki67_ledger.csv", run=output_dir.name)
+    index = HashIndex.from_env(run=output_dir.name) if DEDUP in ("flag", "reuse") else None
+    telemetry = Telemetry(output_dir / "ki67_events.jsonl", run=output_dir.name)
+    dead = DeadLetters(output_dir / "ki67_dead_letter.jsonl", run=output_dir.name)
 
-    trues, preds = [], []
+    cascade_hits = 0
+    duplicates = reused = hashed = 0
     processed = set()
+    resumed = []
+    # Which stage answered each image (vlm, cascade or dedup); CSVs of older runs lack the column
+    with_source = True
 
     if csv_path.exists():
         with csv_path.open() as f:
-            next(f, None)
-            processed = {line.split(",")[0] for line in f if line.strip()}
+            header = next(f, "")
+            with_source = not header.strip() or "source" in header.strip().split(",")
+            for line in f:
+                if line.strip():
+                    row = line.strip().split(",")
+                    processed.add(row[0])
+                    resumed.append(row)
+
+    pending = [
+        fname for fname in sorted(os.listdir(data_folder))
+        if fname.lower().endswith((".jpg", ".jpeg", ".png")) and fname not in processed
+    ]
+    metrics = RunningMetrics(total=len(pending) + len(resumed))
+    by_source: dict[str, RunningMetrics] = {}
+    for row in resumed:
+        try:
+            metrics.resume(float(row[2]), float(row[1]))
+        except (IndexError, ValueError):
+            metrics.record_failure()
+            continue
+        if len(row) > 3:
+            by_source.setdefault(row[3], RunningMetrics()).resume(float(row[2]), float(row[1]))
+
+    telemetry.event("run_start", model=MODEL, dataset=str(Path(data_folder).resolve()),
+                    pending=len(pending), resumed=len(resumed))
+    port = metrics_port()
+    if port:
+        telemetry.gauge("ki67_images_done", lambda: metrics.done, "Images handled in this run, resumed included.")
+        telemetry.gauge("ki67_images_pending", lambda: max(metrics.total - metrics.done, 0), "Images left.")
+        telemetry.gauge("ki67_images_per_second", lambda: metrics.rate, "Throughput of this session.")
+        telemetry.gauge("ki67_running_mae", lambda: metrics.mae, "Running mean absolute error.")
+        telemetry.gauge("ki67_spend_usd", lambda: ledger.spent, "Estimated spend of this run.")
+        telemetry.gauge("ki67_budget_usd", ledger.budget_usd, "KI67_BUDGET_USD, if set.")
+        if ledger.max_rpm:
+            telemetry.gauge("ki67_rpm_saturation", lambda: ledger.window()[0] / ledger.max_rpm,
+                            "Requests over the last minute / KI67_MAX_RPM.")
+        if ledger.max_tpm:
+            telemetry.gauge("ki67_tpm_saturation", lambda: ledger.window()[1] / ledger.max_tpm,
+                            "Tokens over the last minute / KI67_MAX_TPM.")
+        telemetry.serve(port)
+        print(f"Metrics on http://127.0.0.1:{port}/metrics")
 
     with log_path.open("a", encoding="utf-8") as logf, csv_path.open("a", newline="", encoding="utf-8") as csvf:
         writer = csv.writer(csvf)
         if csv_path.stat().st_size == 0:
-            writer.writerow(["image", "predicted", "true"])
+            writer.writerow(["image", "predicted", "true", "source"])
 
-        for fname in sorted(os.listdir(data_folder)):
-            if not fname.lower().endswith((".jpg", ".jpeg", ".png")) or fname in processed:
-                continue
+        # Fresh images in order; transient failures are retried behind them
+        queue = WorkQueue(pending)
+        while (item := queue.pop()) is not None:
+            fname = item.name
             img_path = os.path.join(data_folder, fname)
             json_path = os.path.join(data_folder, os.path.splitext(fname)[0] + ".json")
             if not os.path.isfile(json_path):
                 print(f"JSON missing for {fname}")
+                metrics.record_failure()
+                telemetry.event("image_failed", image=fname, kind="missing_json")
+                telemetry.inc("ki67_images_total", model=MODEL, outcome="failed")
+                dead.add(fname, PERMANENT, "JSON annotation missing")
                 continue
 
             try:
                 true_idx = calculate_true_index(json_path)
-                pred_idx, full_resp = predict_with_gpt(img_path)
+                dup = reuse = None
+                if index is not None:
+                    hashes = index.hashes_for(img_path)
+                # Retries were looked up on their first pass, which found nothing to reuse
+                if index is not None and not item.attempt:
+                    hashed += 1
+                    dup = index.lookup(img_path, *hashes, radius=DEDUP_RADIUS)
+                    if dup and DEDUP == "reuse":
+                        reuse = index.lookup(
+                            img_path, *hashes, radius=DEDUP_RADIUS, model=MODEL, prompt=PROMPT_KEY,
+                            sampling=SAMPLING_MODE,
+                        )
+                    if dup:
+                        duplicates += 1
+                        write_duplicate(dup_path, fname, reuse or dup, reused=reuse is not None)
+
+                pre = precount(img_path) if CASCADE and not reuse else None
+                vlm = False
+                source = "dedup" if reuse else "cascade" if pre and pre.confident else "vlm"
+                if reuse:
+                    pred_idx = reuse.predicted
+                    full_resp = (
+                        "Source: dedup\n"
+                        f"Duplicate of: {reuse.path} (Hamming distance {reuse.distance})\n"
+                        f"Ki-67 Index: {pred_idx:.2f}%"
+                    )
+                    reused += 1
+                elif pre and pre.confident:
+                    pred_idx, full_resp = pre.ki67, as_response(pre)
+                    cascade_hits += 1
+                else:
+                    pred_idx, full_resp, samples = predict_with_gpt(img_path, ledger, telemetry, item.answer)
+                    if samples:
+                        write_samples(samples_path, fname, samples)
+                    vlm = True
+
+                if index is not None and (vlm or img_path not in index):
+                    # Only VLM answers are reused later; other images are indexed by hash alone
+                    if vlm:
+                        index.add(
+                            img_path, *hashes, model=MODEL, predicted=pred_idx, prompt=PROMPT_KEY,
+                            sampling=SAMPLING_MODE,
+                        )
+                    else:
+                        index.add(img_path, *hashes)
 
                 with llm_path.open("a", encoding="utf-8") as respf:
                     respf.write(f"\n===== {fname} =====\n{full_resp.strip()}\n")
 
                 logf.write(f"{fname},{pred_idx:.2f},{true_idx:.2f}\n")
-                writer.writerow([fname, f"{pred_idx:.2f}", f"{true_idx:.2f}"])
-                trues.append(true_idx)
-                preds.append(pred_idx)
-                print(f"{fname}: predicted {pred_idx:.2f}  true {true_idx:.2f}")
+                writer.writerow([fname, f"{pred_idx:.2f}", f"{true_idx:.2f}", *([source] if with_source else [])])
+                metrics.update(true_idx, pred_idx)
+                by_source.setdefault(source, RunningMetrics()).update(true_idx, pred_idx)
+                telemetry.event("image_done", image=fname, source=source, predicted=pred_idx, true=true_idx)
+                telemetry.inc("ki67_images_total", model=MODEL, outcome=source)
+                if item.attempt:
+                    RETRY.recovered += 1
+                print(f"{fname}: predicted {pred_idx:.2f}  true {true_idx:.2f}  | {metrics.progress_line()}")
+            except BudgetExceeded as e:
+                # The current image and everything still queued, retries included, is recorded
+                left = [item, *queue.drain()]
+                for i in left:
+                    dead.add(i.name, BUDGET, str(e), attempts=i.attempt, answer=i.answer)
+                telemetry.event("budget_stop", image=fname, message=str(e), left=len(left),
+                                retries_left=sum(1 for i in left if i.attempt))
+                print(
+                    f"Stopping before {fname}: {e}  | {len(left)} images not sent "
+                    f"({sum(1 for i in left if i.attempt)} awaiting a retry), listed in {dead.path.name}"
+                )
+                break
             except Exception as e:
-                print(f"Error on {fname}: {e}")
-
-    if trues and preds:
-        plt.figure(figsize=(6, 6))
-        plt.scatter(trues, preds, marker="x")
-        plt.plot([0, 100], [0, 100], color="red", linewidth=1)
-        plt.xlabel("True Ki-67 (%)")
-        plt.ylabel("Predicted Ki-67 (%)")
-        plt.title("Ki-67 Predicted vs True")
-        plt.tight_layout()
-        plt.savefig(plot_path)
-        plt.close()
+                retry_class = classify(e)
+                if RETRY.should_retry(item, retry_class):
+                    delay = RETRY.delay(item, e)
+                    telemetry.retried(fname, MODEL, "transient", attempt=item.attempt + 1, error=type(e).__name__)
+                    print(
+                        f"Transient error on {fname}: {e}  | retry {item.attempt + 1}/{RETRY.max_retries} "
+                        f"queued behind the fresh images (backoff {delay:.1f}s)"
+                    )
+                    item.answer = getattr(e, "answer", None)
+                    queue.retry(item, delay)
+                else:
+                    metrics.record_failure()
+                    dead.add(fname, retry_class, e, attempts=item.attempt + 1)
+                    kind = "parse_failure" if retry_class == PARSE else "failed"
+                    telemetry.event(
+                        "image_failed", image=fname, kind=kind, retry_class=retry_class, attempts=item.attempt + 1,
+                        error=type(e).__name__, message=str(e)[:300],
+                    )
+                    telemetry.inc("ki67_images_total", model=MODEL, outcome=kind)
+                    print(f"Error on {fname} ({retry_class}, dead-lettered): {e}  | {metrics.progress_line()}")
+            metrics.write_status(status_path, every=STATUS_INTERVAL)
+
+    metrics.write_status(status_path, force=True)
+    telemetry.event("run_end", **metrics.snapshot(), spent_usd=round(ledger.spent, 6), requests=ledger.requests)
+    telemetry.close()
+    print(f"Spent ${ledger.spent:.4f} on {ledger.requests} requests ({ledger.tokens} tokens)")
+    if HEDGE:
+        print(f"Hedging: {HEDGE.summary()}")
+    if SAMPLING:
+        print(f"Self-consistency: {SAMPLING.summary()}")
+    print(f"Completion budget: {TOKENS.summary()}")
+    print(f"HTTP transport: {TRANSPORT.summary()}")
+    print(f"Retries: {RETRY.summary(dead.count)}")
+    if dead.count:
+        print(f"Failed images and their raw responses: {dead.path}")
+    if CASCADE:
+        print(f"Cascade: {cascade_hits} images answered by the CV pre-count without a VLM call")
+    if len(by_source) > 1 or CASCADE:
+        # Cascade and dedup answers are not VLM answers: keep their error apart from the model's
+        for name, m in sorted(by_source.items()):
+            print(f"  {name:<8} {m.n:>5} images  MAE {m.mae:.2f}  RMSE {m.rmse:.2f}  R² {m.r2:.3f}")
+    if index is not None and hashed:
+        print(
+            f"Dedup: {duplicates}/{hashed} images ({duplicates / hashed:.1%}) near-duplicate of an indexed image, "
+            f"{reused} answered from a cached prediction without a VLM call"
+        )
+
+    if metrics.n:
+        from plotting import plot_panels
+
+        # Drawn from the full CSV, so resumed rows are included
+        plot_panels(
+            [csv_path], plot_path, titles=["Ki-67 Predicted vs True"],
+            xlabel="True Ki-67 (%)", ylabel="Predicted Ki-67 (%)", line_color="red", panel_size=6,
+        )
 
     print(f"Results saved in {output_dir}") 
 
 if __name__ == "__main__":
-    from pathlib import Path
     import sys
 
     if len(sys.argv) not in (2, 3):
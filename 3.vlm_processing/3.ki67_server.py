@@ -0,0 +1,218 @@
+import hashlib
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from hedging import HedgePolicy
+from ki67_core import (
+    IMAGE_EXTENSIONS, MODEL, build_messages, extract_cell_counts_and_index, get_client, image_data_url,
+    load_prompts,
+)
+from telemetry import Telemetry, metrics_reply
+from token_budget import TokenBudget
+from transport import STATS as TRANSPORT
+
+load_dotenv()
+
+DEFAULT_ADDRESS = "8767"
+CACHE_SIZE = int(os.getenv("KI67_SERVER_CACHE", "256"))
+# Leading bytes of the accepted formats, checked before any API call is made
+IMAGE_SIGNATURES = (b"\xff\xd8\xff", b"\x89PNG\r\n\x1a\n")
+
+
+class PredictionService:
+    """Warm client, prompts and result cache; concurrent identical requests share one API call."""
+
+    def __init__(self):
+        self.client = get_client()
+        self.system_prompt, self.user_prompt = load_prompts()
+        self.hedge = HedgePolicy.from_env()
+        self.tokens = TokenBudget.from_env(MODEL, self.system_prompt, self.user_prompt)
+        self.telemetry = Telemetry(os.getenv("KI67_EVENT_LOG"), run="server")
+        self.telemetry.gauge("ki67_max_tokens", self.tokens.limit, "Current learned max_tokens.")
+        self._lock = threading.Lock()
+        self._inflight: dict[str, Future] = {}
+        self._cache: OrderedDict[str, dict] = OrderedDict()
+
+    def warm_up(self) -> None:
+        """Open the TLS connection before the first real request."""
+        try:
+            self.client.models.retrieve(MODEL, timeout=10)
+        except Exception as e:
+            print(f"Warm-up request failed (continuing): {e}")
+
+    def predict(self, img_bytes: bytes, name: str) -> dict:
+        key = hashlib.sha256(img_bytes).hexdigest()
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.telemetry.inc("ki67_images_total", model=MODEL, outcome="cached")
+                return {**self._cache[key], "image": name, "cached": True}
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+
+        if not owner:
+            self.telemetry.inc("ki67_images_total", model=MODEL, outcome="coalesced")
+            return {**future.result(), "image": name, "coalesced": True}
+
+        try:
+            result = self._call(img_bytes, name)
+            future.set_result(result)
+        except Exception as e:
+            self.telemetry.inc("ki67_images_total", model=MODEL, outcome="failed")
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+        with self._lock:
+            self._cache[key] = result
+            if len(self._cache) > CACHE_SIZE:
+                self._cache.popitem(last=False)
+        self.telemetry.inc("ki67_images_total", model=MODEL, outcome="vlm")
+        return {**result, "image": name}
+
+    def _call(self, img_bytes: bytes, name: str) -> dict:
+        messages = build_messages(self.system_prompt, self.user_prompt, image_data_url(img_bytes, Path(name).suffix))
+        telemetry = self.telemetry
+        attempts = 0
+
+        def send(max_tokens: int):
+            nonlocal attempts
+            attempts += 1
+            if attempts > 1:
+                telemetry.retried(name, MODEL, "truncated", max_tokens=max_tokens)
+            telemetry.request_started(name, MODEL, max_tokens=max_tokens)
+            sent = time.monotonic()
+            try:
+                r = self.client.chat.completions.create(
+                    model=MODEL, messages=messages, temperature=0, seed=64, max_tokens=max_tokens,
+                )
+            except Exception as e:
+                telemetry.request_failed(name, MODEL, e, time.monotonic() - sent)
+                raise
+            telemetry.request_finished(name, MODEL, r, time.monotonic() - sent, connection=TRANSPORT.last())
+            return r
+
+        def request():
+            return self.tokens.call(send)
+
+        start = time.monotonic()
+        if self.hedge:
+            hedged = self.hedge.hedged
+            r = self.hedge.call(request)
+            if self.hedge.hedged > hedged:
+                telemetry.retried(name, MODEL, "hedge")
+        else:
+            r = request()
+        content = r.choices[0].message.content
+        pos, neg, ki = extract_cell_counts_and_index(content)
+        return {
+            "positive": pos,
+            "negative": neg,
+            "ki67": ki,
+            "content": content,
+            "prompt_tokens": r.usage.prompt_tokens,
+            "completion_tokens": r.usage.completion_tokens,
+            "total_tokens": r.usage.total_tokens,
+            "elapsed": round(time.monotonic() - start, 3),
+        }
+
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    service: PredictionService
+
+    def address_string(self) -> str:
+        # Unix-socket peers have no (host, port) tuple
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def _reply(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._reply(200, {"status": "ok", "model": MODEL, "max_tokens": self.service.tokens.limit()})
+        elif self.path == "/metrics":
+            metrics_reply(self, self.service.telemetry)
+        else:
+            self._reply(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/predict":
+            self._reply(404, {"error": "not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            if length <= 0:
+                raise ValueError("Empty request body: send image bytes or {\"path\": ...}.")
+            body = self.rfile.read(length)
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                # {"path": "..."}: the image is read from the server's file system
+                img_path = Path(json.loads(body)["path"])
+                if img_path.suffix.lower() not in IMAGE_EXTENSIONS or not img_path.is_file():
+                    raise ValueError("Provide a valid .jpg, .jpeg or .png file.")
+                img_bytes, name = img_path.read_bytes(), img_path.name
+            else:
+                # Raw image bytes; the file name (for the MIME type) comes in a header
+                img_bytes, name = body, self.headers.get("X-Image-Name", "image.jpg")
+            if not img_bytes.startswith(IMAGE_SIGNATURES):
+                raise ValueError("The image is not a JPEG or PNG file.")
+            self._reply(200, self.service.predict(img_bytes, name))
+        except (ValueError, KeyError) as e:
+            self._reply(400, {"error": str(e)})
+        except Exception as e:
+            self._reply(502, {"error": f"{type(e).__name__}: {e}"})
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(address: str) -> None:
+    PredictionHandler.service = PredictionService()
+    PredictionHandler.service.warm_up()
+    if address.isdigit():
+        server = ThreadingHTTPServer(("127.0.0.1", int(address)), PredictionHandler)
+        where = f"http://127.0.0.1:{address}"
+    else:
+        if os.path.exists(address):
+            os.unlink(address)
+        server = ThreadingUnixHTTPServer(address, PredictionHandler)
+        where = f"unix:{address}"
+    print(f"Ki-67 prediction service ({MODEL}) listening on {where}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        PredictionHandler.service.telemetry.close()
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2:
+        print(
+            "Usage:\n"
+            "  python 3.vlm_processing/3.ki67_server.py [<port> | <unix_socket_path>]\n"
+            "Example:\n"
+            "  python 3.vlm_processing/3.ki67_server.py 8767"
+        )
+        sys.exit(1)
+
+    serve(sys.argv[1] if len(sys.argv) == 2 else os.getenv("KI67_SERVER", DEFAULT_ADDRESS))
@@ -0,0 +1,74 @@
+import http.client
+import json
+import os
+import socket
+import sys
+from pathlib import Path
+
+# Deliberately stdlib-only: the client has to start fast when called once per slide image.
+DEFAULT_ADDRESS = "8767"
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def request_prediction(img_path: Path, address: str, timeout: float = 300) -> dict:
+    if address.isdigit():
+        conn = http.client.HTTPConnection("127.0.0.1", int(address), timeout=timeout)
+    else:
+        conn = UnixHTTPConnection(address, timeout)
+    mime = "jpeg" if img_path.suffix.lower() in {".jpg", ".jpeg"} else "png"
+    conn.request(
+        "POST", "/predict", body=img_path.read_bytes(),
+        headers={"Content-Type": f"image/{mime}", "X-Image-Name": img_path.name},
+    )
+    resp = conn.getresponse()
+    payload = json.loads(resp.read())
+    conn.close()
+    if resp.status != 200:
+        raise RuntimeError(payload.get("error", f"HTTP {resp.status}"))
+    return payload
+
+
+def predict_ki67(img_path: Path, address: str) -> None:
+    if not img_path.is_file() or img_path.suffix.lower() not in {".jpg", ".jpeg", ".png"}:
+        raise ValueError("Provide a valid .jpg, .jpeg or .png file.")
+
+    r = request_prediction(img_path, address)
+
+    # Same output as 4.utils/predict_cells.py
+    print("=" * 60)
+    print(f"Image: {img_path.name}")
+    print(r["content"].strip())
+    print()
+    print(f"Immunopositive cells : {r['positive']}")
+    print(f"Immunonegative cells : {r['negative']}")
+    print(f"Ki-67 Index          : {r['ki67']:.2f}%")
+    print()
+    print("TOKEN USAGE")
+    print(f"  Prompt     : {r['prompt_tokens']}")
+    print(f"  Completion : {r['completion_tokens']}")
+    print(f"  Total      : {r['total_tokens']}")
+    print("=" * 60)
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        print(
+            "Usage:\n"
+            "  python 3.vlm_processing/4.ki67_client.py <image_path> [<port> | <unix_socket_path>]\n"
+            "Example:\n"
+            "  python 3.vlm_processing/4.ki67_client.py "
+            "1.data_access/data_sample/3.data_processed/8.jpg"
+        )
+        sys.exit(1)
+
+    server = sys.argv[2] if len(sys.argv) == 3 else os.getenv("KI67_SERVER", DEFAULT_ADDRESS)
+    predict_ki67(Path(sys.argv[1]).resolve(), server)
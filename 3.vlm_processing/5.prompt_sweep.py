@@ -0,0 +1,305 @@
+import csv
+import math
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from statistics import NormalDist
+
+import numpy as np
+from dotenv import load_dotenv
+
+from cost_ledger import BudgetExceeded, CostLedger
+from ki67_core import (
+    IMAGE_EXTENSIONS, MODEL, ResponseParseError, build_messages, calculate_true_index, extract_predicted_index,
+    get_client, image_data_url, load_prompts,
+)
+from token_budget import TokenBudget
+from transport import STATS as TRANSPORT
+
+load_dotenv()
+
+BATCH = int(os.getenv("KI67_SWEEP_BATCH", "20"))  # images per round; variants are compared after each
+MIN_PAIRS = int(os.getenv("KI67_SWEEP_MIN", "30"))  # paired images before a variant can be dropped
+ALPHA = float(os.getenv("KI67_SWEEP_ALPHA", "0.05"))
+# MAE points below which two variants count as equally good (0 keeps both until the end)
+INDIFFERENCE = float(os.getenv("KI67_SWEEP_INDIFFERENCE", "0.5"))
+WORKERS = int(os.getenv("KI67_SWEEP_WORKERS", "8"))
+SHUFFLE_SEED = 64
+
+this_dir = os.path.dirname(__file__)
+_calls_lock = threading.Lock()
+
+
+def worst_error(true: np.ndarray) -> np.ndarray:
+    """The largest |error| a Ki-67 answer in [0, 100] can have: the score of an answer without a value."""
+    return np.maximum(true, 100 - true)
+
+
+class Variant:
+    """One prompt pair (``system_prompt.txt`` and ``user_prompt.txt`` in a folder) and its predictions.
+
+    Answers without a Ki-67 value count as the worst possible answer, so a prompt cannot
+    win the race by failing to answer on its hard images. Requests that failed for other
+    reasons (timeouts, API errors) say nothing about the prompt and are left out.
+    """
+
+    def __init__(self, label: str, prompt_dir: Path, n_images: int):
+        self.label = label
+        self.dir = prompt_dir
+        self.system, self.user = load_prompts(prompt_dir)
+        self.tokens = TokenBudget.from_env(MODEL, self.system, self.user)
+        self.pred = np.full(n_images, np.nan)
+        self.unparsed = np.zeros(n_images, dtype=bool)
+        self.calls = 0
+        self.failed = 0
+        self.active = True
+        self.stopped = ""  # why the variant left the race
+
+    def abs_err(self, true: np.ndarray) -> np.ndarray:
+        """|error| per image, the worst error for answers without a value and NaN where not answered."""
+        return np.where(self.unparsed, worst_error(true), np.abs(self.pred - true))
+
+    def metrics(self, true: np.ndarray) -> dict:
+        """``score`` is the MAE with answers without a value at the worst error; MAE, RMSE and R² skip them."""
+        abs_err = self.abs_err(true)
+        scored = ~np.isnan(abs_err)
+        done = ~np.isnan(self.pred)
+        m = {
+            "images": int(scored.sum()),
+            "unparsed": int(self.unparsed.sum()),
+            "score": float(abs_err[scored].mean()) if scored.any() else math.nan,
+            "mae": math.nan,
+            "rmse": math.nan,
+            "r2": math.nan,
+        }
+        if done.any():
+            err = self.pred[done] - true[done]
+            ss_tot = float(np.sum((true[done] - true[done].mean()) ** 2))
+            m["mae"] = float(np.mean(np.abs(err)))
+            m["rmse"] = float(np.sqrt(np.mean(err ** 2)))
+            m["r2"] = 1 - float(np.sum(err ** 2)) / ss_tot if ss_tot else math.nan
+        return m
+
+
+def labels_for(dirs: list[Path]) -> list[str]:
+    labels = [d.name for d in dirs]
+    if len(set(labels)) < len(labels):
+        labels = [f"{i + 1}.{name}" for i, name in enumerate(labels)]
+    return labels
+
+
+def paired_interval(a: Variant, b: Variant, true: np.ndarray, z: float) -> tuple[int, float, float, float]:
+    """(pairs, mean, low, high) of |error of a| - |error of b| over the images both answered.
+
+    An answer without a Ki-67 value counts as the worst possible error.
+    """
+    err_a, err_b = a.abs_err(true), b.abs_err(true)
+    both = ~np.isnan(err_a) & ~np.isnan(err_b)
+    n = int(both.sum())
+    if n < 2:
+        return n, math.nan, -math.inf, math.inf
+    d = err_a[both] - err_b[both]
+    mean = float(d.mean())
+    half = z * float(d.std(ddof=1)) / math.sqrt(n)
+    return n, mean, mean - half, mean + half
+
+
+def race(variants: list[Variant], true: np.ndarray, z: float, images_done: int) -> list[str]:
+    """Drop the active variants that another active variant makes unnecessary.
+
+    A variant is dropped when its paired MAE is clearly above another's (the interval of the
+    difference is above 0), or when it is not better and the interval shows it is within
+    INDIFFERENCE points of the other. Decisions are taken on one snapshot, so the order of the
+    variants does not matter, and a tie keeps the first variant. ``z`` is Bonferroni-corrected
+    over all looks and ordered pairs, so the chance of ever wrongly dropping a variant stays
+    below ALPHA.
+    """
+    active = [v for v in variants if v.active]
+    dropped = []
+    for v in active:
+        for w in active:
+            if w is v:
+                continue
+            n, mean, low, high = paired_interval(v, w, true, z)
+            if n < MIN_PAIRS:
+                continue
+            if low > 0:
+                why = "worse than"
+            elif high < INDIFFERENCE and (mean > 0 or (mean == 0 and active.index(v) > active.index(w))):
+                why = "no better than"
+            else:
+                continue
+            v.stopped = (
+                f"dropped after {images_done} images, {why} {w.label}: MAE {mean:+.2f} "
+                f"(interval {low:+.2f} to {high:+.2f}, {n} pairs)"
+            )
+            dropped.append(v)
+            break
+    for v in dropped:
+        v.active = False
+    return [v.stopped for v in dropped]
+
+
+def predict(variant: Variant, fname: str, data_url: str, ledger: CostLedger) -> tuple[float, str]:
+    messages = build_messages(variant.system, variant.user, data_url)
+
+    def send(max_tokens: int):
+        ledger.before_request(MODEL)
+        with _calls_lock:
+            variant.calls += 1
+        start = time.monotonic()
+        r = get_client().chat.completions.create(
+            model=MODEL, messages=messages, temperature=0, seed=64, max_tokens=max_tokens,
+        )
+        ledger.record(fname, MODEL, r.usage, time.monotonic() - start)
+        return r
+
+    content = variant.tokens.call(send).choices[0].message.content
+    return extract_predicted_index(content), content
+
+
+def sweep(data_folder: str, prompt_dirs: list[str]) -> None:
+    get_client()  # fail fast on a missing API key, before creating the output folder
+    dirs = [Path(d).resolve() for d in prompt_dirs]
+    for d in dirs:
+        if not (d / "system_prompt.txt").is_file() or not (d / "user_prompt.txt").is_file():
+            sys.exit(f"{d} needs a system_prompt.txt and a user_prompt.txt")
+
+    data = Path(data_folder)
+    images, truth = [], []
+    for p in sorted(data.iterdir()):
+        if p.suffix.lower() in IMAGE_EXTENSIONS and p.with_suffix(".json").is_file():
+            images.append(p)
+            truth.append(calculate_true_index(p.with_suffix(".json")))
+    if not images:
+        sys.exit(f"No images with JSON annotations in {data}")
+    # A shuffled order keeps every early round representative of the whole dataset
+    order = list(range(len(images)))
+    random.Random(SHUFFLE_SEED).shuffle(order)
+    true = np.array(truth)
+
+    variants = [Variant(label, d, len(images)) for label, d in zip(labels_for(dirs), dirs)]
+    looks = max(1, math.ceil(len(images) / BATCH))
+    pairs = max(1, len(variants) * (len(variants) - 1))
+    z = NormalDist().inv_cdf(1 - ALPHA / (looks * pairs))
+
+    timestamp = datetime.now().strftime("%d_%m_%Y_%H_%M_%S")
+    parent = Path(os.getenv("KI67_SWEEP_OUTPUT") or this_dir).resolve()
+    output_dir = parent / f"sweep_{timestamp}"
+    output_dir.mkdir(parents=True, exist_ok=True)
+    ledger = CostLedger.from_env(output_dir / "ki67_ledger.csv", run=output_dir.name)
+
+    print(
+        f"Sweeping {len(variants)} prompt variants over {len(images)} images "
+        f"(rounds of {BATCH}, alpha {ALPHA}, indifference {INDIFFERENCE} MAE points)"
+    )
+    start = time.perf_counter()
+    done = 0
+    stop_reason = "dataset exhausted"
+    with (
+        (output_dir / "sweep_predictions.csv").open("w", newline="", encoding="utf-8") as predf,
+        (output_dir / "llm_responses.txt").open("w", encoding="utf-8") as respf,
+        ThreadPoolExecutor(max_workers=WORKERS) as pool,
+    ):
+        writer = csv.writer(predf)
+        writer.writerow(["image", "true", "variant", "predicted"])
+        for first in range(0, len(order), BATCH):
+            active = [v for v in variants if v.active]
+            if len(active) == 1:
+                stop_reason = f"only {active[0].label} left"
+                break
+            batch = order[first : first + BATCH]
+            # Each image is read and encoded once for all variants
+            urls = {i: image_data_url(images[i].read_bytes(), images[i].suffix) for i in batch}
+            jobs = [(v, i) for i in batch for v in active]
+            futures = [pool.submit(predict, v, images[i].name, urls[i], ledger) for v, i in jobs]
+
+            budget_hit = None
+            for (v, i), future in zip(jobs, futures):
+                try:
+                    pred, content = future.result()
+                except BudgetExceeded as e:
+                    budget_hit = e
+                    continue
+                except ResponseParseError as e:
+                    v.unparsed[i] = True
+                    writer.writerow([images[i].name, f"{true[i]:.2f}", v.label, ""])
+                    respf.write(f"\n===== {v.label}: {images[i].name} =====\n{e.text.strip()}\n")
+                    continue
+                except Exception as e:
+                    v.failed += 1
+                    print(f"Error on {images[i].name} ({v.label}): {e}")
+                    continue
+                v.pred[i] = pred
+                writer.writerow([images[i].name, f"{true[i]:.2f}", v.label, f"{pred:.2f}"])
+                respf.write(f"\n===== {v.label}: {images[i].name} =====\n{content.strip()}\n")
+            predf.flush()
+            done += len(batch)
+
+            for message in race(variants, true, z, done):
+                print(f"  {message}")
+            maes = "  ".join(
+                f"{v.label} {v.metrics(true)['score']:.2f}" + ("" if v.active else " (out)") for v in variants
+            )
+            print(f"[{done}/{len(images)}] MAE (no value = worst error)  {maes}")
+            if budget_hit:
+                stop_reason = str(budget_hit)
+                break
+
+    # No best when nothing was answered (e.g. the budget ran out in the first round)
+    scored = [v for v in variants if v.active and not math.isnan(v.metrics(true)["score"])]
+    best = min(scored, key=lambda v: v.metrics(true)["score"]) if scored else None
+    full_calls = len(variants) * len(images)
+    total_calls = sum(v.calls for v in variants)
+
+    with (output_dir / "sweep_summary.csv").open("w", newline="", encoding="utf-8") as f:
+        summary = csv.writer(f)
+        summary.writerow([
+            "variant", "prompt_dir", "status", "images", "calls", "failed", "unparsed", "score", "mae", "rmse", "r2",
+            "note",
+        ])
+        print(f"\nStopped: {stop_reason} ({time.perf_counter() - start:.1f} s)\n")
+        print(
+            f"{'variant':<24} {'status':<9} {'images':>6} {'calls':>6} {'failed':>6} {'no value':>8} "
+            f"{'score':>7} {'MAE':>7} {'RMSE':>7} {'R²':>7}"
+        )
+        for v in variants:
+            m = v.metrics(true)
+            status = "best" if v is best else ("running" if v.active else "dropped")
+            summary.writerow([
+                v.label, str(v.dir), status, m["images"], v.calls, v.failed, m["unparsed"],
+                f"{m['score']:.4f}", f"{m['mae']:.4f}", f"{m['rmse']:.4f}", f"{m['r2']:.4f}", v.stopped,
+            ])
+            print(
+                f"{v.label:<24} {status:<9} {m['images']:>6} {v.calls:>6} {v.failed:>6} {m['unparsed']:>8} "
+                f"{m['score']:>7.2f} {m['mae']:>7.2f} {m['rmse']:>7.2f} {m['r2']:>7.3f}"
+            )
+            if v.stopped:
+                print(f"    {v.stopped}")
+
+    print(
+        f"\nAPI calls: {total_calls} instead of {full_calls} for a full run per variant "
+        f"({full_calls / max(total_calls, 1):.1f}x fewer)"
+    )
+    print(f"Spent ${ledger.spent:.4f} on {ledger.requests} requests ({ledger.tokens} tokens)")
+    print(f"HTTP transport: {TRANSPORT.summary()}")
+    print(f"Results saved in {output_dir}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 4:
+        print(
+            "Usage:\n"
+            "  python 3.vlm_processing/5.prompt_sweep.py <processed_dataset> <prompt_dir> <prompt_dir> [...]\n"
+            "Example:\n"
+            "  python 3.vlm_processing/5.prompt_sweep.py 1.data_access/data_sample/3.data_processed "
+            "3.vlm_processing prompt_variants/short_answer"
+        )
+        sys.exit(1)
+
+    sweep(sys.argv[1], sys.argv[2:])
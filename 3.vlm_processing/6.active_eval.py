@@ -0,0 +1,166 @@
+import csv
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from statistics import NormalDist
+
+from dotenv import load_dotenv
+
+from cost_ledger import BudgetExceeded, CostLedger
+from ki67_core import MODEL, build_messages, extract_predicted_index, get_client, image_data_url, load_prompts
+from stratified_sampling import StratifiedSampler, load_annotations
+from token_budget import TokenBudget
+from transport import STATS as TRANSPORT
+
+load_dotenv()
+
+# Targets are interval half-widths: stop once MAE is known to ± MAE_CI points and R² to ± R2_CI
+MAE_CI = float(os.getenv("KI67_ACTIVE_MAE_CI", "1.0"))
+R2_CI = float(os.getenv("KI67_ACTIVE_R2_CI", "0.05"))
+CONFIDENCE = float(os.getenv("KI67_ACTIVE_CONFIDENCE", "0.95"))
+PILOT = int(os.getenv("KI67_ACTIVE_PILOT", "3"))  # images per stratum in the first round
+BATCH = int(os.getenv("KI67_ACTIVE_BATCH", "20"))  # images per later round
+DENSITY_LEVELS = int(os.getenv("KI67_ACTIVE_DENSITY_LEVELS", "3"))
+MAX_IMAGES = int(os.getenv("KI67_ACTIVE_MAX", "0"))  # 0: no cap besides the dataset
+WORKERS = int(os.getenv("KI67_ACTIVE_WORKERS", "8"))
+SHUFFLE_SEED = 64
+
+this_dir = os.path.dirname(__file__)
+SYSTEM_PROMPT, USER_PROMPT = load_prompts()
+TOKENS = TokenBudget.from_env(MODEL, SYSTEM_PROMPT, USER_PROMPT)
+
+
+def predict(img_path: Path, ledger: CostLedger) -> tuple[float, str]:
+    messages = build_messages(SYSTEM_PROMPT, USER_PROMPT, image_data_url(img_path.read_bytes(), img_path.suffix))
+
+    def send(max_tokens: int):
+        ledger.before_request(MODEL)
+        start = time.monotonic()
+        r = get_client().chat.completions.create(
+            model=MODEL, messages=messages, temperature=0, seed=64, max_tokens=max_tokens,
+        )
+        ledger.record(img_path.name, MODEL, r.usage, time.monotonic() - start)
+        return r
+
+    content = TOKENS.call(send).choices[0].message.content
+    return extract_predicted_index(content), content
+
+
+def active_eval(data_folder: str, out_parent: str | None = None) -> None:
+    get_client()  # fail fast on a missing API key, before creating the output folder
+    images, true, cells = load_annotations(Path(data_folder))
+    if not images:
+        sys.exit(f"No images with JSON annotations in {data_folder}")
+    sampler = StratifiedSampler(true, cells, DENSITY_LEVELS, SHUFFLE_SEED)
+    z = NormalDist().inv_cdf(0.5 + CONFIDENCE / 2)
+    cap = MAX_IMAGES or len(images)
+
+    timestamp = datetime.now().strftime("%d_%m_%Y_%H_%M_%S")
+    parent = Path(out_parent).resolve() if out_parent else Path(this_dir)
+    output_dir = parent / f"active_{timestamp}"
+    output_dir.mkdir(parents=True, exist_ok=True)
+    ledger = CostLedger.from_env(output_dir / "ki67_ledger.csv", run=output_dir.name)
+
+    print(
+        f"Active evaluation of {len(images)} images in {len(sampler.strata)} strata "
+        f"(Ki-67 bin x cell density), target ±{MAE_CI:g} MAE and ±{R2_CI:g} R² at {CONFIDENCE:.0%}"
+    )
+    start = time.perf_counter()
+    taken = failed = 0
+    stop_reason = "dataset exhausted"
+    est = sampler.estimate(z)
+    with (
+        (output_dir / "active_predictions.csv").open("w", newline="", encoding="utf-8") as predf,
+        (output_dir / "active_rounds.csv").open("w", newline="", encoding="utf-8") as roundf,
+        (output_dir / "llm_responses.txt").open("w", encoding="utf-8") as respf,
+        ThreadPoolExecutor(max_workers=WORKERS) as pool,
+    ):
+        writer = csv.writer(predf)
+        writer.writerow(["image", "true", "predicted", "stratum", "round"])
+        rounds = csv.writer(roundf)
+        rounds.writerow(["round", "images", "failed", "mae", "mae_half", "rmse", "r2", "r2_half"])
+        round_no = 0
+        while True:
+            round_no += 1
+            size = min(BATCH, cap - taken)
+            batch = sampler.pilot(PILOT) if round_no == 1 else sampler.draw(size)
+            batch = batch[: cap - taken]
+            taken += len(batch)
+            futures = [pool.submit(predict, images[i], ledger) for i in batch]
+
+            budget_hit = None
+            for i, future in zip(batch, futures):
+                try:
+                    pred, content = future.result()
+                except BudgetExceeded as e:
+                    budget_hit = e
+                    continue
+                except Exception as e:
+                    failed += 1
+                    print(f"Error on {images[i].name}: {e}")
+                    continue
+                sampler.add(i, pred)
+                stratum = sampler.strata[sampler.stratum_of[i]].name
+                writer.writerow([images[i].name, f"{true[i]:.2f}", f"{pred:.2f}", stratum, round_no])
+                respf.write(f"\n===== {images[i].name} =====\n{content.strip()}\n")
+            predf.flush()
+
+            est = sampler.estimate(z)
+            rounds.writerow([
+                round_no, est.images, failed, f"{est.mae:.4f}", f"{est.mae_half:.4f}",
+                f"{est.mse ** 0.5:.4f}", f"{est.r2:.4f}", f"{est.r2_half:.4f}",
+            ])
+            roundf.flush()
+            print(
+                f"[round {round_no}: {est.images}/{len(images)} images] "
+                f"MAE {est.mae:.2f} ± {est.mae_half:.2f}  R² {est.r2:.3f} ± {est.r2_half:.3f}"
+            )
+            if budget_hit:
+                stop_reason = str(budget_hit)
+                break
+            if est.mae_half <= MAE_CI and est.r2_half <= R2_CI:
+                stop_reason = "target interval reached"
+                break
+            if sampler.exhausted:
+                break
+            if taken >= cap:
+                stop_reason = f"KI67_ACTIVE_MAX={MAX_IMAGES} images reached"
+                break
+
+    rmse_low, rmse_high = est.rmse_interval
+    print(f"\nStopped: {stop_reason} ({time.perf_counter() - start:.1f} s)\n")
+    print(f"Estimated full-dataset metrics ({CONFIDENCE:.0%} intervals, {est.images} of {len(images)} images):")
+    print(f"  MAE  : {est.mae:.4f}  ({est.mae - est.mae_half:.4f} to {est.mae + est.mae_half:.4f})")
+    print(f"  RMSE : {est.mse ** 0.5:.4f}  ({rmse_low:.4f} to {rmse_high:.4f})")
+    print(f"  R²   : {est.r2:.4f}  ({est.r2 - est.r2_half:.4f} to {est.r2 + est.r2_half:.4f})")
+
+    print(f"\n{'stratum':<18} {'images':>7} {'evaluated':>9} {'MAE':>7}")
+    for s in sampler.strata:
+        mae = f"{sum(s.abs_err) / len(s.abs_err):>7.2f}" if s.abs_err else f"{'-':>7}"
+        print(f"{s.name:<18} {s.size:>7} {len(s.abs_err):>9} {mae}")
+
+    print(
+        f"\nImages evaluated: {taken} instead of {len(images)} for a full run "
+        f"({len(images) / max(taken, 1):.1f}x fewer, {failed} failed)"
+    )
+    print(f"Spent ${ledger.spent:.4f} on {ledger.requests} requests ({ledger.tokens} tokens)")
+    print(f"HTTP transport: {TRANSPORT.summary()}")
+    print(f"Results saved in {output_dir}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        print(
+            "Usage:\n"
+            "  python 3.vlm_processing/6.active_eval.py <processed_dataset> [<output_parent_dir>]\n"
+            "Example:\n"
+            "  python 3.vlm_processing/6.active_eval.py "
+            "1.data_access/data_sample/3.data_processed "
+            "5.results"
+        )
+        sys.exit(1)
+
+    active_eval(sys.argv[1], sys.argv[2] if len(sys.argv) == 3 else None)
@@ -0,0 +1,197 @@
+import csv
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+
+# USD per 1M tokens: (input, cached input, output).
+# Dated model names resolve through the longest matching prefix.
+DEFAULT_PRICES = {
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1-nano": (0.10, 0.025, 0.40),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4.5-preview": (75.00, 37.50, 150.00),
+}
+
+# Tokens of one image request (prompt, completion) for the cost estimate before any request is recorded:
+# the time-analysis runs used 1.4-1.5k prompt and 47-171 completion tokens
+PRIOR_TOKENS = (1500, 200)
+
+LEDGER_FIELDS = [
+    "timestamp", "run", "image", "model", "prompt_tokens", "cached_tokens",
+    "completion_tokens", "total_tokens", "cost_usd", "latency_s",
+]
+
+
+class BudgetExceeded(RuntimeError):
+    pass
+
+
+def load_prices(path: str | None = None) -> dict[str, tuple[float, float, float]]:
+    """Default price table, updated with a JSON file of {model: [input, cached, output]}."""
+    prices = dict(DEFAULT_PRICES)
+    path = path or os.getenv("KI67_PRICE_TABLE")
+    if path:
+        with open(path, encoding="utf-8") as f:
+            prices.update({k: tuple(v) for k, v in json.load(f).items()})
+    return prices
+
+
+def price_for(model: str, prices: dict) -> tuple[float, float, float]:
+    matches = [k for k in prices if model == k or model.startswith(k + "-")]
+    if not matches:
+        raise KeyError(f"No price configured for model '{model}'.")
+    return prices[max(matches, key=len)]
+
+
+def usage_tokens(usage) -> tuple[int, int, int]:
+    """(prompt, cached, completion) tokens from an OpenAI usage object."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", None) or 0
+    return usage.prompt_tokens, cached, usage.completion_tokens
+
+
+def request_cost(model: str, prompt: int, cached: int, completion: int, prices: dict) -> float:
+    p_in, p_cached, p_out = price_for(model, prices)
+    return ((prompt - cached) * p_in + cached * p_cached + completion * p_out) / 1_000_000
+
+
+class CostLedger:
+    """Per-request token/cost ledger (CSV) with hard budget and rate caps.
+
+    Each request reserves its estimated cost under the lock before it is sent, and ``record``
+    settles the reservation with the real cost, so concurrent workers, sampling threads and
+    hedges cannot all pass the budget check together. The estimate is the mean recorded cost,
+    or PRIOR_TOKENS at the model's price before the first request is recorded.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        run: str,
+        prices: dict | None = None,
+        budget_usd: float | None = None,
+        max_rpm: int | None = None,
+        max_tpm: int | None = None,
+    ):
+        self.path = Path(path)
+        self.run = run
+        self.prices = prices or load_prices()
+        self.budget_usd = budget_usd
+        self.max_rpm = max_rpm
+        self.max_tpm = max_tpm
+        self.spent = 0.0
+        self.requests = 0
+        self.tokens = 0
+        self.reserved = 0.0  # estimated cost of the requests sent but not recorded yet
+        self._reservations: dict[int, float] = {}  # by thread: a request reserves and records on one thread
+        self._window: deque[tuple[float, int]] = deque()  # (time, total tokens) over the last minute
+        self._lock = threading.Lock()  # hedged requests record from worker threads
+
+        # Resuming into an existing ledger keeps counting against the same budget
+        if self.path.is_file():
+            with self.path.open(newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    if row.get("run") == run:
+                        self.spent += float(row["cost_usd"])
+                        self.tokens += int(row["total_tokens"])
+                        self.requests += 1
+        else:
+            with self.path.open("w", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerow(LEDGER_FIELDS)
+
+    @classmethod
+    def from_env(cls, path: Path, run: str) -> "CostLedger":
+        def env(name, cast):
+            value = os.getenv(name)
+            return cast(value) if value else None
+
+        return cls(
+            path,
+            run,
+            budget_usd=env("KI67_BUDGET_USD", float),
+            max_rpm=env("KI67_MAX_RPM", int),
+            max_tpm=env("KI67_MAX_TPM", int),
+        )
+
+    @property
+    def mean_cost(self) -> float:
+        return self.spent / self.requests if self.requests else 0.0
+
+    @property
+    def mean_tokens(self) -> float:
+        return self.tokens / self.requests if self.requests else 0.0
+
+    def window(self) -> tuple[int, int]:
+        """(requests, tokens) recorded over the last minute, as counted against the rate caps."""
+        with self._lock:
+            now = time.monotonic()
+            recent = [t for ts, t in self._window if now - ts < 60]
+        return len(recent), sum(recent)
+
+    def estimate(self, model: str | None = None) -> float:
+        """Expected cost of the next request: the mean so far, or a prior for ``model`` before any."""
+        if self.requests or model is None:
+            return self.mean_cost
+        try:
+            return request_cost(model, PRIOR_TOKENS[0], 0, PRIOR_TOKENS[1], self.prices)
+        except KeyError:
+            return 0.0  # no price: record() raises on the first request anyway
+
+    def before_request(self, model: str | None = None) -> None:
+        """Block until the rate caps allow one more request; raise if it would break the budget.
+
+        The request's estimated cost stays reserved until ``record`` is called on the same thread.
+        """
+        if self.budget_usd is not None:
+            with self._lock:
+                # A reservation left by a request that failed on this thread is released first
+                self.reserved -= self._reservations.pop(threading.get_ident(), 0.0)
+                cost = self.estimate(model)
+                if self.spent + self.reserved + cost > self.budget_usd:
+                    raise BudgetExceeded(
+                        f"Budget of ${self.budget_usd:.4f} reached (spent ${self.spent:.4f}, "
+                        f"${self.reserved:.4f} reserved by requests in flight, next request ~${cost:.4f})."
+                    )
+                self.reserved += cost
+                self._reservations[threading.get_ident()] = cost
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._window and now - self._window[0][0] >= 60:
+                    self._window.popleft()
+                rpm_ok = self.max_rpm is None or len(self._window) < self.max_rpm
+                window_tokens = sum(t for _, t in self._window)
+                tpm_ok = self.max_tpm is None or window_tokens + self.mean_tokens <= self.max_tpm
+                if (rpm_ok and tpm_ok) or not self._window:
+                    return
+                wait = 60 - (now - self._window[0][0])
+            time.sleep(wait)
+
+    def release(self) -> None:
+        """Drop this thread's reservation after a request that failed and will not be recorded."""
+        with self._lock:
+            self.reserved -= self._reservations.pop(threading.get_ident(), 0.0)
+
+    def record(self, image: str, model: str, usage, latency: float | None = None) -> float:
+        prompt, cached, completion = usage_tokens(usage)
+        cost = request_cost(model, prompt, cached, completion, self.prices)
+        total = prompt + completion
+        with self._lock:
+            self.reserved -= self._reservations.pop(threading.get_ident(), 0.0)
+            self.spent += cost
+            self.tokens += total
+            self.requests += 1
+            self._window.append((time.monotonic(), total))
+            with self.path.open("a", newline="", encoding="utf-8") as f:
+                csv.writer(f).writerow([
+                    datetime.now().isoformat(timespec="seconds"), self.run, image, model,
+                    prompt, cached, completion, total, f"{cost:.6f}",
+                    "" if latency is None else f"{latency:.3f}",
+                ])
+        return cost
@@ -0,0 +1,91 @@
+import os
+from dataclasses import dataclass
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from ki67_core import ki67_index
+
+# Ruifrok & Johnston stain vectors (optical density of pure haematoxylin, eosin and DAB)
+_STAINS = np.array([
+    [0.65, 0.70, 0.29],
+    [0.07, 0.99, 0.11],
+    [0.27, 0.57, 0.78],
+])
+_STAINS /= np.linalg.norm(_STAINS, axis=1, keepdims=True)
+_UNMIX = np.linalg.inv(_STAINS)
+
+# Grid-searched on the 26 BCData sample tiles (640x640; nuclei ~20-35 px across), so scores on those
+# tiles are in-sample.
+# Concentrations are in natural-log optical density; the background sits at ~0.2 (H) / ~0.3 (DAB).
+NUCLEUS_SIGMA = 5.0
+MIN_DISTANCE = 11
+DAB_THRESHOLD = 1.3
+HEMATOXYLIN_THRESHOLD = 0.3
+NEGATIVE_MAX_DAB = 0.8  # fraction of the DAB threshold a negative nucleus may reach
+
+
+@dataclass
+class PreCount:
+    positive: int
+    negative: int
+    ki67: float
+    spread: float  # max |Δ Ki-67| when the detection thresholds move ±20%
+    confident: bool
+
+
+def color_deconvolution(rgb: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """(haematoxylin, DAB) concentration maps of an RGB uint8 image."""
+    od = -np.log((rgb.astype(np.float32) + 1.0) / 256.0)
+    conc = od.reshape(-1, 3) @ _UNMIX.astype(np.float32)
+    h = conc[:, 0].reshape(rgb.shape[:2])
+    dab = conc[:, 2].reshape(rgb.shape[:2])
+    return h, dab
+
+
+def _peaks(channel: np.ndarray, threshold: float, kernel: np.ndarray) -> np.ndarray:
+    """Boolean mask of local maxima above ``threshold`` (non-maximum suppression by dilation)."""
+    return (channel >= cv2.dilate(channel, kernel)) & (channel > threshold)
+
+
+def _count(h: np.ndarray, dab: np.ndarray, scale: float, kernel: np.ndarray) -> tuple[int, int]:
+    dab_thr = DAB_THRESHOLD * scale
+    pos = _peaks(dab, dab_thr, kernel)
+    # Negative nuclei: haematoxylin blobs away from DAB staining and from positive nuclei
+    near_pos = cv2.dilate(pos.astype(np.uint8), kernel).astype(bool)
+    neg = _peaks(h, HEMATOXYLIN_THRESHOLD * scale, kernel) & (dab < dab_thr * NEGATIVE_MAX_DAB) & ~near_pos
+    return int(np.count_nonzero(pos)), int(np.count_nonzero(neg))
+
+
+def precount(img_path: str | Path, max_spread: float | None = None, min_cells: int = 20) -> PreCount:
+    """Estimate positive / negative nuclei and the Ki-67 index of one image in milliseconds.
+
+    The estimate is ``confident`` when it has at least ``min_cells`` nuclei and the index
+    moves less than ``max_spread`` points when both thresholds are scaled by 0.8 and 1.2.
+    """
+    if max_spread is None:
+        max_spread = float(os.getenv("KI67_CASCADE_MAX_SPREAD", "3.0"))
+    bgr = cv2.imread(str(img_path), cv2.IMREAD_COLOR)
+    if bgr is None:
+        raise ValueError(f"Could not read image: {img_path}")
+    h, dab = color_deconvolution(cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB))
+    h = cv2.GaussianBlur(h, (0, 0), NUCLEUS_SIGMA)
+    dab = cv2.GaussianBlur(dab, (0, 0), NUCLEUS_SIGMA)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (2 * MIN_DISTANCE + 1, 2 * MIN_DISTANCE + 1))
+
+    pos, neg = _count(h, dab, 1.0, kernel)
+    ki = ki67_index(pos, neg)
+    spread = max(abs(ki67_index(*_count(h, dab, s, kernel)) - ki) for s in (0.8, 1.2))
+    return PreCount(pos, neg, ki, spread, confident=pos + neg >= min_cells and spread < max_spread)
+
+
+def as_response(result: PreCount) -> str:
+    """The estimate in the VLM answer format, so archives and parsers treat it like any response."""
+    return (
+        "Source: cv-precount\n"
+        f"Immunopositive cells: {result.positive}\n"
+        f"Immunonegative cells: {result.negative}\n"
+        f"Ki-67 Index: {result.ki67:.2f}%\n"
+        f"Threshold spread: {result.spread:.2f}"
+    )
@@ -0,0 +1,187 @@
+import math
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from pathlib import Path
+
+from transport import STATS as TRANSPORT
+
+# Plain "6.67" lines (our own history) or the timing lines written by the time-analysis runs:
+# "Response time: 6.67 seconds" / "Time: 5.42s | Tokens: ..."
+_LATENCY_LINE = re.compile(
+    r"^(?:(?:Response time|Time):\s*)?([0-9]+(?:\.[0-9]+)?)\s*(?:s|seconds)?\s*(?:$|\|)", re.I
+)
+# Shared by every entry point unless KI67_LATENCY_HISTORY overrides it (empty: keep nothing)
+DEFAULT_HISTORY = Path(__file__).resolve().parent.parent / "5.results" / "latency_history.txt"
+
+
+class LatencyTracker:
+    """Sliding window of observed request latencies, optionally persisted to a text file."""
+
+    def __init__(self, history_path: Path | None = None, seed_paths=(), window: int = 500):
+        self.history_path = Path(history_path) if history_path else None
+        self.samples: deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+        for path in [*seed_paths, self.history_path]:
+            if path and Path(path).is_file():
+                with Path(path).open(encoding="utf-8") as f:
+                    for line in f:
+                        m = _LATENCY_LINE.match(line.strip())
+                        if m:
+                            self.samples.append(float(m.group(1)))
+        self._trim_history(window)
+
+    def _trim_history(self, window: int) -> None:
+        """Keep the history file at about one window, so appending across runs does not grow it forever."""
+        if not self.history_path or not self.history_path.is_file():
+            return
+        try:
+            lines = self.history_path.read_text(encoding="utf-8").splitlines()
+            if len(lines) > 2 * window:
+                self.history_path.write_text("\n".join(lines[-window:]) + "\n", encoding="utf-8")
+        except OSError:
+            pass  # read-only location: the history is still read, just not trimmed
+
+    @classmethod
+    def from_env(cls) -> "LatencyTracker":
+        seeds = os.getenv("KI67_LATENCY_SEED", "")
+        return cls(
+            history_path=os.getenv("KI67_LATENCY_HISTORY", str(DEFAULT_HISTORY)) or None,
+            seed_paths=[p for p in seeds.split(os.pathsep) if p],
+        )
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self.samples.append(seconds)
+            if self.history_path:
+                try:
+                    self.history_path.parent.mkdir(parents=True, exist_ok=True)
+                    with self.history_path.open("a", encoding="utf-8") as f:
+                        f.write(f"{seconds:.3f}\n")
+                except OSError:
+                    self.history_path = None  # unwritable: keep learning in memory only
+
+    def percentile(self, p: float) -> float | None:
+        with self._lock:
+            data = sorted(self.samples)
+        if not data:
+            return None
+        k = (len(data) - 1) * p / 100
+        lo, hi = int(k), min(int(k) + 1, len(data) - 1)
+        return data[lo] + (data[hi] - data[lo]) * (k - lo)
+
+
+class HedgePolicy:
+    """Send a duplicate request when the first one passes a percentile-based deadline.
+
+    Whichever copy finishes first wins; the other is left to finish on a daemon thread
+    (its usage is still recorded by the request function), so a one-shot CLI call exits
+    without waiting for it. Hedges are capped at ``ceil(max_extra * requests)``, which
+    bounds the extra spend; rounding up lets a one-shot CLI call be hedged too. The cap
+    is checked and taken under a lock, so concurrent callers cannot overshoot it.
+    """
+
+    def __init__(
+        self,
+        tracker: LatencyTracker,
+        percentile: float = 95.0,
+        max_extra: float = 0.1,
+        min_samples: int = 10,
+    ):
+        self.tracker = tracker
+        self.percentile = percentile
+        self.max_extra = max_extra
+        self.min_samples = min_samples
+        self.calls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "HedgePolicy | None":
+        """Policy configured by KI67_HEDGE_PERCENTILE / KI67_HEDGE_MAX_EXTRA, or None if disabled."""
+        percentile = os.getenv("KI67_HEDGE_PERCENTILE")
+        if not percentile:
+            return None
+        return cls(
+            LatencyTracker.from_env(),
+            percentile=float(percentile),
+            max_extra=float(os.getenv("KI67_HEDGE_MAX_EXTRA", "0.1")),
+        )
+
+    def deadline(self) -> float | None:
+        if len(self.tracker.samples) < self.min_samples:
+            return None
+        return self.tracker.percentile(self.percentile)
+
+    def _observe(self, future) -> None:
+        if future.exception() is None:
+            self.tracker.observe(future.result()[2])
+
+    @staticmethod
+    def _start(fn) -> Future:
+        """Run ``fn()`` on a daemon thread; the future holds (result, seconds, warm seconds).
+
+        Warm seconds leave out the TCP and TLS handshake of a new connection, so the latency
+        history of one-shot CLI calls, which always open one, is not biased by cold starts.
+
+        Executor threads are joined at interpreter exit, which would make a finished CLI
+        call wait for the losing copy of a hedged request.
+        """
+        future = Future()
+
+        def run():
+            start = time.monotonic()
+            try:
+                result = fn()
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                seconds = time.monotonic() - start
+                info = TRANSPORT.last()  # this thread's last request
+                future.set_result((result, seconds, max(0.0, seconds - (info.handshake if info else 0.0))))
+
+        future.set_running_or_notify_cancel()
+        threading.Thread(target=run, name="hedge", daemon=True).start()
+        return future
+
+    def _reserve(self) -> bool:
+        """Take one hedge from the budget, if any is left."""
+        with self._lock:
+            if self.hedged >= math.ceil(self.max_extra * self.calls):
+                return False
+            self.hedged += 1  # before the hedge is sent, so hedges in flight count against the cap
+            return True
+
+    def call(self, fn):
+        """Run ``fn()`` (a complete, self-contained request) with hedging."""
+        with self._lock:
+            self.calls += 1
+        primary = self._start(fn)
+        # Observe the primary's latency even when it loses, so the deadline is not biased low
+        primary.add_done_callback(self._observe)
+
+        deadline = self.deadline()
+        done, _ = wait([primary], timeout=deadline)
+        if done or not self._reserve():
+            return primary.result()[0]
+
+        hedge = self._start(fn)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                if f.exception() is None:
+                    if f is hedge:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    return f.result()[0]
+                error = f.exception()
+        raise error
+
+    def summary(self) -> str:
+        return f"hedged {self.hedged}/{self.calls} requests, {self.hedge_wins} won by the hedge"
@@ -0,0 +1,223 @@
+import csv
+import os
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+INDEX_FIELDS = [
+    "timestamp", "path", "phash", "dhash", "model", "predicted", "run", "mtime_ns", "size", "prompt", "sampling",
+]
+# Largest per-hash Hamming distance (out of 64 bits) still treated as the same tile.
+# Re-encoded (JPEG q50-95) or resized copies of the sample tiles hash 0 bits apart; distinct tiles 24+.
+DEFAULT_RADIUS = 6
+
+_DCT_SIZE = 32
+_DCT_KEEP = 8
+# Orthonormal DCT-II basis: pHash = sign of the 8x8 lowest frequencies against their median
+_k = np.arange(_DCT_SIZE)
+_DCT = np.sqrt(2 / _DCT_SIZE) * np.cos(np.pi * (2 * _k[None, :] + 1) * _k[:, None] / (2 * _DCT_SIZE))
+_DCT[0] /= np.sqrt(2)
+_BIT_WEIGHTS = np.uint64(1) << np.arange(63, -1, -1, dtype=np.uint64)
+
+
+def _pack(bits: np.ndarray) -> int:
+    return int(np.bitwise_or.reduce(_BIT_WEIGHTS[bits.ravel()]) if bits.any() else 0)
+
+
+def phash(gray: Image.Image) -> int:
+    """64-bit DCT perceptual hash of a greyscale image."""
+    a = np.asarray(gray.resize((_DCT_SIZE, _DCT_SIZE), Image.Resampling.LANCZOS), dtype=np.float64)
+    low = (_DCT @ a @ _DCT.T)[:_DCT_KEEP, :_DCT_KEEP]
+    return _pack(low > np.median(low.ravel()[1:]))
+
+
+def dhash(gray: Image.Image) -> int:
+    """64-bit difference hash: sign of the horizontal gradient on a 9x8 thumbnail."""
+    a = np.asarray(gray.resize((9, 8), Image.Resampling.LANCZOS), dtype=np.int16)
+    return _pack(a[:, 1:] > a[:, :-1])
+
+
+def image_hashes(img_path: str | Path) -> tuple[int, int]:
+    """(pHash, dHash) of one image file."""
+    with Image.open(img_path) as img:
+        gray = img.convert("L")
+    return phash(gray), dhash(gray)
+
+
+def file_stamp(img_path: str | Path) -> tuple[str, str]:
+    """(mtime in ns, size) of a file, as stored in the index to notice replaced files."""
+    st = os.stat(img_path)
+    return str(st.st_mtime_ns), str(st.st_size)
+
+
+def hamming(hashes: np.ndarray, h: int) -> np.ndarray:
+    """Bit distance between every hash in a uint64 array and ``h``."""
+    return np.bitwise_count(hashes ^ np.uint64(h))
+
+
+@dataclass
+class Match:
+    path: str
+    distance: int  # max of the pHash and dHash distances
+    model: str
+    predicted: float | None
+    prompt: str = ""  # prompt_key of the prompts behind the prediction
+    sampling: str = ""  # "greedy" or the self-consistency settings
+
+
+class HashIndex:
+    """Append-only CSV of image hashes, plus the VLM prediction per (image, model, prompt, sampling) when known.
+
+    Lookups scan NumPy uint64 arrays, so a query over tens of thousands of tiles takes well
+    under a millisecond. Rows written later for the same (path, model, prompt, sampling)
+    replace earlier ones. A prediction is only reused for the same model, prompt and sampling
+    settings; rows written before the prompt and sampling were kept are never reused.
+    Each row keeps the file's mtime and size: a file whose mtime or size changed is rehashed,
+    and when its hashes differ the rows of its old content (predictions included) are dropped.
+    """
+
+    def __init__(self, path: str | Path, run: str = ""):
+        self.path = Path(path)
+        self.run = run
+        self._lock = threading.Lock()
+        self._rows: dict[tuple[str, str, str, str], dict] = {}
+        self._hashes: dict[str, tuple[int, int]] = {}
+        self._stamps: dict[str, tuple[str, str]] = {}
+        self._old_header = False
+        if self.path.is_file():
+            with self.path.open(newline="", encoding="utf-8") as f:
+                reader = csv.DictReader(f)
+                for row in reader:
+                    self._set(row)
+                self._old_header = reader.fieldnames is not None and reader.fieldnames != INDEX_FIELDS
+        self._arrays = None
+
+    def _set(self, row: dict) -> None:
+        key = row["path"]
+        stamp = row.get("mtime_ns") or "", row.get("size") or ""
+        hashes = int(row["phash"], 16), int(row["dhash"], 16)
+        if self._hashes.get(key, hashes) != hashes:
+            # The file was replaced: the earlier rows describe content that is gone
+            for k in [k for k in self._rows if k[0] == key]:
+                del self._rows[k]
+        self._stamps[key] = stamp
+        self._rows[(key, row["model"], row.get("prompt") or "", row.get("sampling") or "")] = row
+        self._hashes[key] = hashes
+
+    @classmethod
+    def from_env(cls, run: str = "") -> "HashIndex":
+        default = Path(__file__).resolve().parent.parent / "5.results" / "image_hashes.csv"
+        return cls(os.getenv("KI67_DEDUP_INDEX") or default, run=run)
+
+    def __len__(self) -> int:
+        return len(self._hashes)
+
+    def __contains__(self, img_path) -> bool:
+        """Whether ``img_path`` is indexed with its current content (same mtime and size)."""
+        key = str(Path(img_path).resolve())
+        return key in self._hashes and self._stamps.get(key) == file_stamp(img_path)
+
+    def _changed(self, key: str) -> bool:
+        try:
+            return self._stamps.get(key) != file_stamp(key)
+        except OSError:
+            return False  # moved or deleted: the row still describes the content that was hashed
+
+    def hashes_for(self, img_path: str | Path) -> tuple[int, int]:
+        """Indexed hashes of ``img_path``, computing them for new or changed images."""
+        return self._hashes[str(Path(img_path).resolve())] if img_path in self else image_hashes(img_path)
+
+    def add(
+        self,
+        img_path: str | Path,
+        ph: int,
+        dh: int,
+        model: str = "",
+        predicted: float | None = None,
+        prompt: str = "",
+        sampling: str = "",
+    ) -> None:
+        mtime_ns, size = file_stamp(img_path)
+        row = {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "path": str(Path(img_path).resolve()),
+            "phash": f"{ph:016x}",
+            "dhash": f"{dh:016x}",
+            "model": model,
+            "predicted": "" if predicted is None else f"{predicted:.2f}",
+            "run": self.run,
+            "mtime_ns": mtime_ns,
+            "size": size,
+            "prompt": prompt,
+            "sampling": sampling,
+        }
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            if self._old_header:
+                # Index written before the current columns existed: rewrite it once with the new header
+                with self.path.open("w", newline="", encoding="utf-8") as f:
+                    writer = csv.DictWriter(f, fieldnames=INDEX_FIELDS, restval="", extrasaction="ignore")
+                    writer.writeheader()
+                    writer.writerows(self._rows.values())
+                self._old_header = False
+            new_file = not self.path.is_file() or self.path.stat().st_size == 0
+            with self.path.open("a", newline="", encoding="utf-8") as f:
+                writer = csv.DictWriter(f, fieldnames=INDEX_FIELDS)
+                if new_file:
+                    writer.writeheader()
+                writer.writerow(row)
+            self._set(row)
+            self._arrays = None
+
+    def _build(self):
+        if self._arrays is None:
+            rows = list(self._rows.values())
+            self._arrays = (
+                rows,
+                np.array([int(r["phash"], 16) for r in rows], dtype=np.uint64),
+                np.array([int(r["dhash"], 16) for r in rows], dtype=np.uint64),
+            )
+        return self._arrays
+
+    def lookup(
+        self,
+        img_path: str | Path,
+        ph: int,
+        dh: int,
+        radius: int = DEFAULT_RADIUS,
+        model: str | None = None,
+        prompt: str = "",
+        sampling: str = "",
+    ) -> Match | None:
+        """Closest other indexed image within ``radius`` bits on both hashes.
+
+        With ``model``, only images that have a prediction from that model, ``prompt`` and
+        ``sampling`` are considered.
+        """
+        with self._lock:
+            rows, phashes, dhashes = self._build()
+        if not rows:
+            return None
+        dist = np.maximum(hamming(phashes, ph), hamming(dhashes, dh))
+        near = np.flatnonzero(dist <= radius)
+        key = str(Path(img_path).resolve())
+        for i in near[np.argsort(dist[near], kind="stable")]:
+            row = rows[i]
+            if row["path"] == key:
+                continue
+            if model is not None and (
+                row["model"] != model or not row["predicted"]
+                or (row.get("prompt") or "") != prompt or (row.get("sampling") or "") != sampling
+            ):
+                continue
+            if self._changed(row["path"]):
+                continue  # replaced since it was hashed; rehashed when its own turn comes
+            return Match(
+                row["path"], int(dist[i]), row["model"], float(row["predicted"]) if row["predicted"] else None,
+                row.get("prompt") or "", row.get("sampling") or "",
+            )
+        return None
@@ -0,0 +1,134 @@
+import base64
+import json
+import os
+import re
+from pathlib import Path
+
+MODEL = "gpt-4.1-mini-2025-04-14"
+PROMPT_DIR = Path(__file__).resolve().parent
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png"}
+
+_client = None
+
+
+def get_client():
+    """Shared OpenAI client, created on first use so offline paths need neither the key nor the import."""
+    global _client
+    if _client is None:
+        from openai import OpenAI
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        api_key = os.getenv("OPENAI_API_KEY")
+        if api_key is None:
+            raise ValueError("OPENAI_API_KEY not found in environment. Did you create the .env file?")
+        # One pooled, keep-alive transport for every request of the process
+        from transport import http_client
+
+        _client = OpenAI(api_key=api_key, http_client=http_client())
+    return _client
+
+
+def load_prompts(prompt_dir: Path = PROMPT_DIR) -> tuple[str, str]:
+    """(system prompt, user prompt) read from the prompt text files."""
+    system = (prompt_dir / "system_prompt.txt").read_text(encoding="utf-8")
+    user = (prompt_dir / "user_prompt.txt").read_text(encoding="utf-8")
+    return system, user
+
+
+def image_data_url(img_bytes: bytes, suffix: str) -> str:
+    mime = "jpeg" if suffix.lower() in {".jpg", ".jpeg"} else "png"
+    return f"data:image/{mime};base64,{base64.b64encode(img_bytes).decode()}"
+
+
+def build_messages(system_prompt: str, user_prompt: str, data_url: str) -> list[dict]:
+    return [
+        {"role": "system", "content": system_prompt},
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": user_prompt},
+                {"type": "image_url", "image_url": {"url": data_url}},
+            ],
+        },
+    ]
+
+
+def count_true_cells(json_path: str | Path) -> tuple[int, int]:
+    """(positive, negative) cell counts of a JSON annotation file (label_id 1 = positive, 2 = negative)."""
+    with open(json_path) as f:
+        data = json.load(f)
+    pos = sum(1 for c in data if c.get("label_id") == 1)
+    neg = sum(1 for c in data if c.get("label_id") == 2)
+    return pos, neg
+
+
+def ki67_index(pos: int, neg: int) -> float:
+    return round((pos / (pos + neg)) * 100, 2) if pos + neg else 0.0
+
+
+def calculate_true_index(json_path: str | Path) -> float:
+    """Ki-67 index from a JSON annotation file."""
+    return ki67_index(*count_true_cells(json_path))
+
+
+class ResponseParseError(ValueError):
+    """The model's answer contains no Ki-67 value."""
+
+    def __init__(self, message: str = "Ki-67 value not found.", text: str = ""):
+        super().__init__(message)
+        self.text = text  # the unparseable answer, kept for the dead-letter file
+
+
+# ── Response parsing ──────────────────────────────────────────────────────────
+# Compiled once and shared by every runner and utility; each field is searched once.
+_KI67_RE = re.compile(r"Ki[\s-]?67[^%]*?([0-9]+(?:\.[0-9]+)?)\s*%", re.I | re.S)
+_PERCENT_RE = re.compile(r"([0-9]+(?:\.[0-9]+)?)\s*%")
+_POSITIVE_RE = re.compile(r"Immunopositive cells?:\s*(\d+)", re.I)
+_NEGATIVE_RE = re.compile(r"Immunonegative cells?:\s*(\d+)", re.I)
+
+
+def find_predicted_index(text: str, fallback: bool = True) -> float | None:
+    """First percentage after a "Ki-67" mention; otherwise (with fallback) the last percentage in the text."""
+    m = _KI67_RE.search(text)
+    if m:
+        return float(m.group(1))
+    if fallback:
+        last = None
+        for last in _PERCENT_RE.finditer(text):
+            pass
+        if last:
+            return float(last.group(1))
+    return None
+
+
+def extract_predicted_index(text: str) -> float:
+    ki = find_predicted_index(text)
+    if ki is None:
+        raise ResponseParseError("Ki-67 value not found.", text)
+    return ki
+
+
+def parse_response(text: str) -> tuple[int | None, int | None, float | None]:
+    """(pos_cells, neg_cells, ki67_index) from the model text, None for fields not found."""
+    pos = _POSITIVE_RE.search(text)
+    neg = _NEGATIVE_RE.search(text)
+    return (
+        int(pos.group(1)) if pos else None,
+        int(neg.group(1)) if neg else None,
+        find_predicted_index(text),
+    )
+
+
+def find_counts_index(text: str) -> float | None:
+    """Ki-67 index computed from the reported cell counts, for answers that give counts but no percentage."""
+    pos, neg, _ = parse_response(text)
+    if pos is None or neg is None or not pos + neg:
+        return None
+    return ki67_index(pos, neg)
+
+
+def extract_cell_counts_and_index(text: str) -> tuple[int, int, float]:
+    """Return (pos_cells, neg_cells, ki67_index) extracted from the model text."""
+    pos, neg, ki = parse_response(text)
+    return pos or 0, neg or 0, ki if ki is not None else 0.0
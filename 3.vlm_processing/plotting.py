@@ -0,0 +1,194 @@
+"""Headless, cached predicted-vs-true plots.
+
+Parsed CSV series are cached as ``.npz`` files, keyed by the CSV's mtime/size and its content
+hash. For large point counts the data layer of each panel is rendered once into a raster,
+in parallel across panels, and reused while its series is unchanged. Axes, labels and the
+diagonal stay vector graphics. A figure whose inputs are all unchanged is not redrawn.
+"""
+import csv
+import hashlib
+import io
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+STYLE_VERSION = 1  # bump when the look of the data layer changes, to invalidate cached rasters
+LIMITS = (-5, 105)
+VECTOR_MAX = 20_000  # up to this many points: plain vector scatter
+HEXBIN_MIN = 200_000  # from this many points: density hexbin instead of individual markers
+LAYER_PX = 1000
+MODES = ("auto", "scatter", "raster", "hexbin")
+
+
+def default_cache_dir() -> Path:
+    env = os.getenv("KI67_PLOT_CACHE")
+    return Path(env) if env else Path(__file__).resolve().parent.parent / "5.results" / ".plot_cache"
+
+
+def parse_results(data: bytes) -> tuple[np.ndarray, np.ndarray]:
+    """(true, predicted) arrays from a results CSV; rows that do not parse are skipped."""
+    y_true, y_pred = [], []
+    for row in csv.DictReader(io.StringIO(data.decode("utf-8-sig"))):
+        try:
+            t, p = float(row["true"]), float(row["predicted"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        y_true.append(t)
+        y_pred.append(p)
+    return np.array(y_true, dtype=np.float32), np.array(y_pred, dtype=np.float32)
+
+
+class PlotCache:
+    """Parsed series, rendered layers and figure keys under one cache directory."""
+
+    def __init__(self, cache_dir: Path | None = None):
+        self.dir = Path(cache_dir) if cache_dir else default_cache_dir()
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.dir / "index.json"
+        self.index = {"series": {}, "figures": {}}
+        if self.index_path.is_file():
+            try:
+                self.index.update(json.loads(self.index_path.read_text(encoding="utf-8")))
+            except ValueError:
+                pass  # a corrupt index only costs a re-parse
+
+    def save(self) -> None:
+        tmp = self.index_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.index), encoding="utf-8")
+        tmp.replace(self.index_path)
+
+    def series(self, csv_path: Path) -> tuple[str, np.ndarray, np.ndarray]:
+        """(content digest, true, predicted) of a results CSV, parsing it only when it changed."""
+        key = str(csv_path.resolve())
+        st = csv_path.stat()
+        entry = self.index["series"].get(key)
+        if entry and entry["mtime_ns"] == st.st_mtime_ns and entry["size"] == st.st_size:
+            digest = entry["digest"]
+        else:
+            # Touched or copied files keep their digest and reuse the parsed arrays
+            digest = hashlib.sha1(csv_path.read_bytes()).hexdigest()
+            self.index["series"][key] = {"mtime_ns": st.st_mtime_ns, "size": st.st_size, "digest": digest}
+
+        npz = self.dir / f"series_{digest}.npz"
+        if npz.is_file():
+            with np.load(npz) as data:
+                return digest, data["true"], data["pred"]
+        y_true, y_pred = parse_results(csv_path.read_bytes())
+        np.savez(npz, true=y_true, pred=y_pred)
+        return digest, y_true, y_pred
+
+    def layer_path(self, key: str) -> Path:
+        return self.dir / f"layer_{key}.npy"
+
+
+def choose_mode(points: int, mode: str = "auto") -> str:
+    if mode != "auto":
+        return mode
+    if points <= VECTOR_MAX:
+        return "scatter"
+    return "raster" if points < HEXBIN_MIN else "hexbin"
+
+
+def render_layer(args: tuple[np.ndarray, np.ndarray, str, int]) -> np.ndarray:
+    """RGBA raster of the data points alone, covering exactly LIMITS x LIMITS (runs in workers)."""
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    y_true, y_pred, mode, px = args
+    fig = Figure(figsize=(px / 100, px / 100), dpi=100)
+    fig.patch.set_alpha(0)
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_axes((0, 0, 1, 1))
+    ax.set_xlim(*LIMITS)
+    ax.set_ylim(*LIMITS)
+    ax.axis("off")
+    if mode == "hexbin":
+        ax.hexbin(y_true, y_pred, gridsize=80, bins="log", mincnt=1, cmap="viridis", extent=(*LIMITS, *LIMITS))
+    else:
+        ax.scatter(y_true, y_pred, marker="x", s=8, linewidths=0.6, alpha=0.5)
+    canvas.draw()
+    return np.asarray(canvas.buffer_rgba()).copy()
+
+
+def plot_panels(
+    csv_paths: list,
+    output: str | Path,
+    titles: list[str] | None = None,
+    xlabel: str = "True Ki-67 Index [%]",
+    ylabel: str = "Predicted Ki-67 Index [%]",
+    line_color: str = "gray",
+    panel_size: float = 6.5,
+    mode: str | None = None,
+    cache_dir: Path | None = None,
+    workers: int | None = None,
+) -> bool:
+    """One predicted-vs-true panel per results CSV, side by side; False if ``output`` was up to date."""
+    mode = mode or os.getenv("KI67_PLOT_MODE", "auto")
+    if mode not in MODES:
+        raise ValueError(f"Unknown plot mode '{mode}' (expected one of {', '.join(MODES)}).")
+    output = Path(output)
+    cache = PlotCache(cache_dir)
+    series = [cache.series(Path(p)) for p in csv_paths]
+    modes = [choose_mode(len(t), mode) for _, t, _ in series]
+
+    layer_keys = [
+        hashlib.sha1(f"{digest}|{m}|{LAYER_PX}|{STYLE_VERSION}".encode()).hexdigest()
+        for (digest, _, _), m in zip(series, modes)
+    ]
+    figure_key = hashlib.sha1(json.dumps([
+        layer_keys, titles, xlabel, ylabel, line_color, panel_size, output.suffix, STYLE_VERSION,
+    ]).encode()).hexdigest()
+    if output.is_file() and cache.index["figures"].get(str(output.resolve())) == figure_key:
+        cache.save()
+        return False
+
+    # Only raster/hexbin panels whose series changed are re-rendered, in parallel
+    todo = [
+        i for i, m in enumerate(modes)
+        if m != "scatter" and not cache.layer_path(layer_keys[i]).is_file()
+    ]
+    jobs = [(series[i][1], series[i][2], modes[i], LAYER_PX) for i in todo]
+    if len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(len(jobs), workers or os.cpu_count())) as pool:
+            layers = list(pool.map(render_layer, jobs))
+    else:
+        layers = [render_layer(j) for j in jobs]
+    for i, layer in zip(todo, layers):
+        np.save(cache.layer_path(layer_keys[i]), layer)
+
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    cols = len(series)
+    fig = Figure(figsize=(panel_size * cols, panel_size))
+    FigureCanvasAgg(fig)
+    axs = fig.subplots(1, cols, squeeze=False)[0]
+    for ax, (_, y_true, y_pred), m, key, title in zip(axs, series, modes, layer_keys, titles or [None] * cols):
+        if m == "scatter":
+            ax.scatter(y_true, y_pred, marker="x")
+        else:
+            ax.imshow(
+                np.load(cache.layer_path(key)), extent=(*LIMITS, *LIMITS), origin="upper",
+                aspect="auto", interpolation="antialiased", zorder=1,
+            )
+            ax.text(0.02, 0.98, f"n = {len(y_true):,} ({m})", transform=ax.transAxes, va="top", fontsize=9)
+        ax.plot([0, 100], [0, 100], color=line_color, linewidth=1, zorder=2)
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel(ylabel)
+        ax.set_xlim(*LIMITS)
+        ax.set_ylim(*LIMITS)
+        ax.spines["top"].set_visible(False)
+        ax.spines["right"].set_visible(False)
+        ax.grid(True, linestyle="--", alpha=0.5)
+        if title:
+            ax.set_title(title, loc="center", fontsize=16, fontweight="bold")
+
+    fig.tight_layout(pad=4.0 if cols > 1 else 1.08)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    fig.savefig(output)
+    cache.index["figures"][str(output.resolve())] = figure_key
+    cache.save()
+    return True
@@ -0,0 +1,204 @@
+import os
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from ki67_core import ResponseParseError, find_counts_index, find_predicted_index
+from work_queue import ContentFiltered
+
+SAMPLE_FIELDS = ["image", "samples", "predicted", "std", "spread", "values", "requests", "native_n", "dropped"]
+TOP_UP_ROUNDS = 2  # rounds of replacement samples for dropped completions, per draw
+
+
+@dataclass
+class Samples:
+    values: list[float]  # parsed Ki-67 index of each completion
+    texts: list[str] = field(repr=False)
+    index: float = 0.0  # aggregated prediction
+    std: float = 0.0  # dispersion score: sample standard deviation, in Ki-67 points
+    spread: float = 0.0  # max - min
+    requests: int = 0
+    native_n: bool = True  # all completions came from n-completion requests
+    dropped: int = 0  # completions filtered, truncated or without a value, replaced where possible
+    reparsed: int = 0  # completions whose value came from their cell counts
+
+    def as_response(self, method: str) -> str:
+        """All completions in one llm_responses block, the aggregate first so parsers pick it up."""
+        dropped = f", {self.dropped} dropped" if self.dropped else ""
+        head = (
+            f"Self-consistency: {method} of {len(self.values)} samples "
+            f"(std {self.std:.2f}, spread {self.spread:.2f}{dropped})\n"
+            f"Ki-67 Index: {self.index:.2f}%"
+        )
+        body = "\n".join(f"--- sample {i} ---\n{t.strip()}" for i, t in enumerate(self.texts, 1))
+        return f"{head}\n{body}"
+
+
+def aggregate(values: list[float], method: str = "median", trim: float = 0.2) -> float:
+    """Median, or the mean after dropping ``trim`` of the values at each end."""
+    if method == "median":
+        return statistics.median(values)
+    if method == "trimmed":
+        k = int(len(values) * trim)
+        kept = sorted(values)[k : len(values) - k] or sorted(values)
+        return statistics.fmean(kept)
+    raise ValueError(f"Unknown aggregate: {method}")
+
+
+def _n_unsupported(error: Exception) -> bool:
+    """Whether an API error rejects the ``n`` parameter (e.g. reasoning models, some compatible servers)."""
+    if getattr(error, "param", None) == "n":
+        return True
+    return getattr(error, "status_code", None) in (400, 422) and "'n'" in str(error)
+
+
+def _value(text: str, finish_reason: str | None) -> tuple[float | None, bool]:
+    """A completion's Ki-67 value (None if unusable) and whether it came from the cell counts.
+
+    Filtered and truncated completions are unusable even when a value can be read from them.
+    """
+    if finish_reason in ("content_filter", "length"):
+        return None, False
+    value = find_predicted_index(text)
+    if value is not None:
+        return value, False
+    value = find_counts_index(text)
+    return value, value is not None
+
+
+class SelfConsistency:
+    """Several temperature > 0 completions per image, aggregated into one prediction.
+
+    Samples are requested as ``n`` completions of a single request, so the image is uploaded
+    (and its prompt tokens billed) once. Where ``n`` is rejected or ignored, the missing
+    completions are requested in parallel single calls instead, and later images go straight
+    to parallel calls. Each completion is checked on its own: filtered or truncated ones and
+    ones without a value (after a re-parse from the cell counts) are dropped and replaced by
+    new samples, up to TOP_UP_ROUNDS times, so one bad completion neither fails the image nor
+    re-sends the good ones. With ``adapt_std``, ``samples`` is only the first round: images
+    whose standard deviation is above it get extra samples, up to ``max_samples``.
+    """
+
+    def __init__(
+        self,
+        samples: int = 5,
+        temperature: float = 0.7,
+        method: str = "median",
+        trim: float = 0.2,
+        adapt_std: float | None = None,
+        max_samples: int | None = None,
+    ):
+        self.samples = samples
+        self.temperature = temperature
+        self.method = method
+        self.trim = trim
+        self.adapt_std = adapt_std
+        self.max_samples = max(max_samples or samples, samples)
+        self.native_n = True
+        self.images = 0
+        self.extra_rounds = 0
+        self._pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="sample")
+
+    @classmethod
+    def from_env(cls) -> "SelfConsistency | None":
+        """Policy configured by KI67_SAMPLES and friends, or None for single deterministic calls."""
+        samples = int(os.getenv("KI67_SAMPLES", "1") or 1)
+        if samples < 2:
+            return None
+        adapt = os.getenv("KI67_SAMPLES_ADAPT_STD")
+        max_samples = os.getenv("KI67_SAMPLES_MAX")
+        return cls(
+            samples=samples,
+            temperature=float(os.getenv("KI67_SAMPLE_TEMPERATURE", "0.7")),
+            method=os.getenv("KI67_SAMPLE_AGGREGATE", "median"),
+            adapt_std=float(adapt) if adapt else None,
+            max_samples=int(max_samples) if max_samples else None,
+        )
+
+    @property
+    def mode(self) -> str:
+        """The settings that shape a prediction, recorded with cached predictions so only like is reused."""
+        adapt = f" adapt_std={self.adapt_std:g} max={self.max_samples}" if self.adapt_std is not None else ""
+        trim = f" trim={self.trim:g}" if self.method == "trimmed" else ""
+        return f"self-consistency n={self.samples} t={self.temperature:g} {self.method}{trim}{adapt}"
+
+    def _choices(self, request, n: int, first: int = 0) -> tuple[list[tuple[str, str | None]], int, bool]:
+        """``n`` (text, finish_reason) completions, the number of requests sent, and whether ``n`` was honoured.
+
+        ``first`` numbers the samples already drawn, so each request gets its own seed offset.
+        """
+        choices, requests = [], 0
+        if self.native_n:
+            try:
+                r = request(n, first)
+                requests += 1
+                choices = [(c.message.content or "", c.finish_reason) for c in r.choices]
+            except Exception as e:
+                if not _n_unsupported(e):
+                    raise
+                self.native_n = False
+            if len(choices) < n and choices:
+                # Compatible servers that silently ignore n return a single choice
+                self.native_n = False
+        missing = n - len(choices)
+        if missing > 0:
+            # Parallel single calls need distinct seeds, or they would all return the same sample
+            offsets = range(first + len(choices), first + n)
+            responses = list(self._pool.map(lambda k: request(1, k), offsets))
+            requests += missing
+            choices += [(r.choices[0].message.content or "", r.choices[0].finish_reason) for r in responses]
+        return choices, requests, missing <= 0
+
+    def _draw(self, request, n: int, first: int, samples: Samples, bad: list[tuple[str, str | None]]) -> int:
+        """Add ``n`` usable completions to ``samples``, replacing the dropped ones; returns the next seed offset."""
+        for _ in range(1 + TOP_UP_ROUNDS):
+            choices, requests, native = self._choices(request, n, first)
+            first += n
+            samples.requests += requests
+            samples.native_n = samples.native_n and native
+            n = 0
+            for text, finish_reason in choices:
+                value, reparsed = _value(text, finish_reason)
+                if value is None:
+                    bad.append((text, finish_reason))
+                    samples.dropped += 1
+                    n += 1
+                    continue
+                samples.values.append(value)
+                samples.texts.append(text)
+                samples.reparsed += reparsed
+            if not n or all(finish_reason == "content_filter" for _, finish_reason in choices):
+                break  # done, or the filter stopped every completion: more samples would be stopped too
+        return first
+
+    def predict(self, request) -> Samples:
+        """Sample and aggregate; ``request(n, seed_offset)`` sends one request for ``n`` completions."""
+        self.images += 1
+        samples, bad = Samples(values=[], texts=[]), []
+        first = self._draw(request, self.samples, 0, samples, bad)
+        values = samples.values
+        if (
+            self.adapt_std is not None
+            and len(values) >= 2
+            and statistics.stdev(values) > self.adapt_std
+            and self.max_samples > len(values)
+        ):
+            self.extra_rounds += 1
+            self._draw(request, self.max_samples - len(values), first, samples, bad)
+
+        if not values:
+            if all(finish_reason == "content_filter" for _, finish_reason in bad):
+                raise ContentFiltered("\n".join(text for text, _ in bad))
+            answers = "\n".join(f"--- sample {i} ---\n{t.strip()}" for i, (t, _) in enumerate(bad, 1))
+            raise ResponseParseError("Ki-67 value not found.", answers)
+        samples.index = round(aggregate(values, self.method, self.trim), 2)
+        samples.std = statistics.stdev(values) if len(values) >= 2 else 0.0
+        samples.spread = max(values) - min(values)
+        return samples
+
+    def summary(self) -> str:
+        mode = "n-completion requests" if self.native_n else "parallel single requests"
+        return (
+            f"{self.samples} samples per image ({self.method}) via {mode}, "
+            f"{self.extra_rounds}/{self.images} images re-sampled for high spread"
+        )
@@ -0,0 +1,192 @@
+import math
+import random
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+
+from ki67_core import IMAGE_EXTENSIONS, count_true_cells, ki67_index
+
+# Clinical Ki-67 categories: low (≤5%), intermediate (6-29%), high (≥30%)
+LOW_MAX, HIGH_MIN = 5, 30
+BIN_NAMES = ("≤5", "6-29", "≥30")
+DENSITY_NAMES = {1: ("all",), 2: ("sparse", "dense"), 3: ("sparse", "medium", "dense")}
+VAR_MIN = 5  # results a stratum needs before its own error variance is trusted on its own
+
+
+def load_annotations(dataset: Path) -> tuple[list[Path], np.ndarray, np.ndarray]:
+    """Images with a JSON annotation, their true Ki-67 index and their annotated cell count."""
+    images, true, cells = [], [], []
+    for p in sorted(dataset.iterdir()):
+        if p.suffix.lower() in IMAGE_EXTENSIONS and p.with_suffix(".json").is_file():
+            pos, neg = count_true_cells(p.with_suffix(".json"))
+            images.append(p)
+            true.append(ki67_index(pos, neg))
+            cells.append(pos + neg)
+    return images, np.array(true, dtype=float), np.array(cells, dtype=float)
+
+
+@dataclass
+class Stratum:
+    name: str
+    members: list[int]  # dataset indices, shuffled; taken from the front
+    taken: int = 0  # members handed out so far, answered or not
+    abs_err: list[float] = field(default_factory=list)
+    sq_err: list[float] = field(default_factory=list)
+
+    @property
+    def size(self) -> int:
+        return len(self.members)
+
+    @property
+    def left(self) -> int:
+        return self.size - self.taken
+
+    def take(self, k: int) -> list[int]:
+        picked = self.members[self.taken : self.taken + k]
+        self.taken += len(picked)
+        return picked
+
+
+@dataclass
+class Estimate:
+    """Full-dataset metrics estimated from the strata evaluated so far; ``*_half`` are CI half-widths."""
+
+    images: int
+    mae: float
+    mae_half: float
+    mse: float
+    mse_half: float
+    r2: float
+    r2_half: float
+
+    @property
+    def rmse_interval(self) -> tuple[float, float]:
+        return math.sqrt(max(0.0, self.mse - self.mse_half)), math.sqrt(self.mse + self.mse_half)
+
+
+class StratifiedSampler:
+    """Stratified sampling of a dataset for estimating MAE, RMSE and R² with few predictions.
+
+    Images are grouped by true Ki-67 bin and by cell-density level (quantiles of the annotated
+    cell count). The metrics are stratified means of |error| and error², weighted by stratum
+    size, with a finite-population correction, so evaluating every image gives the exact
+    full-run values with a zero-width interval. R² uses the true-value variance of the whole
+    dataset, which the annotations give without any prediction.
+
+    Every round is drawn in proportion to stratum size, after a pilot round that takes a few
+    images from each stratum so that small strata have an error variance too. Strata with fewer
+    than VAR_MIN results borrow the pooled error variance when it is larger, so a few lucky
+    images cannot make a stratum look settled.
+    """
+
+    def __init__(self, true: np.ndarray, cells: np.ndarray, density_levels: int = 3, seed: int = 64):
+        self.true = true
+        self.n = len(true)
+        self.var_true = float(np.var(true)) if self.n else 0.0
+        levels = max(1, min(density_levels, max(DENSITY_NAMES)))
+        true_bins = (true > LOW_MAX).astype(int) + (true >= HIGH_MIN)
+        # Quantile edges of the cell count; ties at an edge go to the lower level
+        edges = np.quantile(cells, np.arange(1, levels) / levels) if self.n else []
+        density = np.searchsorted(edges, cells, side="left")
+        rng = random.Random(seed)
+        self.strata: list[Stratum] = []
+        self.stratum_of = np.empty(self.n, dtype=int)
+        for b, bin_name in enumerate(BIN_NAMES):
+            for d, density_name in enumerate(DENSITY_NAMES[levels]):
+                members = np.flatnonzero((true_bins == b) & (density == d)).tolist()
+                if not members:
+                    continue
+                rng.shuffle(members)
+                self.stratum_of[members] = len(self.strata)
+                self.strata.append(Stratum(f"{bin_name} / {density_name}", members))
+
+    # ── Allocation ───────────────────────────────────────────────────────────
+
+    def pilot(self, per_stratum: int) -> list[int]:
+        """The first round: ``per_stratum`` images from every stratum (all of the smaller ones)."""
+        return [i for s in self.strata for i in s.take(per_stratum)]
+
+    def draw(self, size: int) -> list[int]:
+        """``size`` more images, each from the stratum furthest below its share of the dataset.
+
+        Allocation stays proportional to stratum size rather than following the error variances
+        seen so far: steering towards noisy strata undersamples the ones whose first results
+        happen to look calm, which biased the MAE low and left 95% intervals covering the full-run
+        value only ~87% of the time in simulation.
+        """
+        planned = [s.taken for s in self.strata]
+        total = sum(planned) + size
+        counts = [0] * len(self.strata)
+        for _ in range(size):
+            open_strata = [h for h, s in enumerate(self.strata) if planned[h] < s.size]
+            if not open_strata:
+                break
+            h = max(open_strata, key=lambda h: total * self.strata[h].size / self.n - planned[h])
+            planned[h] += 1
+            counts[h] += 1
+        return [i for s, k in zip(self.strata, counts) for i in s.take(k)]
+
+    @property
+    def exhausted(self) -> bool:
+        return all(s.left == 0 for s in self.strata)
+
+    # ── Results and estimate ─────────────────────────────────────────────────
+
+    def add(self, index: int, pred: float) -> None:
+        err = pred - self.true[index]
+        s = self.strata[self.stratum_of[index]]
+        s.abs_err.append(abs(err))
+        s.sq_err.append(err * err)
+
+    def _pooled_variances(self) -> tuple[float, float]:
+        abs_err = [e for s in self.strata for e in s.abs_err]
+        sq_err = [e for s in self.strata for e in s.sq_err]
+        if len(abs_err) < 2:
+            return math.inf, math.inf
+        return float(np.var(abs_err, ddof=1)), float(np.var(sq_err, ddof=1))
+
+    @staticmethod
+    def _variances(s: Stratum, pooled_abs: float, pooled_sq: float) -> tuple[float, float]:
+        n = len(s.abs_err)
+        own_abs = float(np.var(s.abs_err, ddof=1)) if n >= 2 else math.inf
+        own_sq = float(np.var(s.sq_err, ddof=1)) if n >= 2 else math.inf
+        if n >= VAR_MIN:
+            return own_abs, own_sq
+        # Few results: the larger of the stratum's and the pooled variance (pooled alone below 2)
+        return (
+            max(own_abs, pooled_abs) if n >= 2 else pooled_abs,
+            max(own_sq, pooled_sq) if n >= 2 else pooled_sq,
+        )
+
+    def estimate(self, z: float) -> Estimate:
+        pooled_abs, pooled_sq = self._pooled_variances()
+        answered = sum(len(s.abs_err) for s in self.strata)
+        all_abs = [e for s in self.strata for e in s.abs_err]
+        all_sq = [e for s in self.strata for e in s.sq_err]
+        if not answered:
+            return Estimate(0, math.nan, math.inf, math.nan, math.inf, math.nan, math.inf)
+        mae = mse = var_mae = var_mse = 0.0
+        for s in self.strata:
+            w = s.size / self.n
+            n = len(s.abs_err)
+            if n:
+                mae += w * float(np.mean(s.abs_err))
+                mse += w * float(np.mean(s.sq_err))
+            else:
+                # No result yet (e.g. every request failed): the pooled mean stands in
+                mae += w * float(np.mean(all_abs))
+                mse += w * float(np.mean(all_sq))
+            if n == s.size:
+                continue  # stratum fully evaluated: its mean is exact
+            var_abs, var_sq = self._variances(s, pooled_abs, pooled_sq)
+            fpc = (1 - n / s.size) / max(n, 1)
+            var_mae += w * w * fpc * var_abs
+            var_mse += w * w * fpc * var_sq
+        mae_half = z * math.sqrt(var_mae)
+        mse_half = z * math.sqrt(var_mse)
+        if self.var_true:
+            r2, r2_half = 1 - mse / self.var_true, mse_half / self.var_true
+        else:
+            r2, r2_half = math.nan, math.inf
+        return Estimate(answered, mae, mae_half, mse, mse_half, r2, r2_half)
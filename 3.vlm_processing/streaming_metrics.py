@@ -0,0 +1,120 @@
+import json
+import math
+import os
+import time
+from pathlib import Path
+
+
+class RunningMetrics:
+    """Online MAE / MSE / R² and throughput, updated in O(1) per result."""
+
+    def __init__(self, total: int = 0):
+        self.total = total
+        self.n = 0
+        self.failed = 0
+        self.resumed = 0
+        self.abs_err_sum = 0.0
+        self.sq_err_sum = 0.0
+        # Welford accumulators for the variance of the true values (R² denominator)
+        self.true_mean = 0.0
+        self.true_m2 = 0.0
+        self.started = time.monotonic()
+        self._last_status = 0.0
+
+    def update(self, true: float, pred: float) -> None:
+        err = pred - true
+        self.n += 1
+        self.abs_err_sum += abs(err)
+        self.sq_err_sum += err * err
+        delta = true - self.true_mean
+        self.true_mean += delta / self.n
+        self.true_m2 += delta * (true - self.true_mean)
+
+    def resume(self, true: float, pred: float) -> None:
+        """Fold in a result from a previous session without counting it towards throughput."""
+        self.update(true, pred)
+        self.resumed += 1
+
+    def record_failure(self) -> None:
+        self.failed += 1
+
+    @property
+    def done(self) -> int:
+        return self.n + self.failed
+
+    @property
+    def mae(self) -> float:
+        return self.abs_err_sum / self.n if self.n else math.nan
+
+    @property
+    def mse(self) -> float:
+        return self.sq_err_sum / self.n if self.n else math.nan
+
+    @property
+    def rmse(self) -> float:
+        return math.sqrt(self.mse) if self.n else math.nan
+
+    @property
+    def r2(self) -> float:
+        # Same definition as sklearn.metrics.r2_score: 1 - SSE / SST
+        if self.n < 2 or self.true_m2 == 0:
+            return math.nan
+        return 1.0 - self.sq_err_sum / self.true_m2
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started
+
+    @property
+    def rate(self) -> float:
+        """Images handled per second in this session (successes and failures)."""
+        return (self.done - self.resumed) / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self) -> float:
+        remaining = max(self.total - self.done, 0)
+        return remaining / self.rate if self.rate > 0 else math.nan
+
+    def progress_line(self) -> str:
+        eta = "--" if math.isnan(self.eta) else _format_seconds(self.eta)
+        return (
+            f"[{self.done}/{self.total}] "
+            f"MAE {self.mae:.2f}  RMSE {self.rmse:.2f}  R² {self.r2:.3f}  "
+            f"{self.rate:.2f} img/s  ETA {eta}  failed {self.failed}"
+        )
+
+    def snapshot(self) -> dict:
+        def clean(v: float) -> float | None:
+            return None if math.isnan(v) else round(v, 4)
+
+        return {
+            "total": self.total,
+            "done": self.done,
+            "scored": self.n,
+            "failed": self.failed,
+            "mae": clean(self.mae),
+            "mse": clean(self.mse),
+            "rmse": clean(self.rmse),
+            "r2": clean(self.r2),
+            "images_per_second": round(self.rate, 4),
+            "elapsed_seconds": round(self.elapsed, 1),
+            "eta_seconds": clean(self.eta),
+            "updated": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+    def write_status(self, path: Path, every: float = 10.0, force: bool = False) -> None:
+        """Rewrite the JSON status file at most once per ``every`` seconds."""
+        now = time.monotonic()
+        if not force and now - self._last_status < every:
+            return
+        self._last_status = now
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(json.dumps(self.snapshot(), indent=2), encoding="utf-8")
+        os.replace(tmp, path)
+
+
+def _format_seconds(seconds: float) -> str:
+    seconds = int(seconds)
+    h, rem = divmod(seconds, 3600)
+    m, s = divmod(rem, 60)
+    return f"{h}h{m:02d}m" if h else f"{m}m{s:02d}s"
@@ -0,0 +1,222 @@
+"""Structured JSONL events and Prometheus text metrics for the runners.
+
+Events are one JSON object per line (``ts``, ``run``, ``event`` and the event's fields), so a
+long run can be tailed or loaded into pandas. Metrics use the Prometheus text exposition
+format and are served on ``GET /metrics`` by a small local HTTP server, or by the prediction
+service itself.
+"""
+import bisect
+import json
+import math
+import os
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 16, 32, 64)
+CONNECTION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+
+# name: (type, help, histogram buckets)
+METRICS = {
+    "ki67_requests_total": ("counter", "API requests by model and outcome (ok, truncated, error).", None),
+    "ki67_retries_total": ("counter", "Requests repeated after a truncated answer or a hedge.", None),
+    "ki67_tokens_total": ("counter", "Tokens reported by the API, by kind (prompt, completion).", None),
+    "ki67_cost_usd_total": ("counter", "Estimated spend in USD.", None),
+    "ki67_images_total": (
+        "counter",
+        "Images handled, by outcome (vlm, cascade, dedup, cached, coalesced, failed, parse_failure).",
+        None,
+    ),
+    "ki67_request_duration_seconds": ("histogram", "API request latency.", LATENCY_BUCKETS),
+    "ki67_connections_total": ("counter", "Requests by connection (reused or new) and HTTP version.", None),
+    "ki67_pool_wait_seconds": ("histogram", "Wait for a pooled connection before sending.", CONNECTION_BUCKETS),
+    "ki67_handshake_seconds": ("histogram", "TCP connect plus TLS handshake of new connections.", CONNECTION_BUCKETS),
+}
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in sorted(labels.items())) + "}"
+
+
+def _number(v: float) -> str:
+    if math.isnan(v):
+        return "NaN"
+    if math.isinf(v):
+        return "+Inf" if v > 0 else "-Inf"
+    return repr(float(v)) if not float(v).is_integer() else str(int(v))
+
+
+class Telemetry:
+    """Event log plus in-process counters, histograms and gauges (all thread-safe)."""
+
+    def __init__(self, event_path: str | Path | None = None, run: str = ""):
+        self.run = run
+        self._lock = threading.Lock()
+        self._events = open(event_path, "a", encoding="utf-8", buffering=1) if event_path else None
+        self._counters: dict[tuple[str, tuple], float] = {}
+        self._histograms: dict[tuple[str, tuple], list] = {}  # [bucket counts..., sum, count]
+        self._gauges: dict[str, tuple[str, object]] = {}  # name: (help, value or callable)
+        self._server = None
+
+    def event(self, name: str, **fields) -> None:
+        if self._events is None:
+            return
+        record = {"ts": datetime.now().isoformat(timespec="milliseconds"), "run": self.run, "event": name, **fields}
+        line = json.dumps(record, default=str)
+        with self._lock:
+            if self._events is not None:  # close() may have run since the check above
+                self._events.write(line + "\n")
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        buckets = METRICS[name][2]
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            h = self._histograms.get(key)
+            if h is None:
+                h = self._histograms[key] = [0] * (len(buckets) + 1) + [0.0, 0]
+            h[bisect.bisect_left(buckets, value)] += 1
+            h[-2] += value
+            h[-1] += 1
+
+    def gauge(self, name: str, value, help: str) -> None:
+        """Set a gauge; ``value`` may be a callable, read on every scrape."""
+        with self._lock:
+            self._gauges[name] = (help, value)
+
+    # ── API request bookkeeping shared by the runners ──
+
+    def request_started(self, image: str, model: str, **fields) -> None:
+        self.event("request_start", image=image, model=model, **fields)
+
+    def request_finished(
+        self, image: str, model: str, response, latency: float, cost: float | None = None, connection=None,
+    ) -> None:
+        choices = response.choices or []
+        finish = [c.finish_reason for c in choices]
+        outcome = "truncated" if "length" in finish else "ok"
+        usage = response.usage
+        prompt = getattr(usage, "prompt_tokens", 0) or 0
+        completion = getattr(usage, "completion_tokens", 0) or 0
+        conn = {}
+        if connection is not None:
+            conn = {
+                "reused": connection.reused, "http_version": connection.http_version,
+                "queue_wait_s": round(connection.queue_wait, 4), "handshake_s": round(connection.handshake, 4),
+            }
+            self.inc(
+                "ki67_connections_total", model=model, reused="yes" if connection.reused else "no",
+                http_version=connection.http_version,
+            )
+            self.observe("ki67_pool_wait_seconds", connection.queue_wait, model=model)
+            if not connection.reused:
+                self.observe("ki67_handshake_seconds", connection.handshake, model=model)
+        self.event(
+            "request_end", image=image, model=model, latency_s=round(latency, 3), outcome=outcome,
+            finish_reason=finish[0] if len(finish) == 1 else finish,
+            prompt_tokens=prompt, completion_tokens=completion, cost_usd=cost, **conn,
+        )
+        self.inc("ki67_requests_total", model=model, outcome=outcome)
+        self.inc("ki67_tokens_total", prompt, model=model, kind="prompt")
+        self.inc("ki67_tokens_total", completion, model=model, kind="completion")
+        if cost is not None:
+            self.inc("ki67_cost_usd_total", cost, model=model)
+        self.observe("ki67_request_duration_seconds", latency, model=model)
+
+    def request_failed(self, image: str, model: str, error: Exception, latency: float) -> None:
+        self.event(
+            "request_error", image=image, model=model, latency_s=round(latency, 3),
+            error=type(error).__name__, status=getattr(error, "status_code", None), message=str(error)[:300],
+        )
+        self.inc("ki67_requests_total", model=model, outcome="error")
+        self.observe("ki67_request_duration_seconds", latency, model=model)
+
+    def retried(self, image: str, model: str, reason: str, **fields) -> None:
+        self.event("retry", image=image, model=model, reason=reason, **fields)
+        self.inc("ki67_retries_total", model=model, reason=reason)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text format (version 0.0.4)."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {k: list(v) for k, v in self._histograms.items()}
+            gauges = dict(self._gauges)
+
+        lines = []
+        for name, (kind, help, buckets) in METRICS.items():
+            series = [(k, v) for k, v in (counters if kind == "counter" else histograms).items() if k[0] == name]
+            if not series:
+                continue
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            for (_, labels), v in sorted(series):
+                labels = dict(labels)
+                if kind == "counter":
+                    lines.append(f"{name}{_labels(labels)} {_number(v)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip([*buckets, math.inf], v[: len(buckets) + 1]):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels({**labels, 'le': _number(bound)})} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(v[-2])}")
+                lines.append(f"{name}_count{_labels(labels)} {v[-1]}")
+        for name, (help, value) in sorted(gauges.items()):
+            try:
+                v = value() if callable(value) else value
+            except Exception:
+                continue
+            if v is None:
+                continue
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {_number(v)}"]
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int) -> None:
+        """Expose ``GET /metrics`` on 127.0.0.1:``port`` from a daemon thread."""
+        telemetry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, fmt, *args):
+                pass
+
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                metrics_reply(self, telemetry)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True, name="metrics").start()
+
+    def close(self) -> None:
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+        with self._lock:
+            if self._events:
+                self._events.close()
+                self._events = None
+
+
+def metrics_reply(handler: BaseHTTPRequestHandler, telemetry: Telemetry) -> None:
+    body = telemetry.render().encode()
+    handler.send_response(200)
+    handler.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+    handler.send_header("Content-Length", str(len(body)))
+    handler.end_headers()
+    handler.wfile.write(body)
+
+
+def metrics_port() -> int | None:
+    port = os.getenv("KI67_METRICS_PORT")
+    return int(port) if port else None
@@ -0,0 +1,164 @@
+import csv
+import hashlib
+import math
+import os
+import threading
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+
+HISTORY_FIELDS = ["timestamp", "model", "prompt", "completion_tokens", "max_tokens", "finish_reason"]
+DEFAULT_MAX_TOKENS = 1024
+
+
+def prompt_key(*prompts: str) -> str:
+    """Short fingerprint of the prompt texts; editing a prompt starts a new length distribution."""
+    return hashlib.sha1("\0".join(prompts).encode("utf-8")).hexdigest()[:10]
+
+
+class TokenBudget:
+    """``max_tokens`` learned from the completion lengths observed for one model and prompt.
+
+    Until ``min_samples`` lengths are known the fixed default is used. Afterwards the limit is
+    the ``percentile`` of the observed lengths times ``margin``, never below ``floor``. A
+    response truncated at the limit (``finish_reason == "length"``) is retried with twice the
+    limit, up to ``ceiling``. Truncated lengths are censored, so they are not learned from.
+    With ``n`` completions per request, each completion's length is learned on its own, and
+    only a request truncated in every completion is retried: the caller replaces the others.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        prompt: str,
+        history_path: Path | None = None,
+        seed_paths=(),
+        seed_model: str | None = None,
+        percentile: float = 99.0,
+        margin: float = 1.25,
+        min_samples: int = 20,
+        default: int = DEFAULT_MAX_TOKENS,
+        floor: int = 128,
+        ceiling: int = 4096,
+        window: int = 1000,
+    ):
+        self.model = model
+        self.prompt = prompt
+        self.history_path = Path(history_path) if history_path else None
+        self.percentile = percentile
+        self.margin = margin
+        self.min_samples = min_samples
+        self.default = default
+        self.floor = floor
+        self.ceiling = ceiling
+        self.samples: deque[int] = deque(maxlen=window)
+        self.requests = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+
+        # Time-analysis CSVs ("output_tokens" column) seed the distribution with the rows of this
+        # model. Older CSVs have no "model" column: their rows count only when ``seed_model``
+        # declares which model wrote them
+        for path in seed_paths:
+            if Path(path).is_file():
+                with Path(path).open(newline="", encoding="utf-8") as f:
+                    for row in csv.DictReader(f):
+                        if row.get("output_tokens") and (row.get("model") or seed_model) == model:
+                            self.samples.append(int(row["output_tokens"]))
+        if self.history_path and self.history_path.is_file():
+            with self.history_path.open(newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    if row["model"] == model and row["prompt"] == prompt and row["finish_reason"] != "length":
+                        self.samples.append(int(row["completion_tokens"]))
+
+    @classmethod
+    def from_env(cls, model: str, *prompts: str) -> "TokenBudget":
+        """Budget for ``model`` and the given prompt texts, configured by KI67_MAX_TOKENS and friends.
+
+        ``KI67_MAX_TOKENS=<n>`` pins a fixed limit (truncated responses are still retried).
+        """
+        fixed = os.getenv("KI67_MAX_TOKENS", "auto")
+        default_history = Path(__file__).resolve().parent.parent / "5.results" / "completion_tokens.csv"
+        seeds = os.getenv("KI67_TOKEN_SEED", "")
+        budget = cls(
+            model,
+            prompt_key(*prompts),
+            history_path=os.getenv("KI67_TOKEN_HISTORY") or default_history,
+            seed_paths=[p for p in seeds.split(os.pathsep) if p],
+            seed_model=os.getenv("KI67_TOKEN_SEED_MODEL") or None,
+            percentile=float(os.getenv("KI67_MAX_TOKENS_PERCENTILE", "99")),
+        )
+        if fixed != "auto":
+            budget.default = int(fixed)
+            budget.min_samples = math.inf
+        return budget
+
+    def limit(self) -> int:
+        with self._lock:
+            data = sorted(self.samples)
+        if len(data) < self.min_samples:
+            return self.default
+        k = (len(data) - 1) * self.percentile / 100
+        lo, hi = int(k), min(int(k) + 1, len(data) - 1)
+        p = data[lo] + (data[hi] - data[lo]) * (k - lo)
+        return min(max(math.ceil(p * self.margin), self.floor), self.ceiling)
+
+    def observe(self, completion_tokens: int, max_tokens: int, finish_reason: str) -> None:
+        with self._lock:
+            if finish_reason != "length":
+                self.samples.append(completion_tokens)
+            if self.history_path:
+                self.history_path.parent.mkdir(parents=True, exist_ok=True)
+                new_file = not self.history_path.is_file()
+                with self.history_path.open("a", newline="", encoding="utf-8") as f:
+                    writer = csv.writer(f)
+                    if new_file:
+                        writer.writerow(HISTORY_FIELDS)
+                    writer.writerow([
+                        datetime.now().isoformat(timespec="seconds"), self.model, self.prompt,
+                        completion_tokens, max_tokens, finish_reason,
+                    ])
+
+    @staticmethod
+    def choice_lengths(r) -> list[tuple[int, str]]:
+        """(completion_tokens, finish_reason) per choice of a response.
+
+        The usage only has the total over all choices, so with ``n > 1`` it is split in
+        proportion to each choice's text length; a mean would hide the long completions
+        that the percentile is there to cover.
+        """
+        choices = r.choices or []
+        total = r.usage.completion_tokens
+        if len(choices) <= 1:
+            finish = choices[0].finish_reason if choices else None
+            return [(total, "length" if finish == "length" else "stop")]
+        chars = [len(c.message.content or "") for c in choices]
+        weights = [n / sum(chars) for n in chars] if sum(chars) else [1 / len(choices)] * len(choices)
+        return [
+            (math.ceil(total * w), "length" if c.finish_reason == "length" else "stop")
+            for c, w in zip(choices, weights)
+        ]
+
+    def call(self, fn):
+        """Run ``fn(max_tokens)`` (a complete request), retrying with a larger limit on truncation."""
+        max_tokens = self.limit()
+        while True:
+            r = fn(max_tokens)
+            self.requests += 1
+            choices = r.choices or []
+            truncated = [c.finish_reason == "length" for c in choices]
+            if r.usage is not None:
+                for tokens, finish_reason in self.choice_lengths(r):
+                    self.observe(tokens, max_tokens, finish_reason)
+            # Some of n completions truncated: the caller drops and replaces just those
+            if not truncated or not all(truncated) or max_tokens >= self.ceiling:
+                return r
+            self.retries += 1
+            max_tokens = min(max_tokens * 2, self.ceiling)
+
+    def summary(self) -> str:
+        learned = "fixed" if self.min_samples == math.inf else f"learned from {len(self.samples)} completions"
+        return (
+            f"max_tokens {self.limit()} ({learned}), "
+            f"{self.retries}/{self.requests} requests retried after truncation"
+        )
@@ -0,0 +1,193 @@
+"""One pooled HTTP transport for every OpenAI client in the process.
+
+The client is an ``httpx.Client`` with tuned pool limits, keep-alive and timeouts, and
+optionally HTTP/2 (``KI67_HTTP2=1``, needs the ``h2`` package). Each request is traced
+through httpcore's trace extension to record whether it reused a connection, how long it
+waited for one and how long the TCP connect and TLS handshake took when it opened one.
+
+HTTP/2 is off by default: httpcore's synchronous HTTP/2 connection can open streams out of
+order when several threads share it, which servers reject as a protocol error (28 of 400
+requests failed at concurrency 16 against the TLS mock). Pooled HTTP/1.1 keep-alive
+connections are safe at any concurrency.
+"""
+import os
+import ssl
+import statistics
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+
+@dataclass
+class TransportConfig:
+    http2: bool = False
+    max_connections: int = 32
+    max_keepalive: int = 16
+    keepalive_expiry: float = 90.0  # seconds an idle connection is kept open
+    connect_timeout: float = 10.0
+    read_timeout: float = 120.0
+    pool_timeout: float = 30.0  # seconds a request may wait for a free connection
+    ca_bundle: str | None = None
+
+    @classmethod
+    def from_env(cls) -> "TransportConfig":
+        def env(name: str, cast, default):
+            value = os.getenv(name)
+            return cast(value) if value else default
+
+        return cls(
+            http2=env("KI67_HTTP2", lambda v: v not in ("0", "false", "no"), cls.http2),
+            max_connections=env("KI67_MAX_CONNECTIONS", int, cls.max_connections),
+            max_keepalive=env("KI67_MAX_KEEPALIVE", int, cls.max_keepalive),
+            keepalive_expiry=env("KI67_KEEPALIVE_EXPIRY", float, cls.keepalive_expiry),
+            connect_timeout=env("KI67_CONNECT_TIMEOUT", float, cls.connect_timeout),
+            read_timeout=env("KI67_READ_TIMEOUT", float, cls.read_timeout),
+            pool_timeout=env("KI67_POOL_TIMEOUT", float, cls.pool_timeout),
+            ca_bundle=os.getenv("KI67_CA_BUNDLE") or None,
+        )
+
+
+@dataclass
+class ConnectionInfo:
+    """How one request got its connection (all times in seconds)."""
+
+    reused: bool
+    http_version: str
+    queue_wait: float  # request start to first use of a connection, handshakes excluded
+    connect: float  # TCP connect, 0 on a reused connection
+    tls: float  # TLS handshake, 0 on a reused connection
+    ttfb: float  # request start to response headers
+
+    @property
+    def handshake(self) -> float:
+        return self.connect + self.tls
+
+
+class _Trace:
+    """httpcore trace callback for one request."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first = None
+        self.marks: dict[str, float] = {}
+
+    def __call__(self, name: str, info: dict) -> None:
+        now = time.perf_counter()
+        if self.first is None:
+            self.first = now
+        self.marks[name] = now
+
+    def span(self, prefix: str) -> float:
+        started, done = self.marks.get(f"{prefix}.started"), self.marks.get(f"{prefix}.complete")
+        return done - started if started is not None and done is not None else 0.0
+
+    def finish(self, http_version: str) -> ConnectionInfo:
+        now = time.perf_counter()
+        connect = self.span("connection.connect_tcp")
+        tls = self.span("connection.start_tls")
+        first = self.first if self.first is not None else now
+        return ConnectionInfo(
+            reused="connection.connect_tcp.started" not in self.marks,
+            http_version=http_version,
+            queue_wait=max(0.0, first - self.start),
+            connect=connect,
+            tls=tls,
+            ttfb=now - self.start,
+        )
+
+
+class TransportStats:
+    """Connection metrics of the shared client, summed over the process."""
+
+    def __init__(self, keep: int = 10_000):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.requests = 0
+        self.reused = 0
+        self.http2 = 0
+        self.handshakes: deque[float] = deque(maxlen=keep)
+        self.queue_waits: deque[float] = deque(maxlen=keep)
+
+    def record(self, info: ConnectionInfo) -> None:
+        self._local.last = info
+        with self._lock:
+            self.requests += 1
+            self.reused += info.reused
+            self.http2 += info.http_version == "HTTP/2"
+            self.queue_waits.append(info.queue_wait)
+            if not info.reused:
+                self.handshakes.append(info.handshake)
+
+    def last(self) -> ConnectionInfo | None:
+        """Connection of the last request completed by the calling thread."""
+        return getattr(self._local, "last", None)
+
+    def summary(self) -> str:
+        with self._lock:
+            if not self.requests:
+                return "no requests"
+            opened = self.requests - self.reused
+            waits = sorted(self.queue_waits)
+            p95 = waits[min(len(waits) - 1, int(0.95 * len(waits)))]
+            handshake = statistics.fmean(self.handshakes) * 1000 if self.handshakes else 0.0
+            return (
+                f"{self.requests} requests over {opened} new connections "
+                f"({self.reused / self.requests:.0%} reused, {self.http2 / self.requests:.0%} HTTP/2), "
+                f"handshake mean {handshake:.1f} ms, queue wait p95 {p95 * 1000:.1f} ms"
+            )
+
+
+STATS = TransportStats()
+_http_client = None
+_http_client_lock = threading.Lock()
+
+
+def _has_h2() -> bool:
+    try:
+        import h2  # noqa: F401  (httpx only needs it importable)
+    except ImportError:
+        return False
+    return True
+
+
+def build_http_client(config: TransportConfig | None = None, stats: TransportStats | None = STATS):
+    """A new ``httpx.Client`` configured from ``config``, tracing into ``stats``."""
+    import httpx
+
+    config = config or TransportConfig.from_env()
+    http2 = config.http2 and _has_h2()
+    if config.http2 and not http2:
+        print("HTTP/2 needs the 'h2' package (pip install h2); using HTTP/1.1.")
+
+    def on_request(request):
+        request.extensions["trace"] = _Trace()
+
+    def on_response(response):
+        trace = response.request.extensions.get("trace")
+        if stats is not None and isinstance(trace, _Trace):
+            stats.record(trace.finish(response.http_version))
+
+    return httpx.Client(
+        http1=True,
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=config.max_connections,
+            max_keepalive_connections=config.max_keepalive,
+            keepalive_expiry=config.keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(
+            config.read_timeout, connect=config.connect_timeout, pool=config.pool_timeout,
+        ),
+        verify=ssl.create_default_context(cafile=config.ca_bundle) if config.ca_bundle else True,
+        event_hooks={"request": [on_request], "response": [on_response]},
+    )
+
+
+def http_client():
+    """The process-wide client passed to ``OpenAI(http_client=...)``."""
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            _http_client = build_http_client()
+        return _http_client
@@ -0,0 +1,195 @@
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+
+from ki67_core import ResponseParseError
+
+# Retry classes of a failed image
+TRANSIENT = "transient"  # timeouts, connection errors, 429 and 5xx: retried later with backoff
+PARSE = "parse"  # an answer without a Ki-67 value: re-parsed and re-asked in place, never resent
+PERMANENT = "permanent"  # content filter, other 4xx, unreadable files: straight to the dead-letter file
+BUDGET = "budget"  # still queued when the run stopped at KI67_BUDGET_USD; a resumed run sends it
+
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+class ContentFiltered(RuntimeError):
+    """The API withheld or cut the answer for policy reasons; resending the image cannot help."""
+
+    def __init__(self, text: str = ""):
+        super().__init__("Answer stopped by the content filter.")
+        self.text = text
+
+
+def classify(error: BaseException) -> str:
+    if isinstance(error, ResponseParseError):
+        return PARSE
+    if isinstance(error, ContentFiltered):
+        return PERMANENT
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return TRANSIENT if status in RETRYABLE_STATUS or status >= 500 else PERMANENT
+    import openai  # already loaded by the client that raised
+
+    if isinstance(error, (openai.APIConnectionError, TimeoutError, ConnectionError)):
+        return TRANSIENT  # openai.APITimeoutError is an APIConnectionError
+    return PERMANENT
+
+
+def raw_response(error: BaseException) -> str:
+    """The answer or error body behind a failure, as far as the exception kept it."""
+    text = getattr(error, "text", None)
+    if text:
+        return text
+    response = getattr(error, "response", None)
+    try:
+        return response.text if response is not None else ""
+    except Exception:  # a streamed body that was never read
+        return ""
+
+
+def retry_after(error: BaseException) -> float | None:
+    """Seconds from a ``Retry-After`` header on the failed response, if any."""
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+@dataclass
+class WorkItem:
+    name: str
+    attempt: int = 0  # failed attempts so far
+    ready_at: float = 0.0  # monotonic time before which a retry is not sent
+    answer: str | None = None  # answer awaiting a re-ask that failed transiently; retried without the image
+
+
+class WorkQueue:
+    """Fresh images first, in order; transient failures wait behind them until their backoff ends."""
+
+    def __init__(self, names):
+        self._fresh = deque(WorkItem(n) for n in names)
+        self._retries: list[WorkItem] = []
+
+    def __len__(self) -> int:
+        return len(self._fresh) + len(self._retries)
+
+    def retry(self, item: WorkItem, delay: float) -> None:
+        item.attempt += 1
+        item.ready_at = time.monotonic() + delay
+        self._retries.append(item)
+
+    def drain(self) -> list[WorkItem]:
+        """Every item still queued, fresh ones first; the queue is left empty."""
+        items = [*self._fresh, *sorted(self._retries, key=lambda i: i.ready_at)]
+        self._fresh.clear()
+        self._retries.clear()
+        return items
+
+    def pop(self) -> WorkItem | None:
+        """The next image to send, sleeping when only retries that are not due yet remain."""
+        if self._fresh:
+            return self._fresh.popleft()
+        if not self._retries:
+            return None
+        # Earliest due first; among due retries, the ones with fewer failed attempts
+        item = min(self._retries, key=lambda i: (max(i.ready_at, time.monotonic()), i.attempt))
+        self._retries.remove(item)
+        wait = item.ready_at - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        return item
+
+
+class RetryPolicy:
+    """How many times and how late transient failures are retried, and whether parse failures are re-asked."""
+
+    def __init__(
+        self,
+        max_retries: int = 3,
+        backoff: float = 2.0,
+        max_backoff: float = 60.0,
+        reask: bool = True,
+        sdk_retries: int = 0,
+    ):
+        self.max_retries = max_retries
+        # In-place retries of the openai client, which sleep without the queue knowing; off by default
+        self.sdk_retries = sdk_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.reask = reask
+        self.retries = 0
+        self.recovered = 0  # images that succeeded after a transient retry
+        self.reparsed = 0
+        self.reasked = 0
+
+    @classmethod
+    def from_env(cls) -> "RetryPolicy":
+        return cls(
+            max_retries=int(os.getenv("KI67_RETRY_MAX", "3")),
+            backoff=float(os.getenv("KI67_RETRY_BACKOFF", "2")),
+            max_backoff=float(os.getenv("KI67_RETRY_MAX_BACKOFF", "60")),
+            reask=os.getenv("KI67_REASK", "1") not in ("", "0"),
+            sdk_retries=int(os.getenv("KI67_SDK_RETRIES", "0")),
+        )
+
+    def should_retry(self, item: WorkItem, kind: str) -> bool:
+        return kind == TRANSIENT and item.attempt < self.max_retries
+
+    def delay(self, item: WorkItem, error: BaseException) -> float:
+        """Exponential backoff with full jitter, never shorter than the server's ``Retry-After``."""
+        self.retries += 1
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** item.attempt))
+        return max(delay, retry_after(error) or 0.0)
+
+    def summary(self, dead: int) -> str:
+        return (
+            f"{self.retries} transient retries ({self.recovered} images recovered); answers without a "
+            f"Ki-67 value: {self.reparsed} re-parsed from cell counts, {self.reasked} re-asked; "
+            f"{dead} images dead-lettered"
+        )
+
+
+class DeadLetters:
+    """JSONL file of the images a run gave up on, with the raw answer or error body."""
+
+    def __init__(self, path: Path, run: str = ""):
+        self.path = Path(path)
+        self.run = run
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def add(
+        self, image: str, kind: str, error: BaseException | str, attempts: int = 1, answer: str | None = None,
+    ) -> None:
+        record = {
+            "ts": datetime.now().isoformat(timespec="milliseconds"),
+            "run": self.run,
+            "image": image,
+            "class": kind,
+            "attempts": attempts,
+        }
+        if isinstance(error, BaseException):
+            record.update(
+                error=type(error).__name__,
+                status=getattr(error, "status_code", None),
+                message=str(error)[:500],
+                raw_response=raw_response(error),
+            )
+            if getattr(error, "answer", None):
+                record["answer"] = error.answer  # the model's answer whose re-ask failed
+        else:
+            record.update(error=error, status=None, message=error, raw_response="")
+            if answer:
+                record["answer"] = answer  # the model's answer still waiting for its re-ask
+        with self._lock, self.path.open("a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            self.count += 1
@@ -0,0 +1,120 @@
+import re
+import sys
+import time
+from pathlib import Path
+
+from response_archive import ResponseArchive
+from rescore_responses import find_archives
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "3.vlm_processing"))
+from ki67_core import extract_cell_counts_and_index, extract_predicted_index, find_predicted_index
+
+# ── Baseline parsers, copied verbatim from the scripts before they shared ki67_core ─────────────
+
+def predict_cells_parse(text: str) -> tuple[int, int, float]:
+    """4.utils/predict_cells.py: no re.S and no fallback to the last percentage."""
+    pos = int(re.search(r"Immunopositive cells?:\s*(\d+)", text, re.I).group(1)) if re.search(r"Immunopositive cells?:\s*(\d+)", text, re.I) else 0
+    neg = int(re.search(r"Immunonegative cells?:\s*(\d+)", text, re.I).group(1)) if re.search(r"Immunonegative cells?:\s*(\d+)", text, re.I) else 0
+    m = re.search(r"Ki[\s-]?67[^%]*?(\d+(?:\.\d+)?)\s*%", text, re.I)
+    ki = float(m.group(1)) if m else 0.0
+    return pos, neg, ki
+
+def time_average_parse(text: str) -> tuple[int, int, float]:
+    """4.utils/calculate_time_average.py."""
+    pos = int(re.search(r"Immunopositive cells?:\s*(\d+)", text, re.I).group(1)) if re.search(r"Immunopositive cells?:\s*(\d+)", text, re.I) else 0
+    neg = int(re.search(r"Immunonegative cells?:\s*(\d+)", text, re.I).group(1)) if re.search(r"Immunonegative cells?:\s*(\d+)", text, re.I) else 0
+    m = re.search(r"Ki[\s-]?67[^%]*?([0-9]+(?:\.[0-9]+)?)\s*%", text, re.I | re.S)
+    if m:
+        ki = float(m.group(1))
+    else:
+        p = re.findall(r"([0-9]+(?:\.[0-9]+)?)\s*%", text)
+        ki = float(p[-1]) if p else 0.0
+    return pos, neg, ki
+
+def runner_parse(text: str) -> float | None:
+    """3.vlm_processing/1.main_openai.py (2.ki67_single_image.py had the same regexes, precompiled)."""
+    m = re.search(r"Ki[\s-]?67[^%]*?([0-9]+(?:\.[0-9]+)?)\s*%", text, re.I | re.S)
+    if m:
+        return float(m.group(1))
+    perc = re.findall(r"([0-9]+(?:\.[0-9]+)?)\s*%", text)
+    if perc:
+        return float(perc[-1])
+    return None  # raised ValueError("Ki-67 value not found.")
+
+_FILL_KI67_RE = re.compile(r"Ki[\s-]?67[^%]*?([0-9]+(?:\.[0-9]+)?)\s*%", flags=re.I | re.S)
+
+def fill_parse(text: str) -> float | None:
+    """4.utils/fill_csv_from_txt.py: Ki-67 mention only, no fallback."""
+    m = _FILL_KI67_RE.search(text)
+    return float(m.group(1)) if m else None
+
+# ── What each script calls now ─────────────────────────────────────────────────
+
+def shared_runner(text: str) -> float | None:
+    try:
+        return extract_predicted_index(text)
+    except ValueError:
+        return None
+
+# Answer shapes the archives may not contain, so behaviour changes show up even when they agree
+EDGE_CASES = [
+    "Immunopositive cells: 12\nImmunonegative cells: 30\nKi-67 Index: 28.57%",
+    "Ki-67\nIndex: 28.57%",  # value on the line after the mention
+    "Immunopositive cells: 12\nImmunonegative cells: 30\nProliferation: 28.57%",  # no Ki-67 mention
+    "Ki67 index is 5 %",
+    "No estimate possible.",
+]
+
+# (script, baseline parser, the shared call that replaced it)
+CASES = [
+    ("predict_cells.py", predict_cells_parse, extract_cell_counts_and_index),
+    ("calculate_time_average.py", time_average_parse, extract_cell_counts_and_index),
+    ("1.main_openai.py", runner_parse, shared_runner),
+    ("fill_csv_from_txt.py", fill_parse, lambda t: find_predicted_index(t, fallback=False)),
+]
+
+def time_parser(fn, texts: list[str], repeat: int) -> float:
+    """Best-of-``repeat`` microseconds per response."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for t in texts:
+            fn(t)
+        best = min(best, time.perf_counter() - start)
+    return best / len(texts) * 1e6
+
+def benchmark(results_root: str, repeat: int = 5) -> None:
+    texts = [text for archive in find_archives(Path(results_root)) for _, text in ResponseArchive(archive)]
+    if not texts:
+        print("No responses found.")
+        return
+
+    print(f"Responses: {len(texts)}\n")
+    print(f"{'script':<28} {'baseline':>12} {'shared':>12} {'speed-up':>9} {'different':>10}")
+    for script, baseline, shared in CASES:
+        mismatches = sum(baseline(t) != shared(t) for t in texts)
+        old = time_parser(baseline, texts, repeat)
+        new = time_parser(shared, texts, repeat)
+        print(f"{script:<28} {old:>9.2f} µs {new:>9.2f} µs {old / new:>8.2f}x {mismatches:>10}")
+
+    print("\nEdge cases where the shared parser answers differently:")
+    changed = False
+    for script, baseline, shared in CASES:
+        for text in EDGE_CASES:
+            if baseline(text) != shared(text):
+                changed = True
+                print(f"  {script}: {text!r} -> {baseline(text)} before, {shared(text)} now")
+    if not changed:
+        print("  none")
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        print(
+            "Usage:\n"
+            "  python 4.utils/benchmark_parser.py <results_root> [<repeat>]\n"
+            "Example:\n"
+            "  python 4.utils/benchmark_parser.py 5.results"
+        )
+        sys.exit(1)
+
+    benchmark(sys.argv[1], int(sys.argv[2]) if len(sys.argv) == 3 else 5)
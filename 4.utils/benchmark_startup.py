@@ -0,0 +1,61 @@
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+SAMPLE_CSV = "5.results/4.5/bcdata/ki67_results.csv"
+SAMPLE_TXT = "5.results/4.5/bcdata/llm_responses.txt"
+SAMPLE_DIR = "1.data_access/data_sample/3.data_processed"
+
+# Offline utilities through the unified CLI, on the bundled sample results
+OFFLINE_COMMANDS = {
+    "metrics": ["metrics", SAMPLE_CSV],
+    "audit duplicates": ["audit", "duplicates", SAMPLE_CSV],
+    "audit txt": ["audit", "txt", SAMPLE_CSV, SAMPLE_TXT],
+    "audit images": ["audit", "images", SAMPLE_DIR, SAMPLE_CSV],
+    "ki": ["ki", f"{SAMPLE_DIR}/8.json"],
+}
+
+# What the same scripts used to pay at import time, for reference
+HEAVY_IMPORTS = ["sklearn.metrics", "pandas", "matplotlib.pyplot", "openai"]
+
+def time_command(cmd: list[str], repeat: int) -> float:
+    """Median wall-clock time in milliseconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(cmd, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=False)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+def benchmark(repeat: int = 10) -> None:
+    baseline = time_command([sys.executable, "-c", "pass"], repeat)
+    print(f"{'interpreter start-up':<24} {baseline:8.1f} ms")
+
+    print("\nOffline commands (python ki67.py ...)")
+    for name, args in OFFLINE_COMMANDS.items():
+        ms = time_command([sys.executable, "ki67.py", *args], repeat)
+        print(f"  {name:<22} {ms:8.1f} ms   (+{ms - baseline:.1f} ms over the interpreter)")
+
+    print("\nHeavy imports avoided")
+    for module in HEAVY_IMPORTS:
+        probe = subprocess.run([sys.executable, "-c", f"import {module}"], capture_output=True)
+        if probe.returncode != 0:
+            print(f"  {module:<22} {'not installed':>8}")
+            continue
+        ms = time_command([sys.executable, "-c", f"import {module}"], repeat)
+        print(f"  {module:<22} {ms:8.1f} ms")
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2:
+        print(
+            "Usage:\n"
+            "  python 4.utils/benchmark_startup.py [<repeat>]\n"
+            "Example:\n"
+            "  python 4.utils/benchmark_startup.py 10"
+        )
+        sys.exit(1)
+
+    benchmark(int(sys.argv[1]) if len(sys.argv) == 2 else 10)
@@ -0,0 +1,142 @@
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "3.vlm_processing"))
+from ki67_core import build_messages, image_data_url
+from transport import TransportConfig, TransportStats, build_http_client
+
+SAMPLE_IMAGE = ROOT / "1.data_access/data_sample/3.data_processed/8.jpg"
+MOCK_LATENCY = "0.05"
+
+# name: transport settings; everything else comes from KI67_* variables as in the runners
+SCENARIOS = {
+    "no keep-alive": {"http2": False, "max_keepalive": 0},
+    "HTTP/1.1 pool": {"http2": False},
+    "HTTP/2": {"http2": True},
+}
+
+def self_signed_cert(directory: Path) -> tuple[Path, Path]:
+    cert, key = directory / "cert.pem", directory / "key.pem"
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+            "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1",
+            "-keyout", str(key), "-out", str(cert),
+        ],
+        check=True, capture_output=True,
+    )
+    return cert, key
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_for(port: int, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    sys.exit(f"Mock server did not start on port {port}")
+
+def run_scenario(settings: dict, base_url: str, ca: Path, requests: int, concurrency: int) -> dict:
+    from openai import OpenAI
+
+    config = TransportConfig.from_env()
+    for name, value in settings.items():
+        setattr(config, name, value)
+    config.ca_bundle = str(ca)
+    stats = TransportStats()
+    http = build_http_client(config, stats)
+    client = OpenAI(api_key="mock", base_url=base_url, http_client=http, max_retries=0)
+    messages = build_messages("system", "user", image_data_url(SAMPLE_IMAGE.read_bytes(), ".jpg"))
+
+    def one(i: int) -> float | None:
+        start = time.perf_counter()
+        try:
+            client.chat.completions.create(model="mock", messages=messages, temperature=0, seed=i, max_tokens=256)
+        except Exception:
+            return None
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - start
+    http.close()
+
+    ok = sorted(l for l in latencies if l is not None)
+    waits = sorted(stats.queue_waits)
+    return {
+        "wall": wall,
+        "ok": len(ok),
+        "p50": statistics.median(ok) if ok else float("nan"),
+        "p95": ok[int(0.95 * (len(ok) - 1))] if ok else float("nan"),
+        "opened": stats.requests - stats.reused,
+        "reused": stats.reused / stats.requests if stats.requests else 0.0,
+        "handshake": statistics.fmean(stats.handshakes) if stats.handshakes else 0.0,
+        "queue_p95": waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+        "http2": stats.http2,
+    }
+
+def benchmark(requests: int = 400, concurrency: int = 16) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        cert, key = self_signed_cert(Path(tmp))
+        port = free_port()
+        env = {
+            **os.environ, "KI67_MOCK_TLS_CERT": str(cert), "KI67_MOCK_TLS_KEY": str(key),
+            "KI67_MOCK_LATENCY": os.getenv("KI67_MOCK_LATENCY", MOCK_LATENCY),
+        }
+        server = subprocess.Popen(
+            [sys.executable, str(ROOT / "4.utils/mock_openai_server.py"), str(port)],
+            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_for(port)
+            base_url = f"https://127.0.0.1:{port}/v1"
+            print(
+                f"{requests} requests, concurrency {concurrency}, TLS mock with "
+                f"{env['KI67_MOCK_LATENCY']} s median latency, {SAMPLE_IMAGE.stat().st_size // 1024} KB image\n"
+            )
+            print(
+                f"{'transport':<15} {'wall s':>7} {'req/s':>7} {'ok':>5} {'p50 ms':>7} {'p95 ms':>7} "
+                f"{'conns':>6} {'reused':>7} {'handshake ms':>13} {'queue p95 ms':>13}"
+            )
+            for name, settings in SCENARIOS.items():
+                r = run_scenario(settings, base_url, cert, requests, concurrency)
+                if settings["http2"] and not r["http2"]:
+                    name += " (h1)"
+                print(
+                    f"{name:<15} {r['wall']:>7.2f} {requests / r['wall']:>7.1f} {r['ok']:>5} "
+                    f"{r['p50'] * 1000:>7.1f} {r['p95'] * 1000:>7.1f} {r['opened']:>6} {r['reused']:>7.0%} "
+                    f"{r['handshake'] * 1000:>13.1f} {r['queue_p95'] * 1000:>13.1f}"
+                )
+        finally:
+            server.terminate()
+            server.wait()
+
+if __name__ == "__main__":
+    if len(sys.argv) > 3:
+        print(
+            "Usage:\n"
+            "  python 4.utils/benchmark_transport.py [<requests>] [<concurrency>]\n"
+            "Example:\n"
+            "  python 4.utils/benchmark_transport.py 400 16"
+        )
+        sys.exit(1)
+
+    benchmark(
+        int(sys.argv[1]) if len(sys.argv) >= 2 else 400,
+        int(sys.argv[2]) if len(sys.argv) == 3 else 16,
+    )
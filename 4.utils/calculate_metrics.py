@@ -2,7 +2,21 @@ import csv
 import sys
 import math
 from pathlib import Path
-from sklearn.metrics import r2_score, mean_squared_error, mean_absolute_error
+
+# Same definitions as sklearn.metrics, without importing scikit-learn for three formulas
+def r2_score(y_true: list[float], y_pred: list[float]) -> float:
+    mean_true = sum(y_true) / len(y_true)
+    ss_res = sum((t - p) ** 2 for t, p in zip(y_true, y_pred))
+    ss_tot = sum((t - mean_true) ** 2 for t in y_true)
+    if ss_tot == 0:
+        return 1.0 if ss_res == 0 else 0.0
+    return 1 - ss_res / ss_tot
+
+def mean_squared_error(y_true: list[float], y_pred: list[float]) -> float:
+    return sum((t - p) ** 2 for t, p in zip(y_true, y_pred)) / len(y_true)
+
+def mean_absolute_error(y_true: list[float], y_pred: list[float]) -> float:
+    return sum(abs(t - p) for t, p in zip(y_true, y_pred)) / len(y_true)
 
 def calculate_metrics(csv_path: str) -> None:
     csv_path = Path(csv_path)
@@ -25,15 +39,22 @@ def calculate_metrics(csv_path: str) -> None:
 
     # ── Load data ─────────────────────────────────────────────────────────────
     y_true, y_pred = [], []
+    by_source: dict[str, tuple[list[float], list[float]]] = {}
     with csv_path.open(encoding="utf-8") as f:
         reader = csv.DictReader(f)
         for row in reader:
             try:
-                y_true.append(float(row["true"]))
-                y_pred.append(float(row[pred_col]))
-            except (ValueError, KeyError):
+                true, pred = float(row["true"]), float(row[pred_col])
+            except (ValueError, KeyError, TypeError):
                 # Skip rows with missing / invalid numbers
                 continue
+            y_true.append(true)
+            y_pred.append(pred)
+            # Runs with the cascade or dedup record which stage answered each image
+            if row.get("source"):
+                t, p = by_source.setdefault(row["source"], ([], []))
+                t.append(true)
+                p.append(pred)
 
     if not y_true:
         print(" No valid rows found - check your CSV content.")
@@ -52,6 +73,14 @@ def calculate_metrics(csv_path: str) -> None:
     print(f"RMSE : {rmse:.4f}")
     print(f"MAE  : {mae:.4f}")
 
+    if by_source:
+        print("\nBy source")
+        for name, (t, p) in sorted(by_source.items()):
+            print(
+                f"{name:<8} n={len(t):<5} R² {r2_score(t, p):.4f}  RMSE {math.sqrt(mean_squared_error(t, p)):.4f}  "
+                f"MAE {mean_absolute_error(t, p):.4f}"
+            )
+
 if __name__ == "__main__":
     if len(sys.argv) != 2:
         print(
@@ -1,45 +1,27 @@
-import os
-import re
 import base64
 import time
 import csv
+import sys
 from datetime import datetime
 from pathlib import Path
 
-from openai import OpenAI
-from dotenv import load_dotenv
-
-load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
-if api_key is None:
-    raise ValueError("OPENAI_API_KEY not found in environment.")
-client = OpenAI(api_key=api_key)
-
 this_dir = Path(__file__).parent
+sys.path.insert(0, str(this_dir.parent / "3.vlm_processing"))
+from ki67_core import MODEL, extract_cell_counts_and_index, get_client
+from stratified_sampling import StratifiedSampler, load_annotations
+
 with (this_dir / "../3.vlm_processing/system_prompt.txt").open(encoding="utf-8") as f:
     SYSTEM_PROMPT = f.read()
 with (this_dir / "../3.vlm_processing/user_prompt.txt").open(encoding="utf-8") as f:
     USER_PROMPT = f.read()
 
-def extract_cell_counts_and_index(text: str) -> tuple[int, int, float]:
-    pos = int(re.search(r"Immunopositive cells?:\s*(\d+)", text, re.I).group(1)) if re.search(r"Immunopositive cells?:\s*(\d+)", text, re.I) else 0
-    neg = int(re.search(r"Immunonegative cells?:\s*(\d+)", text, re.I).group(1)) if re.search(r"Immunonegative cells?:\s*(\d+)", text, re.I) else 0
-    m = re.search(r"Ki[\s-]?67[^%]*?([0-9]+(?:\.[0-9]+)?)\s*%", text, re.I | re.S)
-    if m:
-        ki = float(m.group(1))
-    else:
-        p = re.findall(r"([0-9]+(?:\.[0-9]+)?)\s*%", text)
-        ki = float(p[-1]) if p else 0.0
-    return pos, neg, ki
-
-
 def predict_with_gpt(img_path: Path):
     start = time.time()
     img_b64 = base64.b64encode(img_path.read_bytes()).decode()
     mime = "jpeg" if img_path.suffix.lower() in {'.jpg', '.jpeg'} else "png"
 
-    r = client.chat.completions.create(
-        model="gpt-4.1-mini-2025-04-14",
+    r = get_client().chat.completions.create(
+        model=MODEL,
         messages=[
             {"role": "system", "content": SYSTEM_PROMPT},
             {
@@ -70,11 +52,9 @@ def analyze_10_samples(dataset: Path, out_parent: Path, n: int = 10) -> None:
     csv_path = output_dir / "ki67_10_samples_analysis.csv"
     resp_path = output_dir / "ki67_10_samples_responses.txt"
 
-    images = [
-        p for p in sorted(dataset.iterdir())
-        if p.suffix.lower() in {".jpg", ".jpeg", ".png"}
-        and (dataset / f"{p.stem}.json").is_file()
-    ][:n]
+    # Spread over Ki-67 bins and cell densities in proportion to the dataset, not the first n files
+    all_images, true, cells = load_annotations(dataset)
+    images = [all_images[i] for i in sorted(StratifiedSampler(true, cells).draw(n))]
 
     if not images:
         print("No images found.")
@@ -86,7 +66,7 @@ def analyze_10_samples(dataset: Path, out_parent: Path, n: int = 10) -> None:
         writer = csv.writer(csvf)
         writer.writerow([
             "image", "input_tokens", "output_tokens", "total_tokens",
-            "ki67_index", "immunopositive_cells", "immunonegative_cells"
+            "ki67_index", "immunopositive_cells", "immunonegative_cells", "model"
         ])
 
         for idx, img in enumerate(images, 1):
@@ -94,7 +74,7 @@ def analyze_10_samples(dataset: Path, out_parent: Path, n: int = 10) -> None:
             try:
                 pos, neg, ki, full, in_tok, out_tok, tot_tok, elapsed = predict_with_gpt(img)
 
-                writer.writerow([img.name, in_tok, out_tok, tot_tok, f"{ki:.2f}", pos, neg])
+                writer.writerow([img.name, in_tok, out_tok, tot_tok, f"{ki:.2f}", pos, neg, MODEL])
 
                 respf.write(f"\n===== {img.name} =====\n")
                 respf.write(f"Time: {elapsed:.2f}s | Tokens: {tot_tok}\n")
@@ -116,8 +96,6 @@ def analyze_10_samples(dataset: Path, out_parent: Path, n: int = 10) -> None:
         print(f"Results saved in     : {output_dir}")
 
 if __name__ == "__main__":
-    import sys
-
     if len(sys.argv) != 3:
         print(
             "Usage:\n"
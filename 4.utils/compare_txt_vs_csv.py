@@ -1,8 +1,9 @@
 import csv
-import re
 import sys
 from pathlib import Path
 
+from response_archive import ResponseArchive
+
 def read_images_from_csv(csv_path: Path) -> set[str]:
     images = set()
     with csv_path.open(newline="", encoding="utf-8") as f:
@@ -14,15 +15,8 @@ def read_images_from_csv(csv_path: Path) -> set[str]:
     return images
 
 def read_images_from_txt(txt_path: Path) -> set[str]:
-    images = set()
-    # accepts .jpg, .jpeg, .png inside ===== filename ===== lines
-    pattern = re.compile(r"^=+\s*(.+?\.(?:jpg|jpeg|png))\s*=+$", re.I)
-    with txt_path.open(encoding="utf-8") as f:
-        for line in f:
-            m = pattern.match(line.strip())
-            if m:
-                images.add(m.group(1).strip())
-    return images
+    # headers come from the cached offset index, so re-checks do not rescan the archive
+    return set(ResponseArchive(txt_path).images())
 
 def compare(csv_path: str, txt_path: str) -> None:
     csv_p = Path(csv_path).resolve()
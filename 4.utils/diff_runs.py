@@ -0,0 +1,234 @@
+import csv
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Clinical Ki-67 categories: low (≤5%), intermediate (6-29%), high (≥30%)
+LOW_MAX, HIGH_MIN = 5, 30
+BIN_NAMES = ("≤5", "6-29", "≥30")
+TOP = int(os.getenv("KI67_DIFF_TOP", "10"))
+CHANGE_MIN = 1.0  # |error| changes below this many points count as unchanged
+BOOTSTRAP = 2000
+BOOTSTRAP_MAX = 20_000  # images; beyond this the MAE-change interval uses the normal approximation
+
+def resolve(paths: list[str]) -> list[Path]:
+    csvs = []
+    for p in map(Path, paths):
+        if p.is_dir():
+            p = p / "ki67_results.csv"
+        if not p.is_file():
+            sys.exit(f"Results CSV not found: {p}")
+        csvs.append(p)
+    return csvs
+
+def labels_for(csvs: list[Path]) -> list[str]:
+    """Shortest trailing parts of each CSV's folder that tell the runs apart."""
+    parts = [c.resolve().parent.parts for c in csvs]
+    for k in range(1, max(map(len, parts)) + 1):
+        labels = ["/".join(p[-k:]) for p in parts]
+        if len(set(labels)) == len(labels):
+            return labels
+    return [str(c) for c in csvs]
+
+def load(path: Path) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """(image, true, predicted) arrays; rows that do not parse are skipped and, for images
+    listed twice (resumed runs), the last row wins."""
+    images, true, pred = [], [], []
+    with path.open(newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = next(reader, [])
+        pred_col = next((c for c in ("predicted", "predict", "pred") if c in header), None)
+        if pred_col is None or "true" not in header or "image" not in header:
+            sys.exit(f"{path}: need an 'image', a 'true' and a 'predicted' column (found {header}).")
+        i_col, t_col, p_col = header.index("image"), header.index("true"), header.index(pred_col)
+        for row in reader:
+            try:
+                t, p = float(row[t_col]), float(row[p_col])
+            except (IndexError, ValueError):
+                continue
+            images.append(row[i_col])
+            true.append(t)
+            pred.append(p)
+    images = np.array(images)
+    _, last = np.unique(images[::-1], return_index=True)
+    keep = np.sort(len(images) - 1 - last)
+    return images[keep], np.array(true)[keep], np.array(pred)[keep]
+
+def join(runs: list[tuple[np.ndarray, np.ndarray, np.ndarray]]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Images present in every run, their true values (from the first run) and a
+    (runs x images) matrix of predictions."""
+    common = runs[0][0]
+    for images, _, _ in runs[1:]:
+        common = np.intersect1d(common, images)
+    if len(common) == 0:
+        return common, np.empty(0), np.empty((len(runs), 0))
+    preds = np.empty((len(runs), len(common)))
+    true = None
+    for i, (images, t, p) in enumerate(runs):
+        order = np.argsort(images)
+        idx = order[np.searchsorted(images, common, sorter=order)]
+        preds[i] = p[idx]
+        if true is None:
+            true = t[idx]
+        else:
+            mismatched = int(np.count_nonzero(np.abs(t[idx] - true) > 0.01))
+            if mismatched:
+                print(f"Warning: run {i + 1} has different true values for {mismatched} images; using run 1's.")
+    # Natural order for numbered tiles (2.jpg before 10.jpg)
+    stems = np.char.partition(common, ".")[:, 0]
+    order = np.lexsort((common, np.char.zfill(stems, 12)))
+    return common[order], true[order], preds[:, order]
+
+def bins(values: np.ndarray) -> np.ndarray:
+    """0, 1 or 2 for low, intermediate and high; values between 5 and 6 count as intermediate."""
+    return (values > LOW_MAX).astype(int) + (values >= HIGH_MIN)
+
+def summary(true: np.ndarray, pred: np.ndarray) -> dict:
+    err = pred - true
+    ss_tot = np.sum((true - true.mean()) ** 2)
+    return {
+        "MAE": np.mean(np.abs(err)),
+        "RMSE": np.sqrt(np.mean(err ** 2)),
+        "bias": np.mean(err),
+        "R²": 1 - np.sum(err ** 2) / ss_tot if ss_tot else float("nan"),
+        "bin acc": np.mean(bins(true) == bins(pred)),
+    }
+
+def kappa(a: np.ndarray, b: np.ndarray) -> float:
+    """Cohen's kappa of two bin assignments."""
+    m = np.zeros((len(BIN_NAMES),) * 2)
+    np.add.at(m, (a, b), 1)
+    n = m.sum()
+    observed = np.trace(m) / n
+    expected = (m.sum(0) @ m.sum(1)) / n ** 2
+    return (observed - expected) / (1 - expected) if expected < 1 else 1.0
+
+def print_matrix(a: np.ndarray, b: np.ndarray, rows: str, cols: str) -> None:
+    m = np.zeros((len(BIN_NAMES),) * 2, dtype=int)
+    np.add.at(m, (a, b), 1)
+    corner = f"{rows} \\ {cols}"
+    print(f"  {corner:<22}" + "".join(f"{name:>8}" for name in BIN_NAMES))
+    for name, row in zip(BIN_NAMES, m):
+        print(f"  {name:<22}" + "".join(f"{v:>8}" for v in row))
+    print(f"  agreement {np.trace(m) / m.sum():.1%}, Cohen's kappa {kappa(a, b):.3f}")
+
+def mae_shift_ci(base_err: np.ndarray, err: np.ndarray, seed: int = 0) -> tuple[float, float]:
+    """95% interval of the MAE change: paired bootstrap, or the normal approximation on
+    large joins where both agree and the bootstrap would dominate the run time."""
+    d = np.abs(err) - np.abs(base_err)
+    if len(d) > BOOTSTRAP_MAX:
+        half = 1.96 * d.std(ddof=1) / np.sqrt(len(d))
+        return d.mean() - half, d.mean() + half
+    rng = np.random.default_rng(seed)
+    means = np.empty(BOOTSTRAP)
+    for start in range(0, BOOTSTRAP, 250):
+        idx = rng.integers(0, len(d), size=(min(250, BOOTSTRAP - start), len(d)))
+        means[start : start + len(idx)] = d[idx].mean(axis=1)
+    return tuple(np.percentile(means, [2.5, 97.5]))
+
+def write_deltas(path: Path, images, true, preds, labels) -> None:
+    err = np.abs(preds - true)
+    with path.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(
+            ["image", "true", "true_bin"]
+            + [f"predicted[{l}]" for l in labels]
+            + [f"abs_error[{l}]" for l in labels]
+            + [f"delta_abs_error[{l}]" for l in labels[1:]]
+        )
+        true_bins = np.array(BIN_NAMES)[bins(true)]
+        for j in range(len(images)):
+            writer.writerow(
+                [images[j], f"{true[j]:.2f}", true_bins[j]]
+                + [f"{v:.2f}" for v in preds[:, j]]
+                + [f"{v:.2f}" for v in err[:, j]]
+                + [f"{v:+.2f}" for v in err[1:, j] - err[0, j]]
+            )
+
+def diff_runs(paths: list[str]) -> None:
+    start = time.perf_counter()
+    csvs = resolve(paths)
+    labels = labels_for(csvs)
+    runs = [load(c) for c in csvs]
+    images, true, preds = join(runs)
+
+    print(f"Baseline: [1] {labels[0]} ({len(runs[0][0])} images)")
+    for i, (label, run) in enumerate(zip(labels[1:], runs[1:]), 2):
+        print(f"Run:      [{i}] {label} ({len(run[0])} images)")
+    print(f"Joined on {len(images)} images present in every run")
+    if len(images) == 0:
+        return
+
+    width = max(map(len, labels)) + 5
+    print(f"\n{'run':<{width}} {'MAE':>7} {'RMSE':>7} {'bias':>7} {'R²':>7} {'bin acc':>8}")
+    stats = [summary(true, p) for p in preds]
+    for i, (label, s) in enumerate(zip(labels, stats), 1):
+        print(
+            f"{f'[{i}] {label}':<{width}} {s['MAE']:>7.2f} {s['RMSE']:>7.2f} {s['bias']:>+7.2f} "
+            f"{s['R²']:>7.3f} {s['bin acc']:>8.1%}"
+        )
+
+    base_err = preds[0] - true
+    true_bins = bins(true)
+    for i in range(1, len(preds)):
+        err = preds[i] - true
+        delta = np.abs(err) - np.abs(base_err)
+        lo, hi = mae_shift_ci(base_err, err)
+        s, b = stats[i], stats[0]
+        print(f"\n── [{i + 1}] {labels[i]} vs [1] {labels[0]} " + "─" * 20)
+        print(
+            f"MAE {s['MAE'] - b['MAE']:+.2f} (95% CI {lo:+.2f} to {hi:+.2f}), "
+            f"RMSE {s['RMSE'] - b['RMSE']:+.2f}, bias {s['bias'] - b['bias']:+.2f}, "
+            f"R² {s['R²'] - b['R²']:+.3f}"
+        )
+        better = int(np.count_nonzero(delta <= -CHANGE_MIN))
+        worse = int(np.count_nonzero(delta >= CHANGE_MIN))
+        print(
+            f"Images improved {better}, regressed {worse}, unchanged {len(delta) - better - worse} "
+            f"(|error| change < {CHANGE_MIN:g} pt); mean |Δprediction| {np.mean(np.abs(preds[i] - preds[0])):.2f}"
+        )
+
+        order = np.argsort(delta, kind="stable")
+        for title, picks in (("regressions", order[::-1][:TOP]), ("improvements", order[:TOP])):
+            picks = picks[np.abs(delta[picks]) >= CHANGE_MIN]
+            if not len(picks):
+                continue
+            print(f"\nBiggest {title}:")
+            print(f"  {'image':<16} {'true':>7} {'[1]':>7} {f'[{i + 1}]':>7} {'Δ|err|':>8}")
+            for j in picks:
+                print(f"  {images[j]:<16} {true[j]:>7.2f} {preds[0, j]:>7.2f} {preds[i, j]:>7.2f} {delta[j]:>+8.2f}")
+
+        print("\nBins, baseline vs run:")
+        print_matrix(bins(preds[0]), bins(preds[i]), "[1]", f"[{i + 1}]")
+        print("Bins, truth vs run:")
+        print_matrix(true_bins, bins(preds[i]), "true", f"[{i + 1}]")
+        for k, name in enumerate(BIN_NAMES):
+            in_bin = true_bins == k
+            if in_bin.any():
+                print(
+                    f"  true {name:<5} n={int(in_bin.sum()):<6} MAE {np.mean(np.abs(base_err[in_bin])):.2f} → "
+                    f"{np.mean(np.abs(err[in_bin])):.2f}"
+                )
+
+    out = os.getenv("KI67_DIFF_CSV")
+    if out:
+        write_deltas(Path(out), images, true, preds, labels)
+        print(f"\nPer-image deltas saved to: {out}")
+    print(f"\nDiffed {len(preds)} runs x {len(images)} images in {time.perf_counter() - start:.2f} s")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print(
+            "Usage:\n"
+            "  python 4.utils/diff_runs.py <baseline_results.csv | dir> <results.csv | dir> [...]\n"
+            "Example:\n"
+            "  python 4.utils/diff_runs.py \\\n"
+            "    5.results/gpt-4.1-mini-2025-04-14_results/bcdata \\\n"
+            "    5.results/gpt-4.1-2025-04-14_results/bcdata"
+        )
+        sys.exit(1)
+
+    diff_runs(sys.argv[1:])
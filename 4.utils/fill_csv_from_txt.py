@@ -1,10 +1,13 @@
 import csv
-import json
-import re
 import sys
 from pathlib import Path
 from typing import List, Dict, Tuple, Set, Optional
 
+from response_archive import ResponseArchive
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "3.vlm_processing"))
+from ki67_core import calculate_true_index, find_predicted_index
+
 def read_existing_csv(csv_path: Path) -> Tuple[List[Dict[str, str]], Set[str]]:
     """Devuelve todas las filas existentes y un set con las imágenes ya presentes."""
     if not csv_path.is_file():
@@ -20,47 +23,16 @@ def read_existing_csv(csv_path: Path) -> Tuple[List[Dict[str, str]], Set[str]]:
                 images.add(image)
     return records, images
 
-def read_llm_txt(txt_path: Path) -> Dict[str, str]:
+def read_llm_txt(txt_path: Path) -> ResponseArchive:
     """
-    Parsea llm_responses.txt y devuelve un dict:
-        {imagen.jpg: bloque_de_respuesta_completo}
+    Abre llm_responses.txt (o .gz/.bz2/.xz) como archivo indexado:
+        {imagen.jpg: bloque_de_respuesta_completo}, leído bajo demanda
     """
-    blocks: Dict[str, str] = {}
-    current, content = None, []
-    re_image = re.compile(r"([^\s]+?\.(?:jpg|jpeg|png))", re.I)
-
-    with txt_path.open(encoding="utf-8") as f:
-        for line in f:
-            if line.startswith("====="):
-                if current and content:
-                    blocks[current] = "\n".join(content).strip()
-                content = []
-                m = re_image.search(line)
-                current = m.group(1).strip() if m else None
-            else:
-                content.append(line.rstrip())
-
-        if current and content:
-            blocks[current] = "\n".join(content).strip()
-
-    return blocks
-
-_KI67_RE = re.compile(r"Ki[\s-]?67[^%]*?([0-9]+(?:\.[0-9]+)?)\s*%", flags=re.I | re.S)
+    return ResponseArchive(txt_path)
 
 def extract_index(text: str) -> Optional[float]:
     """Devuelve el primer porcentaje Ki-67 encontrado en el texto, o None."""
-    m = _KI67_RE.search(text)
-    return float(m.group(1)) if m else None
-
-
-def calculate_true_index(json_path: Path) -> float:
-    """Calcula Ki-67 real a partir del JSON de anotaciones."""
-    with json_path.open() as f:
-        data = json.load(f)
-    pos = sum(1 for c in data if c.get("label_id") == 1)
-    neg = sum(1 for c in data if c.get("label_id") == 2)
-    total = pos + neg
-    return round((pos / total) * 100, 2) if total else 0.0
+    return find_predicted_index(text, fallback=False)
 
 def update_csv(csv_path: str, txt_path: str, json_folder: str) -> None:
     csv_path = Path(csv_path).resolve()
@@ -81,9 +53,11 @@ def update_csv(csv_path: str, txt_path: str, json_folder: str) -> None:
 
     new_rows: List[Dict[str, str]] = []
 
-    for image, response_text in llm_responses.items():
-        if image in images_in_csv:
-            continue  # ya registrada
+    # Una sola pasada por el archivo, aunque esté comprimido
+    missing = [image for image in llm_responses.images() if image not in images_in_csv]
+    responses = dict(llm_responses.get_many(missing))
+    for image in missing:
+        response_text = responses[image]
 
         predicted = extract_index(response_text)
         if predicted is None:
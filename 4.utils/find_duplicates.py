@@ -0,0 +1,82 @@
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "3.vlm_processing"))
+from image_hash import DEFAULT_RADIUS, HashIndex, hamming
+from ki67_core import IMAGE_EXTENSIONS
+
+def find_duplicates(folders: list[str], radius: int = DEFAULT_RADIUS) -> None:
+    dirs = [Path(f).resolve() for f in folders]
+    for d in dirs:
+        if not d.is_dir():
+            sys.exit(f"Folder not found: {d}")
+
+    # Hash every image into the shared index, so the runners can match against it
+    index = HashIndex.from_env(run="find_duplicates")
+    images, hashes = [], []
+    start, computed = time.perf_counter(), 0
+    for d in dirs:
+        for p in sorted(d.iterdir()):
+            if p.suffix.lower() not in IMAGE_EXTENSIONS:
+                continue
+            h = index.hashes_for(p)
+            if p not in index:
+                index.add(p, *h)
+                computed += 1
+            images.append(p)
+            hashes.append(h)
+    elapsed = time.perf_counter() - start
+    if not images:
+        print("No images found.")
+        return
+
+    ph = np.array([h[0] for h in hashes], dtype=np.uint64)
+    dh = np.array([h[1] for h in hashes], dtype=np.uint64)
+
+    # Each image joins the group of the first earlier image within the radius
+    group = list(range(len(images)))
+    for i in range(1, len(images)):
+        dist = np.maximum(hamming(ph[:i], int(ph[i])), hamming(dh[:i], int(dh[i])))
+        near = np.flatnonzero(dist <= radius)
+        if near.size:
+            group[i] = group[int(near[0])]
+
+    members: dict[int, list[int]] = {}
+    for i, g in enumerate(group):
+        members.setdefault(g, []).append(i)
+
+    clusters = [m for m in members.values() if len(m) > 1]
+    for m in clusters:
+        first = images[m[0]]
+        print(f"{first}")
+        for i in m[1:]:
+            d = max(int(hamming(ph[i : i + 1], int(ph[m[0]]))[0]), int(hamming(dh[i : i + 1], int(dh[m[0]]))[0]))
+            print(f"  = {images[i]}  (distance {d})")
+
+    print("\nSUMMARY")
+    print(f"Images               : {len(images)} ({computed} newly hashed, {elapsed:.2f} s)")
+    print(f"Duplicate groups     : {len(clusters)}")
+    for d in dirs:
+        in_dir = [i for i, p in enumerate(images) if p.parent == d]
+        dupes = sum(1 for i in in_dir if group[i] != i)
+        if in_dir:
+            print(f"Dedup ratio          : {dupes}/{len(in_dir)} ({dupes / len(in_dir):.1%})  {d}")
+    total = sum(1 for i, g in enumerate(group) if g != i)
+    print(f"Dedup ratio (all)    : {total}/{len(images)} ({total / len(images):.1%}) VLM calls avoidable")
+    print(f"Index                : {index.path} ({len(index)} images)")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(
+            "Usage:\n"
+            "  python 4.utils/find_duplicates.py <image_folder> [<image_folder> ...]\n"
+            "Example:\n"
+            "  python 4.utils/find_duplicates.py 1.data_access/data_sample/3.data_processed"
+        )
+        sys.exit(1)
+
+    find_duplicates(sys.argv[1:], int(os.getenv("KI67_DEDUP_RADIUS", DEFAULT_RADIUS)))
@@ -0,0 +1,103 @@
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import cv2
+import h5py
+import numpy as np
+from PIL import Image
+
+TILE_SIZE = 640
+# Colours (RGB) sampled from the BCData tiles: background, haematoxylin (negative), DAB (positive)
+BACKGROUND = (226, 218, 226)
+HEMATOXYLIN = (105, 100, 160)
+DAB = (125, 80, 45)
+# Marker the mock API reads back, so its answers can track the ground truth
+COMMENT_PREFIX = "ki67-synthetic"
+
+# Luminance noise drawn once per process; each tile adds a randomly placed window of it
+_NOISE = np.repeat(
+    np.round(np.random.default_rng(0).standard_normal((2 * TILE_SIZE, 2 * TILE_SIZE, 1)) * 4).astype(np.int16), 3, axis=2
+)
+
+def render_tile(rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """RGB tile with (x, y) centres of its positive and negative nuclei.
+
+    Cell totals (40-260) and the positive fraction (Beta(2, 2)) follow the spread of the
+    sample annotations.
+    """
+    total = int(rng.integers(40, 261))
+    n_pos = int(round(total * rng.beta(2, 2)))
+    centres = rng.integers(12, TILE_SIZE - 12, size=(total, 2))
+    img = np.empty((TILE_SIZE, TILE_SIZE, 3), np.uint8)
+    img[:] = BACKGROUND
+
+    base = np.where(np.arange(total)[:, None] < n_pos, DAB, HEMATOXYLIN)
+    colours = np.clip(base + rng.integers(-25, 26, size=(total, 1)), 0, 255).tolist()
+    axes = np.column_stack([rng.integers(7, 13, total), rng.integers(6, 11, total)]).tolist()
+    angles = rng.uniform(0, 180, total).tolist()
+    for (x, y), colour, ax, angle in zip(centres.tolist(), colours, axes, angles):
+        cv2.ellipse(img, (x, y), tuple(ax), angle, 0, 360, colour, -1, cv2.LINE_AA)
+
+    img = cv2.GaussianBlur(img, (0, 0), 1.2)
+    oy, ox = rng.integers(0, TILE_SIZE, size=2)
+    noise = _NOISE[oy : oy + TILE_SIZE, ox : ox + TILE_SIZE]
+    img = np.clip(img.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+    return img, centres[:n_pos], centres[n_pos:]
+
+def write_h5(path: Path, coords: np.ndarray) -> None:
+    with h5py.File(path, "w") as f:
+        f.create_dataset("coordinates", data=coords.astype(np.int64).reshape(-1, 2))
+
+def generate_one(args: tuple[str, int, int]) -> None:
+    root, index, seed = args
+    root = Path(root)
+    rng = np.random.default_rng([seed, index])
+    img, pos, neg = render_tile(rng)
+    name = str(index)
+
+    Image.fromarray(img).save(
+        root / "3.data_processed" / f"{name}.jpg", "JPEG", quality=90,
+        comment=f"{COMMENT_PREFIX} pos={len(pos)} neg={len(neg)}".encode(),
+    )
+    write_h5(root / "2.annotations" / "test" / "positive" / f"{name}.h5", pos)
+    write_h5(root / "2.annotations" / "test" / "negative" / f"{name}.h5", neg)
+    # Same layout as 2.preprocess/2.generate_json.py writes
+    data = [{"x": int(x), "y": int(y), "label_id": 1} for x, y in pos]
+    data += [{"x": int(x), "y": int(y), "label_id": 2} for x, y in neg]
+    with open(root / "3.data_processed" / f"{name}.json", "w") as f:
+        json.dump(data, f, indent=4)
+
+def generate(output_root: str, count: int, workers: int | None = None, seed: int = 0) -> None:
+    root = Path(output_root).resolve()
+    for sub in ("3.data_processed", "2.annotations/test/positive", "2.annotations/test/negative"):
+        (root / sub).mkdir(parents=True, exist_ok=True)
+
+    start = time.perf_counter()
+    jobs = [(str(root), i, seed) for i in range(count)]
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        for done, _ in enumerate(pool.map(generate_one, jobs, chunksize=64), 1):
+            if done % 1000 == 0 or done == count:
+                print(f"[OK] {done}/{count} tiles ({time.perf_counter() - start:.1f} s)")
+
+    print(f"[DONE] Synthetic dataset in {root / '3.data_processed'}")
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (3, 4, 5):
+        print(
+            "Usage:\n"
+            "  python 4.utils/generate_synthetic_dataset.py <output_root> <count> [<workers>] [<seed>]\n"
+            "Example:\n"
+            "  python 4.utils/generate_synthetic_dataset.py synthetic_10k 10000"
+        )
+        sys.exit(1)
+
+    generate(
+        sys.argv[1],
+        int(sys.argv[2]),
+        int(sys.argv[3]) if len(sys.argv) >= 4 else None,
+        int(sys.argv[4]) if len(sys.argv) == 5 else 0,
+    )
@@ -0,0 +1,302 @@
+import base64
+import json
+import os
+import queue
+import random
+import re
+import select
+import signal
+import socket
+import ssl
+import sys
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Written into synthetic tiles by generate_synthetic_dataset.py (JPEG COM segment)
+_SYNTHETIC = re.compile(rb"ki67-synthetic pos=(\d+) neg=(\d+)")
+_DATA_URL = re.compile(r"^data:image/[a-z]+;base64,")
+
+# Behaviour knobs, read once at start-up
+LATENCY = float(os.getenv("KI67_MOCK_LATENCY", "0"))  # median seconds per request (log-normal)
+ERROR_RATE = float(os.getenv("KI67_MOCK_ERROR_RATE", "0"))  # share of requests answered 429
+COUNT_NOISE = float(os.getenv("KI67_MOCK_NOISE", "0.15"))  # relative error on each cell count
+TLS_CERT = os.getenv("KI67_MOCK_TLS_CERT")  # PEM certificate and key: serve HTTPS (HTTP/1.1 and HTTP/2)
+TLS_KEY = os.getenv("KI67_MOCK_TLS_KEY")
+PROMPT_TOKENS = 1400
+H2_WINDOW = 16 * 1024 * 1024
+TOKENS_PER_CHAR = 0.4
+
+
+class MockStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.completions = 0
+        self.errors = 0
+        self.connections = 0
+        self.h2_connections = 0
+
+
+STATS = MockStats()
+
+
+def image_url(messages: list[dict]) -> str:
+    for msg in messages:
+        content = msg.get("content")
+        if not isinstance(content, list):
+            continue
+        for part in content:
+            if part.get("type") == "image_url":
+                return part.get("image_url", {}).get("url", "")
+    return ""
+
+
+def image_counts(url: str) -> tuple[int, int] | None:
+    """Ground-truth (positive, negative) of a synthetic image data URL, if it is one."""
+    m = _DATA_URL.match(url)
+    if m:
+        # The COM segment sits in the JPEG header; decoding the first few KB is enough
+        head = base64.b64decode(url[m.end() : m.end() + 4096])
+        found = _SYNTHETIC.search(head)
+        if found:
+            return int(found.group(1)), int(found.group(2))
+    return None
+
+
+def answer(truth: tuple[int, int] | None, rng: random.Random) -> str:
+    """A completion in the format the real model returns (and the runners' regexes expect)."""
+    if truth is None:
+        pos, neg = rng.randint(5, 120), rng.randint(5, 150)
+    else:
+        pos, neg = (max(0, round(c * rng.gauss(1, COUNT_NOISE))) for c in truth)
+    ki = pos / (pos + neg) * 100 if pos + neg else 0.0
+    return (
+        f"Immunopositive cells: {pos}  \n"
+        f"Immunonegative cells: {neg}  \n"
+        f"Ki-67 Index: ({pos} / ({pos} + {neg})) x 100 = {ki:.2f}%  \n\n"
+        f"Ki-67 Index: {ki:.2f}%"
+    )
+
+
+def completion(body: dict) -> dict:
+    n = int(body.get("n") or 1)
+    max_tokens = body.get("max_tokens") or body.get("max_completion_tokens")
+    seed = body.get("seed")
+    url = image_url(body.get("messages", []))
+    truth = image_counts(url)
+    # Deterministic per (seed, image) at temperature 0, as the real API nearly is
+    if seed is not None and not body.get("temperature"):
+        rng = random.Random(zlib.crc32(url.encode(), seed))
+    else:
+        rng = random.Random()
+
+    choices, completion_tokens = [], 0
+    for i in range(n):
+        text = answer(truth, rng)
+        tokens = max(1, int(len(text) * TOKENS_PER_CHAR))
+        finish = "stop"
+        if max_tokens and tokens > max_tokens:
+            text, tokens, finish = text[: int(max_tokens / TOKENS_PER_CHAR)], max_tokens, "length"
+        completion_tokens += tokens
+        choices.append({
+            "index": i,
+            "message": {"role": "assistant", "content": text},
+            "finish_reason": finish,
+            "logprobs": None,
+        })
+
+    return {
+        "id": f"chatcmpl-mock-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "mock"),
+        "choices": choices,
+        "usage": {
+            "prompt_tokens": PROMPT_TOKENS,
+            "completion_tokens": completion_tokens,
+            "total_tokens": PROMPT_TOKENS + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": 0},
+        },
+    }
+
+
+def handle(method: str, path: str, body: bytes) -> tuple[int, dict]:
+    """(status, JSON payload) for one request, shared by the HTTP/1.1 and HTTP/2 paths."""
+    if method == "GET":
+        # client.models.retrieve(), used by the prediction service warm-up
+        if path.startswith("/v1/models/") or path.startswith("/models/"):
+            return 200, {"id": path.rsplit("/", 1)[-1], "object": "model", "created": 0, "owned_by": "mock"}
+        return 404, {"error": {"message": "not found", "type": "invalid_request_error"}}
+
+    if path.rstrip("/") not in ("/v1/chat/completions", "/chat/completions"):
+        return 404, {"error": {"message": "not found", "type": "invalid_request_error"}}
+    if LATENCY > 0:
+        time.sleep(random.lognormvariate(0, 0.3) * LATENCY)
+    with STATS.lock:
+        STATS.requests += 1
+    if ERROR_RATE and random.random() < ERROR_RATE:
+        with STATS.lock:
+            STATS.errors += 1
+        return 429, {"error": {"message": "Rate limit reached (mock)", "type": "rate_limit_error"}}
+    try:
+        payload = completion(json.loads(body))
+    except (ValueError, TypeError) as e:
+        return 400, {"error": {"message": str(e), "type": "invalid_request_error"}}
+    with STATS.lock:
+        STATS.completions += len(payload["choices"])
+    return 200, payload
+
+
+def reply_headers(status: int, body: bytes) -> list[tuple[str, str]]:
+    headers = [("content-type", "application/json"), ("content-length", str(len(body)))]
+    if status == 429:
+        headers.append(("retry-after", "1"))
+    return headers
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+    disable_nagle_algorithm = True  # headers and body go out in separate writes
+
+    def log_message(self, fmt, *args):
+        pass  # 10k+ requests per run; the summary line is printed on exit
+
+    def setup(self):
+        if isinstance(self.request, ssl.SSLSocket):
+            # Handshake here, on the connection's thread, not in the accept loop
+            self.request.do_handshake()
+        super().setup()
+
+    def handle(self):
+        with STATS.lock:
+            STATS.connections += 1
+        if isinstance(self.connection, ssl.SSLSocket) and self.connection.selected_alpn_protocol() == "h2":
+            with STATS.lock:
+                STATS.h2_connections += 1
+            serve_h2(self.connection)
+        else:
+            super().handle()
+
+    def _reply(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        for name, value in reply_headers(status, body):
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._reply(*handle("GET", self.path, b""))
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self._reply(*handle("POST", self.path, body))
+
+
+def serve_h2(sock: ssl.SSLSocket) -> None:
+    """One HTTP/2 connection: frames are read and written on this thread only (an SSL socket
+    must not be used from two threads at once); requests run on a small pool and hand their
+    replies back through a queue."""
+    import h2.config
+    import h2.connection
+    import h2.events
+    import h2.settings
+
+    conn = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False, header_encoding="utf-8"))
+    conn.local_settings = h2.settings.Settings(
+        client=False,
+        initial_values={
+            # httpx sends one request at a time until the server announces its stream limit
+            h2.settings.SettingCodes.MAX_CONCURRENT_STREAMS: 256,
+            h2.settings.SettingCodes.INITIAL_WINDOW_SIZE: H2_WINDOW,
+        },
+    )
+    conn.initiate_connection()
+    # Large windows: image uploads would otherwise stall on WINDOW_UPDATE round trips
+    conn.increment_flow_control_window(H2_WINDOW - 65535)
+    sock.sendall(conn.data_to_send())
+    wake_r, wake_w = socket.socketpair()
+    replies: queue.Queue = queue.Queue()
+    streams: dict[int, list] = {}
+
+    def work(stream_id: int, method: str, path: str, body: bytes) -> None:
+        replies.put((stream_id, *handle(method, path, body)))
+        wake_w.send(b"x")
+
+    with ThreadPoolExecutor(max_workers=64) as pool:
+        try:
+            while True:
+                if not sock.pending():
+                    readable, _, _ = select.select([sock, wake_r], [], [])
+                else:
+                    readable = [sock]
+                if wake_r in readable:
+                    wake_r.recv(4096)
+                while not replies.empty():
+                    stream_id, status, payload = replies.get()
+                    body = json.dumps(payload).encode()
+                    conn.send_headers(stream_id, [(":status", str(status)), *reply_headers(status, body)])
+                    conn.send_data(stream_id, body, end_stream=True)
+                if sock in readable:
+                    data = sock.recv(65535)
+                    if not data:
+                        break
+                    for event in conn.receive_data(data):
+                        if isinstance(event, h2.events.RequestReceived):
+                            streams[event.stream_id] = [dict(event.headers), bytearray()]
+                        elif isinstance(event, h2.events.DataReceived):
+                            streams[event.stream_id][1] += event.data
+                            conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                        elif isinstance(event, h2.events.StreamEnded):
+                            headers, body = streams.pop(event.stream_id)
+                            pool.submit(work, event.stream_id, headers[":method"], headers[":path"], bytes(body))
+                        elif isinstance(event, h2.events.ConnectionTerminated):
+                            return
+                sock.sendall(conn.data_to_send())
+        except (OSError, ssl.SSLError):
+            pass
+        finally:
+            wake_r.close()
+            wake_w.close()
+
+
+def serve(port: int) -> None:
+    server = ThreadingHTTPServer(("127.0.0.1", port), MockHandler)
+    server.daemon_threads = True
+    scheme = "http"
+    if TLS_CERT:
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(TLS_CERT, TLS_KEY)
+        context.set_alpn_protocols(["h2", "http/1.1"])
+        server.socket = context.wrap_socket(server.socket, server_side=True, do_handshake_on_connect=False)
+        scheme = "https"
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f"Mock OpenAI API on {scheme}://127.0.0.1:{port}/v1 (latency {LATENCY}s, 429 rate {ERROR_RATE})")
+    print(f"Point the runners at it with OPENAI_BASE_URL={scheme}://127.0.0.1:{port}/v1 OPENAI_API_KEY=mock")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(
+            f"\n{STATS.requests} requests, {STATS.completions} completions, {STATS.errors} simulated 429s, "
+            f"{STATS.connections} connections ({STATS.h2_connections} HTTP/2)"
+        )
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2:
+        print(
+            "Usage:\n"
+            "  python 4.utils/mock_openai_server.py [<port>]\n"
+            "Example:\n"
+            "  python 4.utils/mock_openai_server.py 8780"
+        )
+        sys.exit(1)
+
+    serve(int(sys.argv[1]) if len(sys.argv) == 2 else 8780)
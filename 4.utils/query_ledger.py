@@ -0,0 +1,85 @@
+import csv
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+def find_ledgers(paths: list[str]) -> list[Path]:
+    ledgers = []
+    for p in map(Path, paths):
+        if p.is_dir():
+            ledgers.extend(sorted(p.rglob("ki67_ledger.csv")))
+        elif p.is_file():
+            ledgers.append(p)
+        else:
+            print(f"Not found: {p}")
+    return ledgers
+
+def read_mae(results_csv: Path) -> tuple[float, float] | None:
+    """(MAE, baseline MAE of always predicting the mean true value) for a results CSV."""
+    if not results_csv.is_file():
+        return None
+    y_true, y_pred = [], []
+    with results_csv.open(newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            try:
+                y_true.append(float(row["true"]))
+                y_pred.append(float(row["predicted"]))
+            except (KeyError, ValueError):
+                continue
+    if not y_true:
+        return None
+    mean_true = sum(y_true) / len(y_true)
+    mae = sum(abs(p - t) for t, p in zip(y_true, y_pred)) / len(y_true)
+    baseline = sum(abs(t - mean_true) for t in y_true) / len(y_true)
+    return mae, baseline
+
+def query(paths: list[str]) -> None:
+    ledgers = find_ledgers(paths)
+    if not ledgers:
+        print("No ledger files found.")
+        return
+
+    print(
+        f"{'run':<34} {'model':<26} {'req':>5} {'images':>6} {'tokens':>9} "
+        f"{'cached':>7} {'cost $':>9} {'$/image':>9} {'MAE':>6} {'$/MAE pt':>9}"
+    )
+    grand_cost = 0.0
+    for ledger in ledgers:
+        groups = defaultdict(lambda: {"req": 0, "images": set(), "tokens": 0, "cached": 0, "cost": 0.0})
+        with ledger.open(newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                g = groups[(row["run"], row["model"])]
+                g["req"] += 1
+                g["images"].add(row["image"])
+                g["tokens"] += int(row["total_tokens"])
+                g["cached"] += int(row["cached_tokens"] or 0)
+                g["cost"] += float(row["cost_usd"])
+
+        mae = read_mae(ledger.parent / "ki67_results.csv")
+        for (run, model), g in sorted(groups.items()):
+            per_image = g["cost"] / len(g["images"])
+            mae_txt, per_point = "-", "-"
+            if mae:
+                # Dollars per image for each MAE point gained over the constant-mean predictor
+                mae_txt = f"{mae[0]:.2f}"
+                gain = mae[1] - mae[0]
+                per_point = f"{per_image / gain:.6f}" if gain > 0 else "n/a"
+            print(
+                f"{run:<34} {model:<26} {g['req']:>5} {len(g['images']):>6} {g['tokens']:>9} "
+                f"{g['cached']:>7} {g['cost']:>9.4f} {per_image:>9.6f} {mae_txt:>6} {per_point:>9}"
+            )
+            grand_cost += g["cost"]
+
+    print(f"\nTotal cost: ${grand_cost:.4f}")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print(
+            "Usage:\n"
+            "  python 4.utils/query_ledger.py <ki67_ledger.csv | results_dir> [...]\n"
+            "Example:\n"
+            "  python 4.utils/query_ledger.py 5.results"
+        )
+        sys.exit(1)
+
+    query(sys.argv[1:])
@@ -0,0 +1,143 @@
+import csv
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from response_archive import ResponseArchive
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "3.vlm_processing"))
+from ki67_core import calculate_true_index, parse_response
+
+BATCH_SIZE = 256
+ARCHIVE_NAMES = ("llm_responses.txt", "llm_responses.txt.gz", "llm_responses.txt.bz2", "llm_responses.txt.xz")
+
+def find_archives(results_root: Path) -> list[Path]:
+    return sorted(p for p in results_root.rglob("llm_responses.txt*") if p.name in ARCHIVE_NAMES)
+
+def parse_batch(batch: list[tuple[str, str]]) -> list[tuple[str, float | None, int | None, int | None]]:
+    """Runs in the worker processes: (image, ki67, positive, negative) per response."""
+    out = []
+    for image, text in batch:
+        pos, neg, ki = parse_response(text)
+        out.append((image, ki, pos, neg))
+    return out
+
+def batches(archive: ResponseArchive):
+    batch = []
+    for item in archive:
+        batch.append(item)
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def map_bounded(pool: ProcessPoolExecutor, fn, items, window: int):
+    """``pool.map`` that reads ``items`` lazily, with at most ``window`` calls in flight; results in order.
+
+    ``Executor.map`` submits every item up front, which would hold a whole archive in memory.
+    """
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def read_results(csv_path: Path) -> dict[str, dict[str, str]]:
+    if not csv_path.is_file():
+        return {}
+    with csv_path.open(newline="", encoding="utf-8") as f:
+        return {row["image"]: row for row in csv.DictReader(f) if row.get("image")}
+
+def rescore_archive(archive_path: Path, json_folder: Path | None, pool: ProcessPoolExecutor, window: int) -> None:
+    run_dir = archive_path.parent
+    old = read_results(run_dir / "ki67_results.csv")
+
+    # Later blocks for the same image win, as in the archive index
+    parsed: dict[str, tuple[float | None, int | None, int | None]] = {}
+    for result in map_bounded(pool, parse_batch, batches(ResponseArchive(archive_path)), window):
+        for image, ki, pos, neg in result:
+            parsed[image] = (ki, pos, neg)
+
+    rescored_path = run_dir / "ki67_results_rescored.csv"
+    diff_path = run_dir / "ki67_rescore_diff.csv"
+    counts = {"unchanged": 0, "changed": 0, "new": 0, "unparsed": 0, "no_truth": 0}
+
+    with rescored_path.open("w", newline="", encoding="utf-8") as rf, diff_path.open("w", newline="", encoding="utf-8") as df:
+        rescored = csv.writer(rf)
+        diff = csv.writer(df)
+        rescored.writerow(["image", "predicted", "true"])
+        diff.writerow(["image", "old_predicted", "new_predicted", "delta", "positive", "negative", "status"])
+
+        for image, (ki, pos, neg) in parsed.items():
+            old_row = old.get(image)
+            old_pred = old_row.get("predicted", "") if old_row else ""
+
+            if ki is None:
+                counts["unparsed"] += 1
+                diff.writerow([image, old_pred, "", "", pos, neg, "unparsed"])
+                continue
+
+            json_path = json_folder / f"{Path(image).stem}.json" if json_folder else None
+            if json_path and json_path.is_file():
+                true = calculate_true_index(json_path)
+            elif old_row and old_row.get("true"):
+                true = float(old_row["true"])
+            else:
+                counts["no_truth"] += 1
+                diff.writerow([image, old_pred, f"{ki:.2f}", "", pos, neg, "no_truth"])
+                continue
+
+            rescored.writerow([image, f"{ki:.2f}", f"{true:.2f}"])
+            if not old_pred:
+                status, delta = "new", ""
+            else:
+                d = ki - float(old_pred)
+                status, delta = ("unchanged" if abs(d) < 0.005 else "changed"), f"{d:.2f}"
+            counts[status] += 1
+            diff.writerow([image, old_pred, f"{ki:.2f}", delta, pos, neg, status])
+
+    summary = ", ".join(f"{k} {v}" for k, v in counts.items() if v)
+    print(f"{run_dir}: {len(parsed)} responses ({summary})")
+
+def rescore(results_root: str, json_folder: str | None = None, workers: int | None = None) -> None:
+    root = Path(results_root).resolve()
+    if not root.is_dir():
+        sys.exit(f"Results folder not found: {root}")
+    json_dir = Path(json_folder).resolve() if json_folder else None
+    if json_dir and not json_dir.is_dir():
+        sys.exit(f"JSON folder not found: {json_dir}")
+
+    archives = find_archives(root)
+    if not archives:
+        print("No llm_responses archives found.")
+        return
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for archive in archives:
+            # Two batches per worker keep every process busy while the next batch is read
+            rescore_archive(archive, json_dir, pool, window=2 * workers)
+
+    print("\nWritten next to each archive: ki67_results_rescored.csv and ki67_rescore_diff.csv")
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3, 4):
+        print(
+            "Usage:\n"
+            "  python 4.utils/rescore_responses.py <results_root> [<json_folder>] [<workers>]\n"
+            "Example:\n"
+            "  python 4.utils/rescore_responses.py 5.results "
+            "1.data_access/data_sample/3.data_processed"
+        )
+        sys.exit(1)
+
+    rescore(
+        sys.argv[1],
+        sys.argv[2] if len(sys.argv) >= 3 else None,
+        int(sys.argv[3]) if len(sys.argv) == 4 else None,
+    )
@@ -0,0 +1,208 @@
+import bz2
+import gzip
+import hashlib
+import json
+import lzma
+import mmap
+import os
+import re
+import sys
+from pathlib import Path
+from typing import Iterator
+
+# Any line starting with ===== closes the current block; it opens a new one when it names an image.
+# The name runs from the first non-blank after the ='s up to the extension, spaces included.
+_SEPARATOR = re.compile(rb"^=====[^\n]*", re.M)
+_IMAGE = re.compile(rb"^=+\s*([^=\n]*?\.(?:jpg|jpeg|png))", re.I)
+_TEXT = re.compile(rb"\S")  # blocks without any are skipped, as fill_csv_from_txt always did
+
+_INDEX_VERSION = 2  # bumped whenever the header or block rules change, so old caches are rebuilt
+
+_OPENERS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+
+
+def _clean(raw: bytes) -> str:
+    """Block text normalized as fill_csv_from_txt always did: right-stripped lines, outer blank lines dropped."""
+    return "\n".join(line.rstrip() for line in raw.decode("utf-8").splitlines()).strip()
+
+
+class ResponseArchive:
+    """Random and streaming access to an llm_responses.txt archive (plain, .gz, .bz2 or .xz).
+
+    An offset index of the ``===== image =====`` headers is cached next to the archive
+    (``<archive>.idx.json``) and reused while the archive's size and mtime are unchanged.
+    When the archive only grew (runs append to it), just the new tail is scanned.
+    Plain archives are read through mmap; compressed ones are seeked in the decompressed
+    stream, which is sequential, so bulk reads go through ``get_many`` or iteration there.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.index_path = self.path.with_name(self.path.name + ".idx.json")
+        self.compressed = self.path.suffix.lower() in _OPENERS
+        self._index: dict[str, tuple[int, int]] | None = None
+
+    # ── Index ─────────────────────────────────────────────────────────────────
+    @property
+    def index(self) -> dict[str, tuple[int, int]]:
+        """{image: (start, end)} byte offsets of each block body; the last block wins on duplicates."""
+        if self._index is None:
+            self._index = self._load_or_build_index()
+        return self._index
+
+    def _head_digest(self) -> str:
+        with self._open() as f:
+            return hashlib.sha1(f.read(65536)).hexdigest()
+
+    def _load_or_build_index(self) -> dict[str, tuple[int, int]]:
+        st = self.path.stat()
+        entries, resume_from = [], 0
+        if self.index_path.is_file():
+            try:
+                cached = json.loads(self.index_path.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                cached = None
+            if cached and cached.get("version") != _INDEX_VERSION:
+                cached = None
+            if cached and cached["size"] == st.st_size and cached["mtime_ns"] == st.st_mtime_ns:
+                return {name: (start, end) for name, start, end, _ in cached["entries"]}
+            if (
+                cached and not self.compressed and cached["entries"]
+                and cached["size"] < st.st_size and cached["head"] == self._head_digest()
+            ):
+                # Appended archive: rescan from the start of the last (possibly extended) block
+                entries = cached["entries"][:-1]
+                resume_from = cached["entries"][-1][3]
+
+        entries += self._scan(resume_from)
+        try:
+            self.index_path.write_text(
+                json.dumps({
+                    "version": _INDEX_VERSION,
+                    "size": st.st_size,
+                    "mtime_ns": st.st_mtime_ns,
+                    "head": self._head_digest(),
+                    "entries": entries,
+                }),
+                encoding="utf-8",
+            )
+        except OSError:
+            pass  # read-only location: the index is simply rebuilt next time
+        return {name: (start, end) for name, start, end, _ in entries}
+
+    def _scan(self, offset: int) -> list[list]:
+        """[[image, body_start, body_end, header_start], ...] from ``offset`` on, empty blocks left out."""
+        if self.compressed:
+            return self._scan_stream(offset)
+        with self.path.open("rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return []
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                entries, current = [], None
+                for m in _SEPARATOR.finditer(mm, offset):
+                    if current and _TEXT.search(mm, current[1], m.start()):
+                        current[2] = m.start()
+                        entries.append(current)
+                    name = _IMAGE.search(m.group())
+                    current = [name.group(1).decode(), m.end(), None, m.start()] if name else None
+                if current and _TEXT.search(mm, current[1]):
+                    current[2] = len(mm)
+                    entries.append(current)
+                return entries
+
+    def _scan_stream(self, offset: int) -> list[list]:
+        entries, current, pos, text = [], None, offset, False
+        with self._open() as f:
+            f.seek(offset)
+            for line in f:
+                if line.startswith(b"====="):
+                    if current and text:
+                        current[2] = pos
+                        entries.append(current)
+                    name = _IMAGE.search(line)
+                    current = [name.group(1).decode(), pos + len(line), None, pos] if name else None
+                    text = False
+                else:
+                    text = text or bool(line.strip())
+                pos += len(line)
+        if current and text:
+            current[2] = pos
+            entries.append(current)
+        return entries
+
+    # ── Access ────────────────────────────────────────────────────────────────
+    def _open(self):
+        return _OPENERS.get(self.path.suffix.lower(), open)(self.path, "rb")
+
+    def images(self) -> list[str]:
+        return list(self.index)
+
+    def __contains__(self, image: str) -> bool:
+        return image in self.index
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def get(self, image: str) -> str:
+        start, end = self.index[image]
+        if self.compressed:
+            with self._open() as f:
+                f.seek(start)
+                return _clean(f.read(end - start))
+        with self.path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return _clean(mm[start:end])
+
+    def get_many(self, images) -> Iterator[tuple[str, str]]:
+        """(image, response) for each of ``images`` in the archive, last block wins, in file order.
+
+        Compressed archives are decompressed once for the whole set instead of once per ``get``.
+        """
+        spans = sorted((self.index[image], image) for image in set(images) if image in self.index)
+        if not spans:
+            return
+        if not self.compressed:
+            with self.path.open("rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for (start, end), image in spans:
+                    yield image, _clean(mm[start:end])
+            return
+        with self._open() as f:
+            for (start, end), image in spans:
+                f.seek(start)  # forward from the previous block: the stream is never rewound
+                yield image, _clean(f.read(end - start))
+
+    def __iter__(self) -> Iterator[tuple[str, str]]:
+        """Stream (image, response) blocks in file order, one block in memory at a time.
+
+        Duplicated images are yielded every time they appear; use the index for last-wins access.
+        Empty blocks are skipped.
+        """
+        current, content = None, []
+        with self._open() as f:
+            for line in f:
+                if line.startswith(b"====="):
+                    text = _clean(b"".join(content))
+                    if current and text:
+                        yield current, text
+                    name = _IMAGE.search(line)
+                    current, content = (name.group(1).decode() if name else None), []
+                else:
+                    content.append(line)
+        text = _clean(b"".join(content))
+        if current and text:
+            yield current, text
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        print(
+            "Usage:\n"
+            "  python 4.utils/response_archive.py <llm_responses.txt[.gz|.bz2|.xz]> [<image>]\n"
+            "Example:\n"
+            "  python 4.utils/response_archive.py 5.results/4.5/bcdata/llm_responses.txt 8.jpg"
+        )
+        sys.exit(1)
+
+    archive = ResponseArchive(sys.argv[1])
+    if len(sys.argv) == 3:
+        print(archive.get(sys.argv[2]))
+    else:
+        print(f"{len(archive)} responses indexed in {archive.index_path}")
@@ -0,0 +1,60 @@
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "3.vlm_processing"))
+from cv_precount import precount
+from ki67_core import IMAGE_EXTENSIONS, count_true_cells, ki67_index
+
+def score(dataset: str) -> None:
+    folder = Path(dataset).resolve()
+    if not folder.is_dir():
+        sys.exit(f"Dataset folder not found: {folder}")
+
+    images = [
+        p for p in sorted(folder.iterdir())
+        if p.suffix.lower() in IMAGE_EXTENSIONS and (folder / f"{p.stem}.json").is_file()
+    ]
+    if not images:
+        print("No annotated images found.")
+        return
+
+    rows, elapsed = [], 0.0
+    print(f"{'image':<12} {'pos':>5} {'true':>5} {'neg':>5} {'true':>5} {'Ki-67':>7} {'true':>7} {'spread':>7}  confident")
+    for img in images:
+        start = time.perf_counter()
+        r = precount(img)
+        elapsed += time.perf_counter() - start
+        json_path = folder / f"{img.stem}.json"
+        true_pos, true_neg = count_true_cells(json_path)
+        true_ki = ki67_index(true_pos, true_neg)
+        rows.append((r, true_pos, true_neg, true_ki))
+        print(
+            f"{img.name:<12} {r.positive:>5} {true_pos:>5} {r.negative:>5} {true_neg:>5} "
+            f"{r.ki67:>7.2f} {true_ki:>7.2f} {r.spread:>7.2f}  {'yes' if r.confident else 'no'}"
+        )
+
+    def mae(subset, key) -> float:
+        return sum(key(row) for row in subset) / len(subset) if subset else float("nan")
+
+    confident = [row for row in rows if row[0].confident]
+    print("\nSUMMARY")
+    print(f"Images               : {len(rows)}")
+    print(f"Time per image       : {elapsed / len(rows) * 1000:.1f} ms")
+    print(f"MAE positive cells   : {mae(rows, lambda r: abs(r[0].positive - r[1])):.2f}")
+    print(f"MAE negative cells   : {mae(rows, lambda r: abs(r[0].negative - r[2])):.2f}")
+    print(f"MAE Ki-67 (all)      : {mae(rows, lambda r: abs(r[0].ki67 - r[3])):.2f}")
+    print(f"MAE Ki-67 (confident): {mae(confident, lambda r: abs(r[0].ki67 - r[3])):.2f}")
+    print(f"Confident (VLM calls skipped in the cascade): {len(confident)}/{len(rows)}")
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print(
+            "Usage:\n"
+            "  python 4.utils/score_cv_precount.py <processed_dataset>\n"
+            "Example:\n"
+            "  python 4.utils/score_cv_precount.py 1.data_access/data_sample/3.data_processed"
+        )
+        sys.exit(1)
+
+    score(sys.argv[1])
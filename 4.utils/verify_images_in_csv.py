@@ -1,6 +1,6 @@
+import csv
 import sys
 from pathlib import Path
-import pandas as pd
 
 def verify_images_in_csv(image_folder: str, csv_file: str) -> None:
     image_dir = Path(image_folder).resolve()
@@ -17,18 +17,21 @@ def verify_images_in_csv(image_folder: str, csv_file: str) -> None:
     images_in_folder = {p.name for p in image_dir.iterdir() if p.suffix.lower() in extensions}
 
     try:
-        df = pd.read_csv(csv_path, dtype=str)
+        with csv_path.open(newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            columns = reader.fieldnames or []
+
+            # Accept either 'image' or 'imagen' column
+            col = "image" if "image" in columns else ("imagen" if "imagen" in columns else None)
+            if col is None:
+                print("The CSV does not contain a column named 'image' or 'imagen'.")
+                return
+
+            images_in_csv = {row[col] for row in reader if row.get(col)}
     except Exception as e:
         print(f"Error reading CSV: {e}")
         return
 
-    # Accept either 'image' or 'imagen' column
-    col = "image" if "image" in df.columns else ("imagen" if "imagen" in df.columns else None)
-    if col is None:
-        print("The CSV does not contain a column named 'image' or 'imagen'.")
-        return
-
-    images_in_csv = set(df[col].dropna().astype(str))
     missing = images_in_folder - images_in_csv
 
     if missing:
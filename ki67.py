@@ -0,0 +1,85 @@
+"""Single entry point for the Ki-67 VLM evaluation workflow.
+
+Each subcommand runs one of the workflow scripts with the remaining arguments, importing
+nothing until the script is chosen, so offline utilities never load the OpenAI client,
+matplotlib, pandas or scikit-learn unless they need them.
+"""
+import runpy
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+
+# subcommand: (script, description)
+COMMANDS = {
+    "convert": ("2.preprocess/1.convert_images.py", "Convert PNG images to JPG"),
+    "annotate": ("2.preprocess/2.generate_json.py", "Build per-image JSON annotations from .h5 files"),
+    "run": ("3.vlm_processing/1.main_openai.py", "Evaluate the VLM over a processed dataset"),
+    "predict": ("3.vlm_processing/2.ki67_single_image.py", "Predict the Ki-67 index of one image"),
+    "serve": ("3.vlm_processing/3.ki67_server.py", "Start the warm prediction service"),
+    "client": ("3.vlm_processing/4.ki67_client.py", "Send one image to the prediction service"),
+    "sweep": ("3.vlm_processing/5.prompt_sweep.py", "Race prompt variants with early stopping"),
+    "estimate": ("3.vlm_processing/6.active_eval.py", "Estimate full-run metrics from a stratified sample"),
+    "metrics": ("4.utils/calculate_metrics.py", "R², MSE, RMSE and MAE of a results CSV"),
+    "ki": ("4.utils/calculate_ki_from_json.py", "Ki-67 index of one JSON annotation file"),
+    "timing": ("4.utils/calculate_time_average.py", "Average time and tokens over sample images"),
+    "ledger": ("4.utils/query_ledger.py", "Cost per run, model, image and MAE point"),
+    "rescore": ("4.utils/rescore_responses.py", "Re-parse archived responses without API calls"),
+    "cvscore": ("4.utils/score_cv_precount.py", "Score the classical-CV pre-count against annotations"),
+    "dedup": ("4.utils/find_duplicates.py", "Near-duplicate images across dataset folders"),
+    "synth": ("4.utils/generate_synthetic_dataset.py", "Generate a synthetic dataset for scale tests"),
+    "mock": ("4.utils/mock_openai_server.py", "Local OpenAI-compatible mock API"),
+    "plot": ("4.utils/plot_multiple_models.py", "Comparison plot of several results CSVs"),
+    "diff": ("4.utils/diff_runs.py", "Per-image regressions between results CSVs"),
+}
+
+# ki67.py audit <check> ...
+AUDITS = {
+    "duplicates": ("4.utils/check_duplicates_in_csv.py", "Duplicated images in a results CSV"),
+    "range": ("4.utils/check_range_in_csv.py", "Missing image IDs in a results CSV"),
+    "txt": ("4.utils/compare_txt_vs_csv.py", "Responses in llm_responses.txt missing from the CSV"),
+    "images": ("4.utils/verify_images_in_csv.py", "Images in a folder missing from the CSV"),
+    "jsons": ("4.utils/count_jsons.py", "Number of JSON files in a folder"),
+    "fill": ("4.utils/fill_csv_from_txt.py", "Fill missing CSV rows from llm_responses.txt"),
+}
+
+
+def usage() -> None:
+    print("Usage:\n  python ki67.py <command> [<args> ...]\n\nCommands:")
+    for name, (_, desc) in COMMANDS.items():
+        print(f"  {name:<10} {desc}")
+    print(f"  {'audit':<10} Result checks: {', '.join(AUDITS)}")
+    print("\nRun a command without arguments to see its own usage.")
+
+
+def run_script(script: str, args: list[str]) -> None:
+    path = ROOT / script
+    # Scripts import their sibling modules, as when they are run directly
+    sys.path.insert(0, str(path.parent))
+    sys.argv = [script, *args]
+    runpy.run_path(str(path), run_name="__main__")
+
+
+def main(argv: list[str]) -> None:
+    if not argv or argv[0] in {"-h", "--help", "help"}:
+        usage()
+        sys.exit(0 if argv else 1)
+
+    command, args = argv[0], argv[1:]
+    if command == "audit":
+        if not args or args[0] not in AUDITS:
+            print("Usage:\n  python ki67.py audit <check> [<args> ...]\n\nChecks:")
+            for name, (_, desc) in AUDITS.items():
+                print(f"  {name:<10} {desc}")
+            sys.exit(1)
+        run_script(AUDITS[args[0]][0], args[1:])
+    elif command in COMMANDS:
+        run_script(COMMANDS[command][0], args)
+    else:
+        print(f"Unknown command: {command}\n")
+        usage()
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])